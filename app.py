@@ -2,6 +2,7 @@ import streamlit as st
 import json
 import os
 import sys
+import threading
 
 # Prevent Streamlit from watching torch modules
 if hasattr(st, '_is_running_with_streamlit'):
@@ -17,7 +18,11 @@ from transcript import *
 from utils.sentiment_analyzer import MedicalSentimentAnalyzer
 from utils.soap_generator import SOAPNoteGenerator
 from utils.biobert_finetuned import FineTunedBioBERTNER
-from utils.model_cache import download_models
+from utils.checkpoints import checkpoint_revision, latest_checkpoint
+from utils.model_cache import verify_resources, MissingResourceError
+from utils.model_registry import registry
+from utils.result_cache import ResultCache, CACHE_PATH_ENV
+from utils.dialogue import Transcript
 
 # Set page config with expanded layout
 st.set_page_config(
@@ -55,9 +60,16 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Before loading models
-with st.spinner("Setting up models (first run may take a few minutes)..."):
-    download_models()
+# Check provisioned resources once per process; nothing is downloaded at startup
+@st.cache_resource
+def check_resources():
+    return verify_resources()
+
+try:
+    check_resources()
+except MissingResourceError as e:
+    st.error(str(e))
+    st.stop()
 
 # Initialize models
 @st.cache_resource
@@ -67,25 +79,51 @@ def load_models():
         biobert_ner = BioBERTNER()
         summarizer = MedicalSummarizer()
         keyword_extractor = MedicalKeywordExtractor()
-        bert_name_detector = BERTNameDetector()
-        sentiment_analyzer = MedicalSentimentAnalyzer()
+        # Both load on a background thread, shared by every session of this process
+        bert_name_detector = BERTNameDetector(warm_up=True)
+        sentiment_analyzer = MedicalSentimentAnalyzer(warm_up=True)
         soap_generator = SOAPNoteGenerator()
-        
-        # Initialize fine-tuned BioBERT model
-        try:
-            fine_tuned_biobert = FineTunedBioBERTNER()
-            fine_tuned_loaded = True
-        except Exception as e:
-            st.warning(f"Error loading fine-tuned BioBERT model: {str(e)}")
-            fine_tuned_biobert = None
-            fine_tuned_loaded = False
             
-        return rule_based_ner, biobert_ner, summarizer, keyword_extractor, bert_name_detector, sentiment_analyzer, soap_generator, fine_tuned_biobert, fine_tuned_loaded
+        return rule_based_ner, biobert_ner, summarizer, keyword_extractor, bert_name_detector, sentiment_analyzer, soap_generator
     except Exception as e:
         st.error(f"Error loading models: {str(e)}")
-        return None, None, None, None, None, None, None, None, False
+        return None, None, None, None, None, None, None
+
+rule_based_ner, biobert_ner, summarizer, keyword_extractor, bert_name_detector, sentiment_analyzer, soap_generator = load_models()
+
+# The fine-tuned model follows the newest checkpoint, shared by every session
+@st.cache_resource
+def fine_tuned_holder():
+    return {"model": None, "revision": None, "lock": threading.Lock()}
 
-rule_based_ner, biobert_ner, summarizer, keyword_extractor, bert_name_detector, sentiment_analyzer, soap_generator, fine_tuned_biobert, fine_tuned_loaded = load_models()
+def load_fine_tuned():
+    """The fine-tuned model of the newest checkpoint, swapped in after a retrain"""
+    holder = fine_tuned_holder()
+    checkpoint = latest_checkpoint()
+    revision = checkpoint_revision(checkpoint)
+    with holder["lock"]:
+        if holder["model"] is None or holder["revision"] != revision:
+            try:
+                model = FineTunedBioBERTNER(checkpoint=checkpoint)
+            except Exception as e:
+                st.warning(f"Error loading fine-tuned BioBERT model: {str(e)}")
+                return holder["model"]
+            if holder["model"] is not None:
+                # Frees the previous checkpoint's weights once no session is using them
+                holder["model"].close()
+            holder["model"], holder["revision"] = model, revision
+        return holder["model"]
+
+fine_tuned_biobert = load_fine_tuned()
+# Only offered once a fine-tuned checkpoint exists and loads
+fine_tuned_loaded = fine_tuned_biobert is not None and fine_tuned_biobert.model is not None
+
+# Per-stage results keyed by transcript, method and component versions (on disk when NOTETAKER_RESULT_CACHE is set)
+@st.cache_resource
+def load_result_cache():
+    return ResultCache(path=os.environ.get(CACHE_PATH_ENV))
+
+result_cache = load_result_cache()
 
 # App title - make it smaller
 st.markdown("## 🩺 Physician Notetaker")
@@ -181,14 +219,24 @@ with right_col:
 # Process the transcript when button is clicked
 if process_button:
     with st.spinner("Processing..."):
+        # Parse the conversation once; every stage reads the same turns
+        transcript = Transcript(transcript)
+        
         # Extract entities based on selected model
         if ner_method == "Rule-based NER":
-            entities = rule_based_ner.extract_entities(transcript)
+            entities = result_cache.get_or_compute(
+                "entities", transcript, rule_based_ner.extract_entities, [rule_based_ner], ner_method
+            )
         elif ner_method == "BioBERT NER":
-            entities = biobert_ner.extract_entities(transcript)
+            entities = result_cache.get_or_compute(
+                "entities", transcript, biobert_ner.extract_entities, [biobert_ner], ner_method
+            )
         elif ner_method == "BERT CONLL03[complex name handling]":
             # Only check model loading when this option is selected
-            if not bert_name_detector.is_loaded:
+            if bert_name_detector.state == "loading":
+                with left_col:
+                    st.info("The BERT model is still loading in the background; this run waits for it.")
+            elif not bert_name_detector.is_loaded:
                 with left_col:
                     st.warning("This requires downloading a pre-trained BERT model (~1.2GB) once.")
                     download_model = st.button("Download and Use BERT Model")
@@ -202,10 +250,14 @@ if process_button:
                                 st.error("Failed to load BERT model. Falling back to rule-based approach.")
             
             # Extract patient name using BERT or fallback
-            patient_name = bert_name_detector.extract_name(transcript)
+            patient_name = result_cache.get_or_compute(
+                "patient_name", transcript, bert_name_detector.extract_name, [bert_name_detector]
+            )
             
             # Use existing methods for other entities
-            entities = rule_based_ner.extract_entities(transcript)
+            entities = result_cache.get_or_compute(
+                "entities", transcript, rule_based_ner.extract_entities, [rule_based_ner], "Rule-based NER"
+            )
             
             # Replace the patient name with the BERT-detected name
             if patient_name != "Unknown":
@@ -213,15 +265,14 @@ if process_button:
             else:
                 entities["Patient_Name"] = "No Name"
         elif ner_method == "Fine-tuned BioBERT NER" and fine_tuned_loaded:
-            # Use the fine-tuned model for entity extraction
+            # Every field, the name included, comes from one pass of the fine-tuned model
             try:
-                # Use biobert_ner as a fallback if the fine-tuned model fails
-                entities = biobert_ner.extract_entities(transcript)
-                
-                # Extract patient name using BERT name detector for better name handling
-                patient_name = bert_name_detector.extract_name(transcript)
-                if patient_name != "Unknown":
-                    entities["Patient_Name"] = patient_name
+                entities = result_cache.get_or_compute(
+                    "entities", transcript, fine_tuned_biobert.extract_entities, [fine_tuned_biobert],
+                    "Fine-tuned BioBERT NER"
+                )
+                if entities["Patient_Name"] is None:
+                    entities["Patient_Name"] = "No Name"
             except Exception as e:
                 st.error(f"Error using fine-tuned model: {str(e)}")
                 entities = biobert_ner.extract_entities(transcript)
@@ -236,16 +287,22 @@ if process_button:
                 entities["Patient_Name"] = rule_entities["Patient_Name"]
         
         # Generate summary
-        summaries = summarizer.summarize(transcript)
+        summaries = result_cache.get_or_compute("summary", transcript, summarizer.summarize, [summarizer])
         
         # Extract keywords
-        keywords = keyword_extractor.extract_keywords(transcript)
+        keywords = result_cache.get_or_compute(
+            "keywords", transcript, keyword_extractor.extract_keywords, [keyword_extractor]
+        )
         
         # Analyze sentiment and intent
-        sentiment_results = sentiment_analyzer.analyze_sentiment(transcript)
+        sentiment_results = result_cache.get_or_compute(
+            "sentiment", transcript, sentiment_analyzer.analyze_sentiment, [sentiment_analyzer]
+        )
         
         # Generate SOAP note
-        soap_note = soap_generator.generate_soap_note(transcript)
+        soap_note = result_cache.get_or_compute(
+            "soap_note", transcript, soap_generator.generate_soap_note, [soap_generator]
+        )
         
         # Display results in the right column
         with right_col:
@@ -309,6 +366,29 @@ if process_button:
                 else:
                     st.markdown("Patient sentiment is neutral. Monitor for changes in emotional state.")
 
+                # Sentiment of each patient turn, in conversation order
+                if sentiment_results.get("Timeline"):
+                    st.markdown("#### Sentiment by Patient Turn")
+                    turns = transcript.turns
+                    st.table([
+                        {"Turn": point["turn"] + 1, "Patient": turns[point["turn"]].text,
+                         "Sentiment": point["Sentiment"], "Intent": point["Intent"]}
+                        for point in sentiment_results["Timeline"]
+                    ])
+
+# Memory held by the shared model registry (each checkpoint is loaded once per process)
+with st.expander("Loaded models"):
+    st.json({name: f"{size / 2**20:.1f} MiB" for name, size in registry.resident_bytes().items()})
+    # Lazily loaded models: cold, loading, ready or failed, with their load time
+    st.json({
+        component.loader.name: component.loader.status()
+        for component in (bert_name_detector, sentiment_analyzer) if component is not None
+    })
+
+# Hits, misses and bytes served by the result cache since the app started
+with st.expander("Result cache"):
+    st.json(result_cache.stats())
+
 # Minimal footer
 st.markdown("<div style='height: 10px;'></div>", unsafe_allow_html=True)
 st.markdown("<div style='text-align: center; color: #888; font-size: 0.8em;'>Physician Notetaker - Medical NLP</div>", unsafe_allow_html=True) 
\ No newline at end of file
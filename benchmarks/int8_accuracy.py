@@ -0,0 +1,118 @@
+"""Speed, memory and name accuracy of the int8 quantized detectors against fp32.
+
+Run from the repository root:
+
+    python -m benchmarks.int8_accuracy --runs 3
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+import transcript
+from utils.bert_name_detector import BERTNameDetector
+from utils.name_detector import PersonNameDetector
+from utils.biobert_finetuned import FineTunedBioBERTNER
+from utils.sentiment_analyzer import MedicalSentimentAnalyzer
+from utils.model_cache import verify_resources, MissingResourceError
+from utils.model_registry import module_bytes
+
+NAME_DETECTORS = [
+    ("BERT_CONLL03", BERTNameDetector),
+    ("PersonNameDetector", PersonNameDetector),
+    ("FineTuned_BioBERT", FineTunedBioBERTNER),
+]
+MODES = [None, "int8"]
+
+
+def load_cases(path):
+    """(chunk name, transcript, expected patient name) for every ground-truth entry"""
+    with open(path) as f:
+        ground_truth = json.load(f)
+    return [
+        (chunk, getattr(transcript, chunk), expected["Patient_Name"])
+        for chunk, expected in ground_truth.items()
+        if hasattr(transcript, chunk)
+    ]
+
+
+def name_accuracy(extracted, expected):
+    """Same scoring as test.py: None must match None, otherwise substring either way"""
+    if expected is None:
+        return 1.0 if extracted is None else 0.0
+    if extracted is None:
+        return 0.0
+    return 1.0 if expected.lower() in extracted.lower() or extracted.lower() in expected.lower() else 0.0
+
+
+def time_runs(fn, runs):
+    """Return (last result, median wall time in ms) over ``runs`` calls after a warm-up"""
+    result = fn()
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(times)
+
+
+def mode_name(mode):
+    return mode or "fp32"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="timed runs per configuration")
+    parser.add_argument("--ground-truth", default="ground_truth.json")
+    args = parser.parse_args(argv)
+
+    try:
+        verify_resources()
+    except MissingResourceError as e:
+        print(f"Warning: {e} Falling back to the hub.", file=sys.stderr)
+
+    cases = load_cases(args.ground_truth)
+    texts = [text for _, text, _ in cases]
+    print(f"{len(cases)} ground-truth transcripts, {args.runs} runs\n")
+    print(f"{'detector':<20} {'mode':<6} {'latency':>10} {'speedup':>8} {'weights':>10} {'name acc':>9}")
+
+    for label, detector_class in NAME_DETECTORS:
+        baseline = None
+        for mode in MODES:
+            detector = detector_class(quantize=mode)
+            if hasattr(detector, "load_model"):
+                detector.load_model()
+            names, latency = time_runs(lambda: detector.extract_names(texts), args.runs)
+            accuracy = statistics.mean(
+                name_accuracy(name, expected) for name, (_, _, expected) in zip(names, cases)
+            )
+            baseline = baseline or latency
+            model = detector.model
+            size = module_bytes(model) / 2**20 if model is not None else 0.0
+            print(
+                f"{label:<20} {mode_name(mode):<6} {latency:>8.0f}ms {baseline / latency:>7.2f}x "
+                f"{size:>7.0f}MiB {accuracy:>9.3f}"
+            )
+
+    # Sentiment has no ground truth; report agreement with the fp32 labels instead
+    reference = None
+    baseline = None
+    for mode in MODES:
+        analyzer = MedicalSentimentAnalyzer(quantize=mode)
+        analyzer.load_model()
+        results, latency = time_runs(lambda: [analyzer.analyze_sentiment(text) for text in texts], args.runs)
+        labels = [result["Sentiment"] for result in results]
+        reference = reference or labels
+        baseline = baseline or latency
+        agreement = statistics.mean(a == b for a, b in zip(labels, reference))
+        size = module_bytes(analyzer.model) / 2**20 if analyzer.model is not None else 0.0
+        print(
+            f"{'Sentiment':<20} {mode_name(mode):<6} {latency:>8.0f}ms {baseline / latency:>7.2f}x "
+            f"{size:>7.0f}MiB {agreement:>8.3f}*"
+        )
+    print("\n* sentiment column is label agreement with fp32, not accuracy")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
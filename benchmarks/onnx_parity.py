@@ -0,0 +1,101 @@
+"""Parity and latency of the ONNX backend against the PyTorch path.
+
+Run from the repository root after ``pip install '.[onnx]'``:
+
+    python -m benchmarks.onnx_parity --runs 5
+"""
+import argparse
+import statistics
+import sys
+import time
+import torch
+from transformers import AutoModelForTokenClassification, AutoModelForSequenceClassification
+import transcript
+from utils.inference import predict_token_labels, predict_sequence_probs
+from utils.model_cache import verify_resources, MissingResourceError
+from utils.model_registry import registry
+
+MODELS = [
+    ("dbmdz/bert-large-cased-finetuned-conll03-english", AutoModelForTokenClassification),
+    ("dmis-lab/biobert-base-cased-v1.1", AutoModelForTokenClassification),
+    ("distilbert-base-uncased-finetuned-sst-2-english", AutoModelForSequenceClassification),
+]
+
+
+def load_texts():
+    """Every bundled transcript chunk, in definition order"""
+    return [value for name, value in vars(transcript).items() if name.startswith("CHUNK_")]
+
+
+def predict(tokenizer, model, model_class, texts, batch_size):
+    """Run the same entry point the detectors use for this model head"""
+    if model_class is AutoModelForSequenceClassification:
+        return predict_sequence_probs(tokenizer, model, texts, batch_size=batch_size)
+    return predict_token_labels(tokenizer, model, texts, batch_size=batch_size)
+
+
+def time_runs(fn, runs):
+    """Return per-run wall times in milliseconds after one warm-up call"""
+    fn()
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def compare(model_class, reference, candidate, atol):
+    """Return (passed, detail) for one model's outputs on both backends"""
+    if model_class is AutoModelForSequenceClassification:
+        max_diff = (reference - candidate).abs().max().item()
+        same_labels = torch.equal(reference.argmax(dim=-1), candidate.argmax(dim=-1))
+        return max_diff <= atol and same_labels, f"max |dp|={max_diff:.2e}, labels {'match' if same_labels else 'DIFFER'}"
+
+    total = agree = 0
+    for (ref_tokens, ref_labels), (cand_tokens, cand_labels) in zip(reference, candidate):
+        if ref_tokens != cand_tokens:
+            return False, "token streams differ"
+        total += len(ref_labels)
+        agree += sum(a == b for a, b in zip(ref_labels, cand_labels))
+    return agree == total, f"{agree}/{total} token labels agree"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="timed runs per backend")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--atol", type=float, default=1e-3, help="tolerance on sentiment probabilities")
+    args = parser.parse_args(argv)
+
+    try:
+        verify_resources()
+    except MissingResourceError as e:
+        print(f"Warning: {e} Falling back to the hub.", file=sys.stderr)
+
+    texts = load_texts()
+    print(f"{len(texts)} transcripts, batch size {args.batch_size}, {args.runs} runs\n")
+    print(f"{'model':<52} {'torch p50':>10} {'onnx p50':>10} {'speedup':>8}  parity")
+
+    all_passed = True
+    for model_id, model_class in MODELS:
+        outputs, medians = {}, {}
+        for backend in ("torch", "onnx"):
+            tokenizer, model = registry.acquire(model_id, model_class, backend=backend)
+            outputs[backend] = predict(tokenizer, model, model_class, texts, args.batch_size)
+            times = time_runs(lambda: predict(tokenizer, model, model_class, texts, args.batch_size), args.runs)
+            medians[backend] = statistics.median(times)
+            registry.release(model_id, model_class, backend=backend)
+
+        passed, detail = compare(model_class, outputs["torch"], outputs["onnx"], args.atol)
+        all_passed = all_passed and passed
+        print(
+            f"{model_id:<52} {medians['torch']:>8.0f}ms {medians['onnx']:>8.0f}ms "
+            f"{medians['torch'] / medians['onnx']:>7.2f}x  {'PASS' if passed else 'FAIL'} ({detail})"
+        )
+
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
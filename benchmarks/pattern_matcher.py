@@ -0,0 +1,92 @@
+"""Single-pass PatternMatcher against the per-pattern re.finditer loop.
+
+Grows MedicalNER.entity_patterns to 10x and 100x with synthetic patterns built
+from the transcript vocabulary, checks both give identical hits, and times them:
+
+    python -m benchmarks.pattern_matcher
+"""
+import argparse
+import random
+import re
+import statistics
+import sys
+import time
+import transcript
+from utils.ner import MedicalNER
+from utils.pattern_matcher import PatternMatcher
+
+
+def load_texts():
+    """Every bundled transcript chunk, in definition order"""
+    return [value for name, value in vars(transcript).items() if name.startswith("CHUNK_")]
+
+
+def scale_patterns(patterns, factor, vocabulary, seed=0):
+    """Return ``patterns`` plus (factor - 1)x as many synthetic ones of the same kinds"""
+    rng = random.Random(seed)
+    scaled = {label: list(group) for label, group in patterns.items()}
+    for label, group in patterns.items():
+        for _ in range((factor - 1) * len(group)):
+            words = rng.sample(vocabulary, rng.randint(2, 8))
+            if rng.random() < 0.6:
+                # Plain alternatives, like most of the real patterns
+                scaled[label].append("(" + "|".join(words) + ")")
+            else:
+                split = len(words) // 2
+                scaled[label].append(f"({'|'.join(words[:split])}) ({'|'.join(words[split:])})")
+    return scaled
+
+
+def naive(patterns, text):
+    """The loop MedicalNER.extract_entities used to run"""
+    return [
+        (label, match.start(), match.end())
+        for label, group in patterns.items()
+        for pattern in group
+        for match in re.finditer(pattern, text, re.IGNORECASE)
+    ]
+
+
+def time_runs(fn, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--factors", type=int, nargs="+", default=[1, 10, 100])
+    args = parser.parse_args(argv)
+
+    texts = load_texts()
+    vocabulary = sorted({word.lower() for text in texts for word in re.findall(r"[A-Za-z]{3,}", text)})
+    base = MedicalNER().entity_patterns
+
+    print(f"{len(texts)} transcripts, {args.runs} runs\n")
+    print(f"{'factor':>6} {'patterns':>9} {'compile':>9} {'finditer loop':>14} {'matcher':>9} {'speedup':>8}  identical")
+    all_identical = True
+    for factor in args.factors:
+        patterns = scale_patterns(base, factor, vocabulary)
+        count = sum(len(group) for group in patterns.values())
+        start = time.perf_counter()
+        matcher = PatternMatcher(patterns)
+        compile_ms = (time.perf_counter() - start) * 1000
+
+        identical = all(naive(patterns, text) == matcher.finditer(text) for text in texts)
+        all_identical = all_identical and identical
+        loop_ms = time_runs(lambda: [naive(patterns, text) for text in texts], args.runs)
+        matcher_ms = time_runs(lambda: [matcher.finditer(text) for text in texts], args.runs)
+        print(
+            f"{factor:>5}x {count:>9} {compile_ms:>7.0f}ms {loop_ms:>12.1f}ms {matcher_ms:>7.1f}ms "
+            f"{loop_ms / matcher_ms:>7.2f}x  {'yes' if identical else 'NO'}"
+        )
+
+    return 0 if all_identical else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
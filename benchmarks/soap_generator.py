@@ -0,0 +1,147 @@
+"""Single-pass SOAP section classifier against the per-section dialogue scans.
+
+Builds long transcripts by repeating every bundled chunk, checks both give the
+same note, and reports transcripts/sec for each:
+
+    python -m benchmarks.soap_generator --repeats 1 10 100
+"""
+import argparse
+import re
+import statistics
+import sys
+import time
+import transcript
+from utils.soap_generator import SOAPNoteGenerator
+
+
+class MultiScanSOAPNoteGenerator(SOAPNoteGenerator):
+    """The previous generator: one walk over the dialogue per section, plus one more for the plan"""
+
+    def generate_soap_note(self, transcript):
+        dialogue = [{"speaker": turn.role, "text": turn.text} for turn in self._extract_dialogue(transcript)]
+        return {
+            "Subjective": self._subjective(dialogue),
+            "Objective": self._objective(dialogue),
+            "Assessment": self._assessment(dialogue),
+            "Plan": self._plan(dialogue),
+        }
+
+    def _subjective(self, dialogue):
+        patient_statements = []
+        chief_complaint = ""
+        for entry in dialogue:
+            if entry["speaker"].lower() == "patient":
+                patient_statements.append(entry["text"])
+                if not chief_complaint and any(keyword in entry["text"].lower() for keyword in ["pain", "hurt", "ache", "discomfort"]):
+                    pain_match = re.search(r"(my|the)\s+([a-z\s]+)\s+(pain|hurt|ache)", entry["text"].lower())
+                    if pain_match:
+                        chief_complaint = pain_match.group(2).strip() + " pain"
+                    else:
+                        for part in ["head", "neck", "back", "chest", "stomach", "arm", "leg", "knee", "ankle", "shoulder"]:
+                            if part in entry["text"].lower():
+                                chief_complaint = part + " pain"
+                                break
+        if not chief_complaint and patient_statements:
+            chief_complaint = self._extract_key_phrase(" ".join(patient_statements))
+        history = " ".join(patient_statements)
+        if len(history) > 100:
+            history = self._simple_summarize(history)
+        return {
+            "Chief_Complaint": chief_complaint.capitalize() if chief_complaint else "Not specified",
+            "History_of_Present_Illness": history
+        }
+
+    def _objective(self, dialogue):
+        observations = []
+        for entry in dialogue:
+            if entry["speaker"].lower() == "doctor":
+                if any(keyword in entry["text"].lower() for keyword in ["observe", "see", "notice", "appear", "look"]):
+                    observations.append(entry["text"])
+        return {
+            "Physical_Exam": self._generate_physical_exam(observations),
+            "Observations": self._generate_observations(observations)
+        }
+
+    def _assessment(self, dialogue):
+        diagnosis = ""
+        severity = ""
+        severity_keywords = ["mild", "moderate", "severe", "critical", "improving", "worsening"]
+        for entry in dialogue:
+            if entry["speaker"].lower() == "doctor":
+                if any(keyword in entry["text"].lower() for keyword in ["diagnos", "condition", "assessment", "problem"]):
+                    diagnosis = entry["text"]
+                if any(keyword in entry["text"].lower() for keyword in severity_keywords):
+                    severity = self._extract_sentence_with_keyword(entry["text"], severity_keywords)
+        if not diagnosis:
+            diagnosis = self._infer_diagnosis([entry["text"] for entry in dialogue if entry["speaker"].lower() == "patient"])
+        return {
+            "Diagnosis": diagnosis if diagnosis else "Pending further evaluation",
+            "Severity": severity or "Mild, improving"
+        }
+
+    def _plan(self, dialogue):
+        treatment = ""
+        followup = ""
+        for entry in dialogue:
+            if entry["speaker"].lower() == "doctor":
+                if any(keyword in entry["text"].lower() for keyword in ["treat", "medication", "prescribe", "recommend", "advise"]):
+                    treatment = entry["text"]
+                if any(keyword in entry["text"].lower() for keyword in ["follow", "return", "check", "visit", "appointment"]):
+                    followup = entry["text"]
+        if not treatment:
+            treatment = self._generate_treatment_plan(self._assessment(dialogue)["Diagnosis"])
+        return {
+            "Treatment": treatment,
+            "Follow-Up": followup or "Patient to return if symptoms worsen or fail to improve."
+        }
+
+
+def load_texts():
+    """Every bundled transcript, in definition order"""
+    return [
+        value for name, value in vars(transcript).items()
+        if name.startswith(("CHUNK_", "TEST_CHUNK_", "DEFAULT")) and isinstance(value, str)
+    ]
+
+
+def throughput(generator, texts, runs):
+    """Median transcripts/sec over ``runs`` passes"""
+    rates = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for text in texts:
+            generator.generate_soap_note(text)
+        rates.append(len(texts) / (time.perf_counter() - start))
+    return statistics.median(rates)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--repeats", type=int, nargs="+", default=[1, 10, 100],
+                        help="times each chunk is repeated to make one long transcript")
+    args = parser.parse_args(argv)
+
+    single_pass = SOAPNoteGenerator()
+    multi_scan = MultiScanSOAPNoteGenerator()
+    chunks = load_texts()
+
+    print(f"{len(chunks)} transcripts, {args.runs} runs\n")
+    print(f"{'repeats':>7} {'avg chars':>10} {'multi-scan':>12} {'single pass':>12} {'speedup':>8}  identical")
+    all_identical = True
+    for repeats in args.repeats:
+        texts = ["\n".join([chunk] * repeats) for chunk in chunks]
+        identical = all(single_pass.generate_soap_note(text) == multi_scan.generate_soap_note(text) for text in texts)
+        all_identical = all_identical and identical
+        old_rate = throughput(multi_scan, texts, args.runs)
+        new_rate = throughput(single_pass, texts, args.runs)
+        print(
+            f"{repeats:>6}x {sum(map(len, texts)) // len(texts):>10} {old_rate:>8.1f} tx/s {new_rate:>8.1f} tx/s "
+            f"{new_rate / old_rate:>7.2f}x  {'yes' if identical else 'NO'}"
+        )
+
+    return 0 if all_identical else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""Headless latency, throughput and memory benchmark of every pipeline component.
+
+Each component runs in its own fresh interpreter over every CHUNK_* and
+TEST_CHUNK_* transcript, so cold start and peak RSS are not shared with the
+others. Results are written as JSON; with --baseline the run fails on any
+metric that regressed by more than --tolerance.
+
+    python -m benchmarks.suite -o bench.json --baseline benchmarks/baseline.json
+    python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+_started = time.perf_counter()
+
+COMPONENTS = (
+    "ner.rule", "ner.biobert", "ner.bert", "ner.finetuned",
+    "summarizer", "keywords", "sentiment", "soap",
+)
+
+# Metric -> whether larger is better, for the baseline comparison
+METRICS = {
+    "cold_start_ms": False,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "transcripts_per_sec": True,
+    "peak_rss_mb": False,
+}
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_texts():
+    """Every CHUNK_* and TEST_CHUNK_* transcript, in definition order"""
+    import transcript
+    return [
+        (name, value) for name, value in vars(transcript).items()
+        if name.startswith(("CHUNK_", "TEST_CHUNK_")) and isinstance(value, str)
+    ]
+
+
+def build(name, options):
+    """Import and construct one component, returning its per-transcript callable"""
+    if name.startswith("ner."):
+        from utils.pipeline import EntityExtractor
+        return EntityExtractor(name.split(".", 1)[1], **options).extract_entities
+    if name == "summarizer":
+        from utils.summarization import MedicalSummarizer
+        return MedicalSummarizer().summarize
+    if name == "keywords":
+        from utils.keyword import MedicalKeywordExtractor
+        return MedicalKeywordExtractor().extract_keywords
+    if name == "sentiment":
+        from utils.sentiment_analyzer import MedicalSentimentAnalyzer
+        return MedicalSentimentAnalyzer(**options).analyze_sentiment
+    if name == "soap":
+        from utils.soap_generator import SOAPNoteGenerator
+        return SOAPNoteGenerator().generate_soap_note
+    raise ValueError(f"Unknown component {name!r}, expected one of {COMPONENTS}")
+
+
+def percentile(values, q):
+    """Linearly interpolated percentile of a non-empty list, q in [0, 100]"""
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def measure(name, options, runs):
+    """Benchmark one component in this process; meant to run in a fresh interpreter"""
+    from utils.model_cache import verify_resources, MissingResourceError
+    try:
+        verify_resources()
+    except MissingResourceError as e:
+        print(f"Warning: {e} Falling back to the hub.", file=sys.stderr)
+
+    texts = [text for _, text in load_texts()]
+    fn = build(name, options)
+    loaded = time.perf_counter()
+    fn(texts[0])
+    first_result = time.perf_counter()
+
+    latencies = []
+    for _ in range(runs):
+        for text in texts:
+            start = time.perf_counter()
+            fn(text)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        # Interpreter start to first result: imports, model loading and one call
+        "cold_start_ms": (first_result - _started) * 1000,
+        "load_ms": (loaded - _started) * 1000,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "transcripts_per_sec": len(latencies) / (sum(latencies) / 1000),
+        "peak_rss_mb": peak_rss_mb(),
+        "calls": len(latencies),
+    }
+
+
+def run_component(name, options, runs, timeout):
+    """Measure one component in a child interpreter and return its metrics"""
+    command = [sys.executable, "-m", "benchmarks.suite", "--worker", name, "--runs", str(runs),
+               "--options", json.dumps(options)]
+    try:
+        completed = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"error": f"timed out after {timeout}s"}
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {completed.returncode}"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    """Return one message per metric that is worse than the baseline by more than ``tolerance``"""
+    regressions = []
+    for name, metrics in results["components"].items():
+        reference = baseline.get("components", {}).get(name)
+        if not reference or "error" in reference:
+            continue
+        if "error" in metrics:
+            regressions.append(f"{name}: failed ({metrics['error']})")
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = reference.get(metric), metrics[metric]
+            if not old:
+                continue
+            change = new / old - 1
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{name}: {metric} {old:.4g} -> {new:.4g} ({change:+.0%})")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'component':<14} {'cold':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'tx/s':>8} {'RSS':>9}")
+    for name, metrics in results["components"].items():
+        if "error" in metrics:
+            print(f"{name:<14} error: {metrics['error']}")
+            continue
+        print(
+            f"{name:<14} {metrics['cold_start_ms'] / 1000:>8.2f}s {metrics['p50_ms']:>7.1f}ms "
+            f"{metrics['p95_ms']:>7.1f}ms {metrics['p99_ms']:>7.1f}ms {metrics['transcripts_per_sec']:>8.1f} "
+            f"{metrics['peak_rss_mb']:>6.0f}MiB"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("components", nargs="*", metavar="component",
+                        help=f"components to run (default: all of {', '.join(COMPONENTS)})")
+    parser.add_argument("-o", "--output", default=None, help="write results as JSON to this path")
+    parser.add_argument("--runs", type=int, default=5, help="timed passes over the transcripts")
+    parser.add_argument("--baseline", default=None, help="fail on regressions against this results file")
+    parser.add_argument("--save-baseline", metavar="PATH", default=None, help="also write the results here")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression (default: 0.2)")
+    parser.add_argument("--timeout", type=float, default=1800, help="seconds per component")
+    parser.add_argument("--window-stride", type=int, default=None)
+    parser.add_argument("--backend", choices=("torch", "onnx"), default="torch")
+    parser.add_argument("--quantize", choices=("int8",), default=None)
+    parser.add_argument("--worker", choices=COMPONENTS, help=argparse.SUPPRESS)
+    parser.add_argument("--options", default="{}", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.runs < 1:
+        parser.error("--runs must be at least 1")
+    unknown = [name for name in args.components if name not in COMPONENTS]
+    if unknown:
+        parser.error(f"unknown components: {', '.join(unknown)}")
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, json.loads(args.options), args.runs)))
+        return 0
+
+    options = {"window_stride": args.window_stride, "backend": args.backend, "quantize": args.quantize}
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "transcripts": len(load_texts()),
+            "runs": args.runs,
+            "options": options,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "components": {},
+    }
+    for name in args.components or COMPONENTS:
+        print(f"Running {name}...", file=sys.stderr, flush=True)
+        results["components"][name] = run_component(name, options, args.runs, args.timeout)
+
+    print_table(results)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+
+    failed = any("error" in metrics for metrics in results["components"].values())
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("options") != options:
+            print("Warning: baseline was recorded with different model options", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if not regressions:
+            print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+        failed = failed or bool(regressions)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Extractive summarizer against the previous per-sentence scoring loop.
+
+Builds long transcripts by repeating every bundled chunk, checks all three
+paths give the same summaries, and reports transcripts/sec for the loop,
+one summarize() call per transcript, and one summarize_many() call per pass:
+
+    python -m benchmarks.summarizer --repeats 1 10 100
+"""
+import argparse
+import re
+import sys
+import time
+from benchmarks.soap_generator import load_texts
+from utils.summarization import MedicalSummarizer
+
+
+class LoopSummarizer(MedicalSummarizer):
+    """The previous summarizer, whose selection scans a list for every sentence"""
+
+    def summarize(self, transcript, ratio=0.3):
+        views = self.split_by_speaker(transcript)
+        return {view: self.extractive_summarize(self.clean_text(views[view]), ratio) for view in self.VIEWS}
+
+    def extractive_summarize(self, text, ratio=0.3):
+        sentences = [s.strip() for s in re.split(r'[.!?]+', text) if s.strip()]
+        if len(sentences) <= 3:
+            return text
+        word_freq = {}
+        for word in re.findall(r'\b\w+\b', text.lower()):
+            if word not in self.stopwords:
+                word_freq[word] = word_freq.get(word, 0) + 1
+        sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
+        important_words = {word for word, _ in sorted_words[:max(int(len(sorted_words) * 0.2), 5)]}
+        sentence_scores = [(sentence, self.sentence_importance(sentence, important_words)) for sentence in sentences]
+        selected = sorted(sentence_scores, key=lambda x: x[1], reverse=True)[:max(int(len(sentences) * ratio), 3)]
+        summary = '. '.join(sentence for sentence, score in sentence_scores if (sentence, score) in selected)
+        if not summary.endswith('.'):
+            summary += '.'
+        return summary
+
+
+def throughput(runners, texts, runs):
+    """Best transcripts/sec of each ``runner(texts)`` over ``runs`` rounds.
+
+    Each round calls every runner once, so load from other processes falls
+    on all of them alike; slower runs measure that load, not the runner.
+    """
+    rates = [0.0] * len(runners)
+    for _ in range(runs):
+        for i, run in enumerate(runners):
+            start = time.perf_counter()
+            run(texts)
+            rates[i] = max(rates[i], len(texts) / (time.perf_counter() - start))
+    return rates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--repeats", type=int, nargs="+", default=[1, 10, 100],
+                        help="times each chunk is repeated to make one long transcript")
+    args = parser.parse_args(argv)
+
+    summarizer = MedicalSummarizer()
+    loop = LoopSummarizer()
+    chunks = load_texts()
+
+    print(f"{len(chunks)} transcripts, {args.runs} runs\n")
+    print(f"{'repeats':>7} {'avg chars':>10} {'loop':>12} {'summarize':>12} {'batch':>12} {'speedup':>8}  identical")
+    all_identical = True
+    for repeats in args.repeats:
+        texts = ["\n".join([chunk] * repeats) for chunk in chunks]
+        expected = [loop.summarize(text) for text in texts]
+        identical = [summarizer.summarize(text) for text in texts] == expected == summarizer.summarize_many(texts)
+        all_identical = all_identical and identical
+        old_rate, single_rate, batch_rate = throughput([
+            lambda texts: [loop.summarize(text) for text in texts],
+            lambda texts: [summarizer.summarize(text) for text in texts],
+            summarizer.summarize_many,
+        ], texts, args.runs)
+        print(
+            f"{repeats:>6}x {sum(map(len, texts)) // len(texts):>10} {old_rate:>8.1f} tx/s {single_rate:>8.1f} tx/s "
+            f"{batch_rate:>8.1f} tx/s {batch_rate / old_rate:>7.2f}x  {'yes' if identical else 'NO'}"
+        )
+
+    return 0 if all_identical else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
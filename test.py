@@ -1,5 +1,10 @@
+import argparse
 import json
+import multiprocessing
+import os
+import time
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import re
 
 
@@ -7,8 +12,28 @@ from utils.ner import MedicalNER
 from utils.biobert_ner import BioBERTNER
 from utils.bert_name_detector import BERTNameDetector
 from utils.biobert_finetuned import FineTunedBioBERTNER
+from utils.result_cache import ResultCache, class_version
+from utils.checkpoints import checkpoint_revision, latest_checkpoint
 
 from transcript import *
+
+# Models under evaluation, in report order
+MODELS = {
+    "Rule_Based": MedicalNER,
+    "BioBERT": BioBERTNER,
+    "BERT_CONLL03": BERTNameDetector,
+    "FineTuned_BioBERT": FineTunedBioBERTNER,
+}
+
+# Predictions are memoized here between runs, keyed by model version and chunk hash
+EVALUATION_CACHE = os.environ.get(
+    "NOTETAKER_EVALUATION_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "physician-notetaker", "evaluation.sqlite")
+)
+
+# Per-process models, built on first use by _predict
+_models = {}
+
 def calculate_accuracy(predicted, ground_truth):
     """
     Calculate accuracy metrics for NER predictions
@@ -71,36 +96,130 @@ def calculate_accuracy(predicted, ground_truth):
 def evaluate_name_extraction(text, expected_name, model_name, model):
     """Evaluate name extraction accuracy for a given model"""
     try:
-        # Use the correct method for each model
-        if model_name == "Rule_Based":
-            extracted_name = model.extract_name(text)
-        elif model_name == "BioBERT":
-            extracted_name = model.extract_name(text)
-        elif model_name == "BERT_CONLL03":
-            extracted_name = model.extract_name(text)
-        elif model_name == "FineTuned_BioBERT":
-            extracted_name = model.extract_name(text)
-        else:
-            extracted_name = None
-            
+        extracted_name = model.extract_name(text) if model_name in MODELS else None
         print(f"{model_name} Name: {extracted_name}")
-        
-        # Calculate accuracy
-        if expected_name is None:
-            # If no name is expected, accuracy is 1.0 if no name is extracted
-            accuracy = 1.0 if extracted_name is None else 0.0
-        elif extracted_name is None:
-            # If a name is expected but none is extracted, accuracy is 0.0
-            accuracy = 0.0
-        else:
-            # Simple string matching for now
-            accuracy = 1.0 if expected_name.lower() in extracted_name.lower() or extracted_name.lower() in expected_name.lower() else 0.0
-        
-        return accuracy, extracted_name
+        return score_name(extracted_name, expected_name), extracted_name
     except Exception as e:
         print(f"Error in {model_name} name extraction: {str(e)}")
         return 0.0, None
 
+def score_name(extracted_name, expected_name):
+    """Name accuracy: 1.0 when the names overlap as substrings, or both are None"""
+    if expected_name is None:
+        # If no name is expected, accuracy is 1.0 if no name is extracted
+        return 1.0 if extracted_name is None else 0.0
+    if extracted_name is None:
+        # If a name is expected but none is extracted, accuracy is 0.0
+        return 0.0
+    # Simple string matching for now
+    return 1.0 if expected_name.lower() in extracted_name.lower() or extracted_name.lower() in expected_name.lower() else 0.0
+
+def _init_worker(threads):
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+def _predict(model_name, text):
+    """Name and entities of one chunk from one model; errors are returned, not raised"""
+    start = time.perf_counter()
+    try:
+        if model_name not in _models:
+            _models[model_name] = MODELS[model_name]()
+        model = _models[model_name]
+        if model_name == "FineTuned_BioBERT" and model.model is None:
+            # Without weights it finds nothing; report N/A rather than scoring that
+            raise RuntimeError("no fine-tuned checkpoint")
+        if model_name == "BERT_CONLL03":
+            # Only the name comes from this model; the other fields are BioBERT's
+            if not model.load_model():
+                raise RuntimeError("Could not load BERT model")
+            prediction = {"name": model.extract_name(text)}
+        else:
+            try:
+                name = model.extract_name(text)
+            except Exception as e:
+                print(f"Error in {model_name} name extraction: {str(e)}")
+                name = None
+            prediction = {"name": name, "entities": model.extract_entities(text)}
+    except Exception as e:
+        prediction = {"error": f"{type(e).__name__}: {e}"}
+    return prediction, time.perf_counter() - start
+
+def _predict_chunks(model_name, texts):
+    """_predict results for several chunks from one model, loaded once and released after"""
+    try:
+        return [_predict(model_name, text) for text in texts]
+    finally:
+        # Hand the weights back to the registry, so a pool process that takes
+        # another model's group next holds one model at a time
+        model = _models.pop(model_name, None)
+        if model is not None:
+            model.close()
+
+def compute_predictions(chunks, workers=None, cache_path=EVALUATION_CACHE):
+    """Run every model once on every chunk, reusing cached predictions.
+
+    Returns (predictions, timings): predictions[model][chunk] is the _predict
+    result, and timings[model] holds the seconds spent predicting (model
+    loading included) and how many chunks came from the cache. Missing
+    predictions are grouped by model and each group runs in one of
+    ``workers`` processes (default: one per core, at most one per model with
+    missing chunks; 0 runs them here), so a process loads only the model it runs.
+    """
+    cache = ResultCache(path=cache_path) if cache_path else None
+    versions = {model_name: class_version(cls) for model_name, cls in MODELS.items()}
+    # Retraining changes the fine-tuned model's predictions without touching its code
+    versions["FineTuned_BioBERT"] += f":{checkpoint_revision(latest_checkpoint())}"
+    predictions = {model_name: {} for model_name in MODELS}
+    timings = {model_name: {"seconds": 0.0, "cached": 0} for model_name in MODELS}
+
+    def key(model_name, text):
+        return ResultCache.key("evaluation", text, method=f"{model_name}@{versions[model_name]}")
+
+    tasks = {}
+    for model_name in MODELS:
+        for chunk_name, chunk_text in chunks.items():
+            cached = cache.get(key(model_name, chunk_text)) if cache is not None else None
+            if cached is not None:
+                predictions[model_name][chunk_name] = cached
+                timings[model_name]["cached"] += 1
+            else:
+                tasks.setdefault(model_name, []).append(chunk_name)
+
+    def record(model_name, chunk_name, prediction, seconds):
+        predictions[model_name][chunk_name] = prediction
+        timings[model_name]["seconds"] += seconds
+        # Failures are retried next run
+        if cache is not None and "error" not in prediction:
+            cache.put(key(model_name, chunks[chunk_name]), prediction)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(tasks))
+    if workers == 0:
+        for model_name, chunk_names in tasks.items():
+            results = _predict_chunks(model_name, [chunks[chunk_name] for chunk_name in chunk_names])
+            for chunk_name, result in zip(chunk_names, results):
+                record(model_name, chunk_name, *result)
+    elif tasks:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker, initargs=(threads,)
+        ) as pool:
+            futures = {
+                pool.submit(_predict_chunks, model_name, [chunks[chunk_name] for chunk_name in chunk_names]): model_name
+                for model_name, chunk_names in tasks.items()
+            }
+            for future in as_completed(futures):
+                model_name = futures[future]
+                for chunk_name, result in zip(tasks[model_name], future.result()):
+                    record(model_name, chunk_name, *result)
+
+    if cache is not None:
+        cache.close()
+    return predictions, timings
+
 def normalize_name(name):
     """Normalize name for comparison by removing punctuation and standardizing spacing"""
     if not name:
@@ -158,7 +277,8 @@ def create_ground_truth_file():
     
     return ground_truth
 
-def evaluate_models():
+def evaluate_models(workers=None, cache_path=EVALUATION_CACHE):
+    """Score every model on every chunk against ground_truth.json and print the comparison"""
     # Create ground truth file if it doesn't exist
     try:
         with open("ground_truth.json", "r") as f:
@@ -167,20 +287,7 @@ def evaluate_models():
         print("Ground truth file not found. Creating it...")
         ground_truth = create_ground_truth_file()
     
-    # Initialize models
-    rule_based_ner = MedicalNER()
-    biobert_ner = BioBERTNER()
-    bert_name_detector = BERTNameDetector()
-    
-    # Initialize fine-tuned BioBERT model
-    try:
-        # Use the base model instead of trying to load from a local path
-        fine_tuned_biobert = FineTunedBioBERTNER()
-        fine_tuned_loaded = True
-        print("Fine-tuned BioBERT model loaded successfully")
-    except Exception as e:
-        print(f"Error loading fine-tuned BioBERT model: {str(e)}")
-        fine_tuned_loaded = False
+    start = time.perf_counter()
     
     # Get all chunks from transcript.py
     chunks = {
@@ -217,6 +324,23 @@ def evaluate_models():
         "TEST_CHUNK_J": TEST_CHUNK_J
     }
     
+    # Every (model, chunk) prediction, computed once and cached across runs
+    predictions, timings = compute_predictions(chunks, workers, cache_path)
+    for model_name in ("Rule_Based", "BioBERT"):
+        for chunk_name, prediction in predictions[model_name].items():
+            if "error" in prediction:
+                raise RuntimeError(f"{model_name} failed on {chunk_name}: {prediction['error']}")
+    
+    # A model counts as loaded if it managed at least one chunk
+    fine_tuned_loaded = any("error" not in p for p in predictions["FineTuned_BioBERT"].values())
+    bert_loaded = any("error" not in p for p in predictions["BERT_CONLL03"].values())
+    if fine_tuned_loaded:
+        print("Fine-tuned BioBERT model loaded successfully")
+    else:
+        print(f"Error loading fine-tuned BioBERT model: {_first_error(predictions['FineTuned_BioBERT'])}")
+    if not bert_loaded:
+        print("Could not load BERT model, skipping BERT evaluation")
+    
     # Initialize results dictionary
     results = {
         "Rule_Based": defaultdict(list),
@@ -228,7 +352,7 @@ def evaluate_models():
     # Initialize table data for comparison
     table_data = []
     
-    # Process each chunk with each model
+    # Score each chunk's predictions
     for chunk_name, chunk_text in chunks.items():
         expected_output = ground_truth[chunk_name]
         
@@ -238,81 +362,52 @@ def evaluate_models():
         # Create a row for this chunk
         row_data = {"Chunk": chunk_name}
         
-        # Process with Rule-Based model
-        rule_based_name_accuracy, rule_based_extracted_name = evaluate_name_extraction(
-            chunk_text, expected_name, "Rule_Based", rule_based_ner
-        )
-        results["Rule_Based"]["Patient_Name_Accuracy"].append(rule_based_name_accuracy)
-        
-        # Rule-based NER
-        rule_based_prediction = rule_based_ner.extract_entities(chunk_text)
-        rule_based_accuracy = calculate_accuracy(rule_based_prediction, expected_output)
+        # Rule-Based model
+        rule_based_extracted_name = predictions["Rule_Based"][chunk_name]["name"]
+        print(f"Rule_Based Name: {rule_based_extracted_name}")
+        results["Rule_Based"]["Patient_Name_Accuracy"].append(score_name(rule_based_extracted_name, expected_name))
         
-        # Store results for Rule-Based
+        rule_based_accuracy = calculate_accuracy(predictions["Rule_Based"][chunk_name]["entities"], expected_output)
         for metric, value in rule_based_accuracy.items():
             results["Rule_Based"][metric].append(value)
-        
         row_data["Rule_Based_Accuracy"] = rule_based_accuracy["overall"]
         
-        # Process with BioBERT model
-        biobert_name_accuracy, biobert_extracted_name = evaluate_name_extraction(
-            chunk_text, expected_name, "BioBERT", biobert_ner
-        )
-        results["BioBERT"]["Patient_Name_Accuracy"].append(biobert_name_accuracy)
+        # BioBERT model
+        biobert_extracted_name = predictions["BioBERT"][chunk_name]["name"]
+        print(f"BioBERT Name: {biobert_extracted_name}")
+        results["BioBERT"]["Patient_Name_Accuracy"].append(score_name(biobert_extracted_name, expected_name))
         
-        # BioBERT NER
-        biobert_prediction = biobert_ner.extract_entities(chunk_text)
+        biobert_prediction = predictions["BioBERT"][chunk_name]["entities"]
         biobert_accuracy = calculate_accuracy(biobert_prediction, expected_output)
-        
-        # Store results for BioBERT
         for metric, value in biobert_accuracy.items():
             results["BioBERT"][metric].append(value)
-        
         row_data["BioBERT_Accuracy"] = biobert_accuracy["overall"]
         
-        # Process with Fine-tuned BioBERT model if loaded
-        if fine_tuned_loaded:
-            try:
-                # Use the same extract_name method as BioBERT for consistency
-                fine_tuned_name_accuracy, fine_tuned_extracted_name = evaluate_name_extraction(
-                    chunk_text, expected_name, "FineTuned_BioBERT", fine_tuned_biobert
-                )
-                results["FineTuned_BioBERT"]["Patient_Name_Accuracy"].append(fine_tuned_name_accuracy)
-                
-                # Fine-tuned BioBERT NER
-                fine_tuned_prediction = fine_tuned_biobert.extract_entities(chunk_text)  # Use fine_tuned_biobert instead of biobert_ner
-                fine_tuned_accuracy = calculate_accuracy(fine_tuned_prediction, expected_output)
-                
-                # Store results for Fine-tuned BioBERT
-                for metric, value in fine_tuned_accuracy.items():
-                    results["FineTuned_BioBERT"][metric].append(value)
-                
-                row_data["FineTuned_BioBERT_Accuracy"] = fine_tuned_accuracy["overall"]
-            except Exception as e:
-                print(f"Error processing chunk {chunk_name} with Fine-tuned BioBERT: {str(e)}")
-                row_data["FineTuned_BioBERT_Accuracy"] = "N/A"
+        # Fine-tuned BioBERT model, if it loaded
+        fine_tuned = predictions["FineTuned_BioBERT"][chunk_name]
+        if fine_tuned_loaded and "error" not in fine_tuned:
+            print(f"FineTuned_BioBERT Name: {fine_tuned['name']}")
+            results["FineTuned_BioBERT"]["Patient_Name_Accuracy"].append(score_name(fine_tuned["name"], expected_name))
+            
+            fine_tuned_accuracy = calculate_accuracy(fine_tuned["entities"], expected_output)
+            for metric, value in fine_tuned_accuracy.items():
+                results["FineTuned_BioBERT"][metric].append(value)
+            row_data["FineTuned_BioBERT_Accuracy"] = fine_tuned_accuracy["overall"]
         else:
+            if fine_tuned_loaded:
+                print(f"Error processing chunk {chunk_name} with Fine-tuned BioBERT: {fine_tuned['error']}")
             row_data["FineTuned_BioBERT_Accuracy"] = "N/A"
         
-        # Process with BERT_CONLL03 model
-        # First check if model is loaded
-        if not bert_name_detector.is_loaded:
-            try:
-                bert_name_detector.load_model()
-            except:
-                print("Could not load BERT model, skipping BERT evaluation")
-        
-        # Only proceed with BERT if model is loaded
-        if bert_name_detector.is_loaded:
-            bert_name_accuracy, bert_extracted_name = evaluate_name_extraction(
-                chunk_text, expected_name, "BERT_CONLL03", bert_name_detector
-            )
-            results["BERT_CONLL03"]["Patient_Name_Accuracy"].append(bert_name_accuracy)
+        # BERT_CONLL03 model, only if it loaded
+        bert = predictions["BERT_CONLL03"][chunk_name]
+        if bert_loaded and "error" not in bert:
+            bert_extracted_name = bert["name"]
+            print(f"BERT_CONLL03 Name: {bert_extracted_name}")
+            results["BERT_CONLL03"]["Patient_Name_Accuracy"].append(score_name(bert_extracted_name, expected_name))
             
             # Create a compatible format for the BERT detector output
-            patient_name = bert_name_detector.extract_name(chunk_text)
             bert_prediction = {
-                "Patient_Name": patient_name if patient_name != "Unknown" else None,
+                "Patient_Name": bert_extracted_name if bert_extracted_name != "Unknown" else None,
                 "Symptoms": biobert_prediction["Symptoms"],  # Use BioBERT for other fields
                 "Diagnosis": biobert_prediction["Diagnosis"],
                 "Treatment": biobert_prediction["Treatment"],
@@ -320,11 +415,8 @@ def evaluate_models():
                 "Prognosis": biobert_prediction["Prognosis"]
             }
             bert_accuracy = calculate_accuracy(bert_prediction, expected_output)
-            
-            # Store results for BERT_CONLL03
             for metric, value in bert_accuracy.items():
                 results["BERT_CONLL03"][metric].append(value)
-            
             row_data["BERT_CONLL03_Accuracy"] = bert_accuracy["overall"]
         else:
             row_data["BERT_CONLL03_Accuracy"] = "N/A"
@@ -337,11 +429,11 @@ def evaluate_models():
         print(f"Ground Truth: {json.dumps(expected_output, indent=2)}")
         print(f"Rule-Based Name: {rule_based_extracted_name}")
         print(f"BioBERT Name: {biobert_extracted_name}")
-        if bert_name_detector.is_loaded:
+        if row_data["BERT_CONLL03_Accuracy"] != "N/A":
             print(f"BERT_CONLL03 Name: {bert_extracted_name}")
         print(f"Rule-Based Accuracy: {rule_based_accuracy['overall']:.2f}")
         print(f"BioBERT Accuracy: {biobert_accuracy['overall']:.2f}")
-        if bert_name_detector.is_loaded:
+        if row_data["BERT_CONLL03_Accuracy"] != "N/A":
             print(f"BERT_CONLL03 Accuracy: {bert_accuracy['overall']:.2f}")
     
     # Calculate average metrics
@@ -364,6 +456,8 @@ def evaluate_models():
         print(f"  Treatment F1: {metrics.get('treatment_f1', 'N/A'):.4f}")
         print(f"  Status Match: {metrics.get('status', 'N/A'):.4f}")
         print(f"  Prognosis Match: {metrics.get('prognosis', 'N/A'):.4f}")
+        print(f"  Prediction Time: {timings[model]['seconds']:.2f}s "
+              f"({timings[model]['cached']}/{len(chunks)} chunks cached)")
     
     # Determine which model is most accurate overall
     best_model = None
@@ -550,5 +644,22 @@ def evaluate_models():
         else:
             print(f"  {model}: No data available")
 
+    print(f"\nEvaluated {len(chunks)} chunks with {len(MODELS)} models in {time.perf_counter() - start:.2f}s")
+
+def _first_error(model_predictions):
+    return next((p["error"] for p in model_predictions.values() if "error" in p), None)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the NER models on every bundled chunk")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes computing uncached predictions; 0 runs inline (default: one per core)")
+    parser.add_argument("--cache", metavar="PATH", default=EVALUATION_CACHE,
+                        help=f"SQLite prediction cache (default: {EVALUATION_CACHE})")
+    parser.add_argument("--no-cache", action="store_true", help="recompute every prediction")
+    args = parser.parse_args(argv)
+    if args.workers is not None and args.workers < 0:
+        parser.error("--workers must be 0 or more")
+    evaluate_models(args.workers, None if args.no_cache else args.cache)
+
 if __name__ == "__main__":
-    evaluate_models()
+    main()
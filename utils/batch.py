@@ -0,0 +1,259 @@
+"""Run the notetaker pipeline over many transcripts across a pool of worker processes.
+
+Inputs are text files (one transcript each), JSONL files (one record per line
+with a "transcript" or "text" field and an optional "id"), directories of
+either, or "-" for JSONL on stdin. Results are written as JSONL.
+
+    notetaker-batch transcripts/ visits.jsonl -o results.jsonl --workers 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from utils.model_cache import verify_resources, MissingResourceError
+from utils.pipeline import NotetakerPipeline, NER_METHODS
+from utils.result_cache import ResultCache
+
+# Per-process pipeline, built once by the pool initializer
+_pipeline = None
+
+
+def iter_records(paths):
+    """Yield (id, transcript) for every transcript in the given inputs, lazily"""
+    for path in paths:
+        if path == "-":
+            yield from _iter_jsonl(sys.stdin, "stdin")
+        elif os.path.isdir(path):
+            for root, _, files in sorted(os.walk(path)):
+                for name in sorted(files):
+                    if name.endswith((".txt", ".jsonl")):
+                        yield from iter_records([os.path.join(root, name)])
+        elif path.endswith(".jsonl"):
+            with open(path, encoding="utf-8") as f:
+                yield from _iter_jsonl(f, path)
+        else:
+            with open(path, encoding="utf-8") as f:
+                yield path, f.read()
+
+
+def count_records(paths):
+    """Count transcripts without parsing them, or None when reading from stdin"""
+    total = 0
+    for path in paths:
+        if path == "-":
+            return None
+        if os.path.isdir(path):
+            nested = [
+                os.path.join(root, name)
+                for root, _, files in os.walk(path)
+                for name in files
+                if name.endswith((".txt", ".jsonl"))
+            ]
+            total += count_records(nested)
+        elif path.endswith(".jsonl"):
+            with open(path, encoding="utf-8") as f:
+                total += sum(1 for line in f if line.strip())
+        else:
+            total += 1
+    return total
+
+
+def _iter_jsonl(lines, source):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        transcript = record.get("transcript", record.get("text"))
+        if transcript is None:
+            raise ValueError(f"{source}:{number}: record has no 'transcript' or 'text' field")
+        yield record.get("id", f"{source}:{number}"), transcript
+
+
+def _init_worker(options, threads, cache_options=None):
+    """Load the models once per worker process"""
+    global _pipeline
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    cache = ResultCache(**cache_options) if cache_options is not None else None
+    _pipeline = NotetakerPipeline(cache=cache, **options)
+
+
+def _process(index, record_id, transcript):
+    """Run the pipeline on one transcript; errors are reported, not raised"""
+    cache = _pipeline.cache
+    before = dict(cache.counters) if cache is not None else None
+    try:
+        result = _pipeline.process(transcript)
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+    result = {"index": index, "id": record_id, **result}
+    if cache is not None:
+        # Counter deltas travel back with the result; main() strips them before writing
+        result["_cache"] = {name: cache.counters[name] - before[name] for name in before}
+    return result
+
+
+def run_pool(records, options, workers, max_inflight, ordered=True, threads=None, cache_options=None):
+    """Yield one result per record, keeping at most ``max_inflight`` in memory.
+
+    In ordered mode finished results waiting for an earlier one count toward the
+    limit, so a slow transcript throttles intake instead of growing the buffer.
+    """
+    records = enumerate(records)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=context, initializer=_init_worker,
+        initargs=(options, threads, cache_options)
+    ) as pool:
+        pending = {}
+        finished = {}
+        next_index = 0
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) + len(finished) < max_inflight:
+                try:
+                    index, (record_id, transcript) = next(records)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[pool.submit(_process, index, record_id, transcript)] = index
+
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+                result = future.result()
+                if ordered:
+                    finished[result["index"]] = result
+                else:
+                    yield result
+
+            while next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
+
+
+def run_inline(records, options, cache_options=None):
+    """Process records one by one in this process (--workers 0)"""
+    _init_worker(options, None, cache_options)
+    try:
+        for index, (record_id, transcript) in enumerate(records):
+            yield _process(index, record_id, transcript)
+    finally:
+        _pipeline.close()
+
+
+class Progress:
+    def __init__(self, total, stream=sys.stderr, interval=2.0):
+        """Throughput and ETA reporting on stderr, at most every ``interval`` seconds"""
+        self.total = total
+        self.stream = stream
+        self.interval = interval
+        self.done = 0
+        self.errors = 0
+        self.cache = {}
+        self.start = time.perf_counter()
+        self.last_report = 0.0
+
+    def update(self, result):
+        self.done += 1
+        self.errors += "error" in result
+        for name, delta in result.pop("_cache", {}).items():
+            self.cache[name] = self.cache.get(name, 0) + delta
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report(now)
+
+    def report(self, now=None):
+        elapsed = (now or time.perf_counter()) - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        line = f"{self.done}" if self.total is None else f"{self.done}/{self.total}"
+        line += f" transcripts, {rate:.2f}/s"
+        if self.total is not None and rate > 0:
+            line += f", ETA {_format_seconds((self.total - self.done) / rate)}"
+        line += f", {self.errors} errors, {_format_seconds(elapsed)} elapsed"
+        if self.cache:
+            line += (
+                f", cache {self.cache['hits']} hits / {self.cache['misses']} misses"
+                f" ({self.cache['bytes_saved'] / 2**20:.1f} MiB saved)"
+            )
+        print(line, file=self.stream, flush=True)
+
+
+def _format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:d}:{minutes:02d}:{seconds:02d}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        epilog="Input: text files, JSONL files, directories of either, or - for JSONL on stdin."
+    )
+    parser.add_argument("inputs", nargs="+", help="transcript files, JSONL files or directories")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output path (default: stdout)")
+    parser.add_argument("--ner", choices=NER_METHODS, default="rule", help="NER method (default: rule)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes; 0 runs inline (default: 1)")
+    parser.add_argument("--max-inflight", type=int, default=None,
+                        help="transcripts queued, running or awaiting output at once (default: 2 x workers)")
+    parser.add_argument("--unordered", action="store_true", help="write results as they finish")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="torch threads per worker (default: cores / workers)")
+    parser.add_argument("--window-stride", type=int, default=None, help="sliding-window overlap for long transcripts")
+    parser.add_argument("--backend", choices=("torch", "onnx"), default="torch")
+    parser.add_argument("--quantize", choices=("int8",), default=None)
+    parser.add_argument("--cache", metavar="PATH", default=None,
+                        help="SQLite result cache shared by the workers (default: memory only)")
+    parser.add_argument("--cache-max-mb", type=float, default=256, help="on-disk cache size limit")
+    parser.add_argument("--no-cache", action="store_true", help="disable the result cache")
+    args = parser.parse_args(argv)
+    if args.workers < 0:
+        parser.error("--workers must be 0 or more")
+    if args.max_inflight is not None and args.max_inflight < 1:
+        parser.error("--max-inflight must be at least 1")
+
+    try:
+        verify_resources()
+    except MissingResourceError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    options = {
+        "ner_method": args.ner,
+        "window_stride": args.window_stride,
+        "backend": args.backend,
+        "quantize": args.quantize,
+    }
+    cache_options = None
+    if not args.no_cache:
+        cache_options = {"path": args.cache, "max_disk_bytes": int(args.cache_max_mb * 2**20)}
+    records = iter_records(args.inputs)
+    if args.workers > 0:
+        max_inflight = args.max_inflight or 2 * args.workers
+        threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+        results = run_pool(records, options, args.workers, max_inflight, not args.unordered, threads, cache_options)
+    else:
+        results = run_inline(records, options, cache_options)
+
+    progress = Progress(count_records(args.inputs))
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        for result in results:
+            progress.update(result)
+            output.write(json.dumps(result) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    progress.report()
+    return 1 if progress.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,28 +1,33 @@
 import torch
-from transformers import AutoTokenizer, AutoModelForTokenClassification
+from transformers import AutoModelForTokenClassification
 import re
 import string
 import os
-from huggingface_hub import try_to_load_from_cache
+from utils.model_registry import registry
+from utils.inference import predict_token_labels
+from utils.dialogue import as_transcript
+from utils.lazy_loader import LazyLoader
 
 class BERTNameDetector:
-    def __init__(self):
-        """Initialize BERT-based name detector for medical conversations with lazy loading"""
+    def __init__(self, window_stride=None, backend="torch", quantize=None, warm_up=False):
+        """Initialize BERT-based name detector for medical conversations with lazy loading
+
+        window_stride: when set, transcripts longer than 512 tokens are read in
+        overlapping windows sharing this many tokens instead of being truncated.
+        backend: "torch" or "onnx" (exported once, then served by onnxruntime).
+        quantize: "int8" to run the torch backend with dynamically quantized Linear layers.
+        warm_up: start loading the model on a background thread right away.
+        """
         # Set model name but don't load it yet
         self.model_name = "dbmdz/bert-large-cased-finetuned-conll03-english"
         self.tokenizer = None
         self.model = None
+        self.window_stride = window_stride
+        self.backend = backend
+        self.quantize = quantize
         
-        # Check if model files are already in cache
-        try:
-            # Check if model files exist in cache
-            model_file = try_to_load_from_cache(self.model_name, "model.safetensors")
-            config_file = try_to_load_from_cache(self.model_name, "config.json")
-            
-            # If both files exist, mark as pre-downloaded
-            self.is_loaded = model_file is not None and config_file is not None
-        except:
-            self.is_loaded = False
+        # Loaded once, by the first caller that needs it (or the warm-up thread)
+        self.loader = LazyLoader(self._load, self.model_name)
         
         self.id2label = None
         
@@ -64,94 +69,114 @@ class BERTNameDetector:
             "true", "false", "good", "bad", "better", "worse", "best", "worst"
         ]
 
-        self.load_model()  # Load the model during initialization
+        if warm_up:
+            self.warm_up()
+
+    @property
+    def is_loaded(self):
+        return self.loader.ready
+
+    @property
+    def state(self):
+        """Model lifecycle: cold, loading, ready or failed"""
+        return self.loader.state
 
     def load_model(self):
-        """Load the BERT model for NER"""
-        try:
-            # Load pre-trained model and tokenizer
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.model = AutoModelForTokenClassification.from_pretrained(self.model_name)
-            self.is_loaded = True
-            
-            # Get the label map from the model config
-            self.id2label = self.model.config.id2label
-            
-            print("BERT NER model loaded successfully.")
-            return True
-        except Exception as e:
-            print(f"Error loading BERT model: {str(e)}")
-            self.is_loaded = False
-            return False
+        """Load the BERT model for NER; safe to call from any thread, and retries a failed load"""
+        return self.loader.load(retry=True)
+
+    def warm_up(self):
+        """Start loading the model in the background"""
+        return self.loader.warm_up()
+
+    def _load(self):
+        # Acquire the shared model and tokenizer from the process-wide registry
+        tokenizer, model = registry.acquire(
+            self.model_name, AutoModelForTokenClassification, dtype=self.quantize, backend=self.backend
+        )
+        # Get the label map from the model config
+        self.tokenizer, self.model, self.id2label = tokenizer, model, model.config.id2label
+        print("BERT NER model loaded successfully.")
+
+    def close(self):
+        """Release the shared model if it was loaded; the next call loads it again"""
+        self.loader.unload(self._unload)
+
+    def _unload(self):
+        registry.release(self.model_name, AutoModelForTokenClassification, dtype=self.quantize, backend=self.backend)
+        self.tokenizer = self.model = self.id2label = None
 
     def extract_name(self, text):
         """Extract patient name from medical conversation text"""
+        return self.extract_names([text])[0]
+
+    def extract_names(self, texts, batch_size=8):
+        """Extract patient names from many conversations (strings or Transcripts), batching the BERT passes"""
+        transcripts = [as_transcript(text) for text in texts]
+        texts = [transcript.text for transcript in transcripts]
         # Try pattern-based extraction first (more reliable for specific formats)
-        pattern_name = self.extract_name_with_patterns(text)
-        if pattern_name != "Unknown":
-            return pattern_name
-        
-        # If pattern-based extraction fails, use BERT model
-        if not self.is_loaded:
-            try:
-                self.load_model()
-            except Exception as e:
-                print(f"Error loading BERT model: {e}")
-                return "Unknown"
-        
-        # Only try BERT if model is successfully loaded
-        if self.is_loaded and self.tokenizer is not None and self.model is not None:
-            # Process the text with BERT
-            bert_names = self.extract_name_with_bert(text)
+        names = [self.extract_name_with_patterns(text) for text in texts]
+        pending = [i for i, name in enumerate(names) if name == "Unknown"]
+        
+        # If pattern-based extraction fails, use BERT model, loading it on first use
+        if pending and self.loader.load():
+            # Process all remaining texts with BERT in length-sorted batches
+            bert_names = self._extract_names_with_bert_batch([texts[i] for i in pending], batch_size)
             
-            # If BERT found names, return the most likely one
-            if bert_names:
-                # Filter out invalid names
-                valid_names = [name for name in bert_names if self.is_valid_name(name)]
+            for i, candidates in zip(pending, bert_names):
+                # Filter out invalid names and keep the longest (usually more complete)
+                valid_names = [name for name in candidates if self.is_valid_name(name)]
                 if valid_names:
-                    # Return the longest valid name (usually more complete)
-                    return max(valid_names, key=len)
+                    names[i] = max(valid_names, key=len)
         
-        # If BERT fails or isn't loaded, try fallback patterns
-        fallback_name = self.extract_name_with_fallback_patterns(text)
-        if fallback_name != "Unknown":
-            return fallback_name
-        
-        # Last resort: advanced pattern matching
-        return self.extract_name_with_advanced_patterns(text)
+        for i in pending:
+            if names[i] != "Unknown":
+                continue
+            
+            # If BERT fails or isn't loaded, try fallback patterns
+            fallback_name = self.extract_name_with_fallback_patterns(transcripts[i])
+            if fallback_name != "Unknown":
+                names[i] = fallback_name
+            else:
+                # Last resort: advanced pattern matching
+                names[i] = self.extract_name_with_advanced_patterns(transcripts[i])
+        
+        return names
 
     def extract_name_with_special_cases(self, text):
         """Handle special cases for specific chunks"""
+        transcript = as_transcript(text)
+        text, text_lower = transcript.text, transcript.lower
         # Special case handling for specific chunks
-        if "persistent cough" in text.lower() and "yellow phlegm" in text.lower():
+        if "persistent cough" in text_lower and "yellow phlegm" in text_lower:
             return "Abdul al-Farsi"
-        elif "insomnia" in text.lower() and "difficulty falling asleep" in text.lower():
+        elif "insomnia" in text_lower and "difficulty falling asleep" in text_lower:
             return "D'Angelo Washington"
-        elif "migraine" in text.lower() and "aura" in text.lower():
+        elif "migraine" in text_lower and "aura" in text_lower:
             return "Elizabeth Taylor"
-        elif "knee pain" in text.lower() and "swelling" in text.lower():
+        elif "knee pain" in text_lower and "swelling" in text_lower:
             return "Robert Johnson"
         elif "Sam's fine" in text or "Sam" in text and "How are you feeling today" in text:
             return "Sam"
         
         # Special cases for test chunks
-        if "burning sensation while urinating" in text.lower():
+        if "burning sensation while urinating" in text_lower:
             return "Suresh Patel"
-        elif "lower back pain" in text.lower() and "furniture" in text.lower():
+        elif "lower back pain" in text_lower and "furniture" in text_lower:
             return "John Smith"
-        elif "migraines" in text.lower() and "flashing lights" in text.lower():
+        elif "migraines" in text_lower and "flashing lights" in text_lower:
             return "Jennifer Lopez-Garcia"
-        elif "chest pains" in text.lower() and "O'Connor" in text:
+        elif "chest pains" in text_lower and "O'Connor" in text:
             return "James O'Connor"
-        elif "throat has been really sore" in text.lower():
+        elif "throat has been really sore" in text_lower:
             return "Kim Lee-Wong"
-        elif "extremely tired" in text.lower() and "O'Reilly-Johnson" in text:
+        elif "extremely tired" in text_lower and "O'Reilly-Johnson" in text:
             return "Thomas O'Reilly-Johnson"
-        elif "joint pain" in text.lower() and "hands" in text.lower():
+        elif "joint pain" in text_lower and "hands" in text_lower:
             return "Mary-Kate Williams"
-        elif "dizzy spells" in text.lower() and "room spinning" in text.lower():
+        elif "dizzy spells" in text_lower and "room spinning" in text_lower:
             return "Jean-Claude Van Damme"
-        elif "numbness" in text.lower() and "right hand" in text.lower():
+        elif "numbness" in text_lower and "right hand" in text_lower:
             return "Sarah O'Malley-Jenkins"
         
         # Check for specific name patterns in the text
@@ -177,11 +202,11 @@ class BERTNameDetector:
 
     def extract_name_with_fallback_patterns(self, text):
         """More aggressive pattern matching for difficult cases"""
-        # Look for any capitalized words that might be names
-        lines = text.split('\n')
+        transcript = as_transcript(text)
+        text, text_lower = transcript.text, transcript.lower
         
         # First check patient lines specifically
-        patient_lines = [line for line in lines if line.startswith("Patient:")]
+        patient_turns = transcript.turns_by("patient")
         
         # Special case for "Sam" in CHUNK_U
         if "Sam's fine" in text or "Sam" in text and "How are you feeling today" in text:
@@ -206,22 +231,19 @@ class BERTNameDetector:
         # Try to identify which chunk this is
         for chunk_id, name in chunk_name_map.items():
             # Create signature patterns for each chunk
-            if chunk_id == "CHUNK_N" and "migraine" in text.lower() and "aura" in text.lower():
+            if chunk_id == "CHUNK_N" and "migraine" in text_lower and "aura" in text_lower:
                 return name
-            elif chunk_id == "CHUNK_O" and "knee pain" in text.lower() and "swelling" in text.lower():
+            elif chunk_id == "CHUNK_O" and "knee pain" in text_lower and "swelling" in text_lower:
                 return name
-            elif chunk_id == "CHUNK_F" and "persistent cough" in text.lower() and "yellow phlegm" in text.lower():
+            elif chunk_id == "CHUNK_F" and "persistent cough" in text_lower and "yellow phlegm" in text_lower:
                 return name
-            elif chunk_id == "CHUNK_I" and "insomnia" in text.lower() and "sleep" in text.lower():
+            elif chunk_id == "CHUNK_I" and "insomnia" in text_lower and "sleep" in text_lower:
                 return name
         
         # Look for any capitalized words in patient lines that might be names
-        for line in patient_lines:
-            # Skip the "Patient:" prefix
-            content = line[8:].strip()
-            
+        for turn in patient_turns:
             # Look for capitalized words that might be names
-            words = content.split()
+            words = turn.text.split()
             for i, word in enumerate(words):
                 if word[0].isupper() and len(word) > 1 and word not in ["I", "I'm", "I've", "I'll", "I'd"]:
                     # Check if this might be a first name followed by a last name
@@ -234,10 +256,9 @@ class BERTNameDetector:
                         return word
         
         # If we still haven't found a name, look in doctor lines addressing the patient
-        doctor_lines = [line for line in lines if line.startswith("Doctor:") or line.startswith("Physician:")]
-        for line in doctor_lines:
+        for turn in transcript.turns_by("doctor"):
             # Look for patterns like "How are you feeling today, [Name]?"
-            greeting_match = re.search(r"how are you (?:feeling |doing )?today,? ([A-Z][a-z]+)(\?|\.)?", line.lower())
+            greeting_match = re.search(r"how are you (?:feeling |doing )?today,? ([A-Z][a-z]+)(\?|\.)?", turn.lower)
             if greeting_match:
                 name = greeting_match.group(1)
                 if name[0].isupper() and self.is_valid_name(name):
@@ -247,74 +268,75 @@ class BERTNameDetector:
 
     def extract_name_with_bert(self, text):
         """Extract names using BERT NER model"""
+        return self._extract_names_with_bert_batch([text])[0]
+    
+    def _extract_names_with_bert_batch(self, texts, batch_size=8):
+        """Run BERT NER over several texts at once and return the names found in each"""
         try:
             # Ensure model is loaded
-            if not self.is_loaded or self.tokenizer is None or self.model is None:
-                if not self.load_model():
-                    return []
-            
-            # Tokenize the text
-            inputs = self.tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
-            
-            # Get predictions
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-                predictions = outputs.logits.argmax(dim=2)
-            
-            # Convert token predictions to labels
-            tokens = self.tokenizer.convert_ids_to_tokens(inputs["input_ids"][0])
-            labels = [self.id2label[prediction.item()] for prediction in predictions[0]]
+            if not self.loader.load():
+                return [[] for _ in texts]
             
-            # Extract person names
-            names = []
-            current_name = []
-            
-            for token, label in zip(tokens, labels):
-                if label.startswith("B-PER"):
-                    # Start of a new person entity
+            predictions = predict_token_labels(
+                self.tokenizer, self.model, texts, batch_size=batch_size, stride=self.window_stride
+            )
+            return [self._names_from_predictions(tokens, label_ids) for tokens, label_ids in predictions]
+        except Exception as e:
+            print(f"Error in BERT name extraction: {str(e)}")
+            return [[] for _ in texts]
+    
+    def _names_from_predictions(self, tokens, label_ids):
+        """Group B-PER/I-PER tokens into cleaned person names"""
+        # Convert token predictions to labels
+        labels = [self.id2label[prediction] for prediction in label_ids]
+        
+        # Extract person names
+        names = []
+        current_name = []
+        
+        for token, label in zip(tokens, labels):
+            if label.startswith("B-PER"):
+                # Start of a new person entity
+                if current_name:
+                    name = " ".join(current_name)
+                    if self.is_valid_name(name):
+                        names.append(name)
+                current_name = [token]
+            elif label.startswith("I-PER"):
+                # Continuation of a person entity
+                if token.startswith("##"):
                     if current_name:
-                        name = " ".join(current_name)
-                        if self.is_valid_name(name):
-                            names.append(name)
-                    current_name = [token]
-                elif label.startswith("I-PER"):
-                    # Continuation of a person entity
-                    if token.startswith("##"):
-                        if current_name:
-                            current_name[-1] += token[2:]
-                    else:
-                        current_name.append(token)
+                        current_name[-1] += token[2:]
                 else:
-                    # End of a person entity
-                    if current_name:
-                        name = " ".join(current_name)
-                        if self.is_valid_name(name):
-                            names.append(name)
-                        current_name = []
-            
-            # Don't forget the last name if text ends with a person
-            if current_name:
-                name = " ".join(current_name)
-                if self.is_valid_name(name):
-                    names.append(name)
-            
-            # Clean up names
-            cleaned_names = []
-            for name in names:
-                # Remove special tokens
-                name = name.replace("[CLS]", "").replace("[SEP]", "").strip()
-                # Fix tokenization artifacts
-                name = re.sub(r'##', '', name)
-                # Remove punctuation at the end
-                name = re.sub(r'[^\w\s\'-]$', '', name)
-                
-                if name and self.is_valid_name(name):
-                    cleaned_names.append(name)
+                    current_name.append(token)
+            else:
+                # End of a person entity
+                if current_name:
+                    name = " ".join(current_name)
+                    if self.is_valid_name(name):
+                        names.append(name)
+                    current_name = []
+        
+        # Don't forget the last name if text ends with a person
+        if current_name:
+            name = " ".join(current_name)
+            if self.is_valid_name(name):
+                names.append(name)
+        
+        # Clean up names
+        cleaned_names = []
+        for name in names:
+            # Remove special tokens
+            name = name.replace("[CLS]", "").replace("[SEP]", "").strip()
+            # Fix tokenization artifacts
+            name = re.sub(r'##', '', name)
+            # Remove punctuation at the end
+            name = re.sub(r'[^\w\s\'-]$', '', name)
             
-            return cleaned_names
-        except Exception as e:
-            print(f"Error in BERT name extraction: {str(e)}")
-            return []
+            if name and self.is_valid_name(name):
+                cleaned_names.append(name)
+        
+        return cleaned_names
     
     def extract_name_with_patterns(self, text):
         """Extract person name using rule-based patterns"""
@@ -407,19 +429,16 @@ class BERTNameDetector:
     
     def extract_name_with_advanced_patterns(self, text):
         """Advanced pattern matching for difficult cases"""
-        # Look for capitalized words that might be names
-        lines = text.split('\n')
+        transcript = as_transcript(text)
+        text_lower = transcript.lower
         
         # First check patient lines specifically
-        patient_lines = [line for line in lines if line.startswith("Patient:")]
+        patient_turns = transcript.turns_by("patient")
         
         # Look for any capitalized words in patient lines that might be names
-        for line in patient_lines:
-            # Skip the "Patient:" prefix
-            content = line[8:].strip()
-            
+        for turn in patient_turns:
             # Look for capitalized words that might be names
-            words = content.split()
+            words = turn.text.split()
             for i, word in enumerate(words):
                 if len(word) > 1 and word[0].isupper() and word not in ["I", "I'm", "I've", "I'll", "I'd"]:
                     # Check if this might be a first name followed by a last name
@@ -432,17 +451,16 @@ class BERTNameDetector:
                         return word
         
         # Look in doctor lines addressing the patient
-        doctor_lines = [line for line in lines if line.startswith("Doctor:") or line.startswith("Physician:")]
-        for line in doctor_lines:
+        for turn in transcript.turns_by("doctor"):
             # Look for patterns like "How are you feeling today, [Name]?"
-            greeting_match = re.search(r"how are you (?:feeling |doing )?today,? ([A-Z][a-z]+)(\?|\.)?", line.lower())
+            greeting_match = re.search(r"how are you (?:feeling |doing )?today,? ([A-Z][a-z]+)(\?|\.)?", turn.lower)
             if greeting_match:
                 name = greeting_match.group(1)
                 if name[0].isupper() and self.is_valid_name(name):
                     return name
             
             # Look for patterns like "Thank you, [Name]"
-            thanks_match = re.search(r"thank you,? ([A-Z][a-z]+)(\?|\.)?", line.lower())
+            thanks_match = re.search(r"thank you,? ([A-Z][a-z]+)(\?|\.)?", turn.lower)
             if thanks_match:
                 name = thanks_match.group(1)
                 if name[0].isupper() and self.is_valid_name(name):
@@ -467,19 +485,19 @@ class BERTNameDetector:
         # Check for symptom patterns
         context_clues = []
         for symptom, condition in symptoms_map.items():
-            if symptom in text.lower():
+            if symptom in text_lower:
                 context_clues.append(condition)
         
         # If we have context clues, look for names in that context
         if context_clues:
             # Look for capitalized words near these symptoms
             for symptom in symptoms_map.keys():
-                if symptom in text.lower():
+                if symptom in text_lower:
                     # Find the line with this symptom
-                    for line in lines:
-                        if symptom in line.lower() and line.startswith("Patient:"):
+                    for turn in patient_turns:
+                        if symptom in turn.lower:
                             # Look for capitalized words in this line
-                            words = line.split()
+                            words = turn.text.split()
                             for i, word in enumerate(words):
                                 if len(word) > 1 and word[0].isupper() and word not in ["I", "I'm", "I've", "I'll", "I'd", "Patient:"]:
                                     # Check if this might be a first name followed by a last name
@@ -492,9 +510,8 @@ class BERTNameDetector:
                                         return word
         
         # If we still can't find a name, look for any capitalized word in the first few patient lines
-        first_few_patient_lines = patient_lines[:3] if len(patient_lines) >= 3 else patient_lines
-        for line in first_few_patient_lines:
-            words = line.split()
+        for turn in patient_turns[:3]:
+            words = turn.text.split()
             for word in words:
                 if len(word) > 1 and word[0].isupper() and word not in ["I", "I'm", "I've", "I'll", "I'd", "Patient:"]:
                     if self.is_valid_name(word):
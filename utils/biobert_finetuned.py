@@ -1,422 +1,244 @@
-from transformers import AutoTokenizer, AutoModelForTokenClassification
+from transformers import AutoModelForTokenClassification
 # from transformers import DataCollatorForTokenClassification, TrainingArguments, Trainer
 import torch
 import re
 import os
+import copy
+from utils.model_registry import registry
+from utils.model_cache import resolve_model_path
+from utils.inference import predict_token_labels
+from utils.dialogue import as_transcript
+from utils.entity_alignment import align_chunk, gold_entities
+from utils.checkpoints import FINE_TUNED_DIR, checkpoint_revision, latest_checkpoint
+
+# Entity fields filled from the predicted spans of each type; lists keep every distinct span
+ENTITY_FIELDS = {
+    "NAME": ("Patient_Name", False),
+    "SYM": ("Symptoms", True),
+    "DIAG": ("Diagnosis", False),
+    "TREAT": ("Treatment", True),
+    "STAT": ("Current_Status", False),
+    "PROG": ("Prognosis", False),
+}
 
 class FineTunedBioBERTNER:
-    def __init__(self):
+    def __init__(self, window_stride=None, backend="torch", quantize=None, checkpoint=None):
+        # Overlap between 512-token windows for long transcripts (None truncates)
+        self.window_stride = window_stride
+        # "torch" or "onnx", and optionally "int8" weights; fine-tuning needs unquantized torch
+        self.backend = backend
+        self.quantize = quantize
+        # Base model that fine_tune starts from when there is no checkpoint yet
+        self.model_name = "dmis-lab/biobert-base-cased-v1.1"
+        
+        # Define entity labels
+        self.entity_labels = {
+            "O": 0,       # Outside any entity
+            "B-NAME": 1,  # Beginning of name
+            "I-NAME": 2,  # Inside of name
+            "B-SYM": 3,   # Beginning of symptom
+            "I-SYM": 4,   # Inside of symptom
+            "B-DIAG": 5,  # Beginning of diagnosis
+            "I-DIAG": 6,  # Inside of diagnosis
+            "B-TREAT": 7, # Beginning of treatment
+            "I-TREAT": 8, # Inside of treatment
+            "B-STAT": 9,  # Beginning of status
+            "I-STAT": 10, # Inside of status
+            "B-PROG": 11, # Beginning of prognosis
+            "I-PROG": 12  # Inside of prognosis
+        }
+        self.id_labels = {label_id: label for label, label_id in self.entity_labels.items()}
+        
+        # The newest fine-tuned checkpoint unless one is given; its revision changes with every save
+        self.checkpoint = checkpoint or latest_checkpoint()
+        self.checkpoint_revision = None
+        self.model = None
+        self.tokenizer = None
+        # What this instance holds in the registry, for close()
+        self._acquired = None
         try:
-            # Load the model and tokenizer without using Trainer
-            self.model_name = "dmis-lab/biobert-base-cased-v1.1"
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.model = AutoModelForTokenClassification.from_pretrained(self.model_name)
-            
-            # Fallback to BERT-CONLL03 for entity extraction
-            self.bert_model_name = "dbmdz/bert-large-cased-finetuned-conll03-english"
-            self.bert_tokenizer = AutoTokenizer.from_pretrained(self.bert_model_name)
-            self.bert_model = AutoModelForTokenClassification.from_pretrained(self.bert_model_name)
-            
-            # Define entity labels
-            self.entity_labels = {
-                "O": 0,       # Outside any entity
-                "B-NAME": 1,  # Beginning of name
-                "I-NAME": 2,  # Inside of name
-                "B-SYM": 3,   # Beginning of symptom
-                "I-SYM": 4,   # Inside of symptom
-                "B-DIAG": 5,  # Beginning of diagnosis
-                "I-DIAG": 6,  # Inside of diagnosis
-                "B-TREAT": 7, # Beginning of treatment
-                "I-TREAT": 8, # Inside of treatment
-                "B-STAT": 9,  # Beginning of status
-                "I-STAT": 10, # Inside of status
-                "B-PROG": 11, # Beginning of prognosis
-                "I-PROG": 12  # Inside of prognosis
-            }
-            
-            print("Fine-tuned BioBERT model loaded successfully")
+            if self.checkpoint:
+                self.checkpoint_revision = checkpoint_revision(self.checkpoint)
+                # Weights are memory-mapped from model.safetensors (see utils.checkpoints)
+                self.tokenizer, self.model = registry.acquire(
+                    self.checkpoint, AutoModelForTokenClassification,
+                    revision=self.checkpoint_revision, dtype=quantize, backend=backend
+                )
+                self._acquired = "model"
+                num_labels = self.model.config.num_labels
+                if num_labels != len(self.entity_labels):
+                    self.close()
+                    raise ValueError(f"{self.checkpoint} predicts {num_labels} labels, not {len(self.entity_labels)}")
+                print(f"Fine-tuned BioBERT model loaded from {self.checkpoint}")
+            else:
+                # Nothing to serve yet; the base tokenizer is enough to prepare training data
+                self.tokenizer = registry.acquire_tokenizer(self.model_name)
+                self._acquired = "tokenizer"
+                print("No fine-tuned BioBERT checkpoint found; train one with python -m utils.train_biobert_finetuned")
         except Exception as e:
             print(f"Error loading fine-tuned BioBERT model: {str(e)}")
             self.model = None
-            self.tokenizer = None
-            self.bert_model = None
-            self.bert_tokenizer = None
+    
+    def close(self):
+        """Release the checkpoint (or base tokenizer) this instance took from the shared registry"""
+        self._release()
+        self.tokenizer = self.model = None
+    
+    def _release(self):
+        if self._acquired == "model":
+            registry.release(
+                self.checkpoint, AutoModelForTokenClassification,
+                revision=self.checkpoint_revision, dtype=self.quantize, backend=self.backend
+            )
+        elif self._acquired == "tokenizer":
+            registry.release_tokenizer(self.model_name)
+        self._acquired = None
     
     def extract_entities(self, text):
-        """Extract medical entities from text using fine-tuned BioBERT"""
+        """Extract medical entities from text (a string or Transcript) using fine-tuned BioBERT"""
+        return self.extract_entities_many([text])[0]
+    
+    def extract_entities_many(self, texts, batch_size=8):
+        """Extract entities from many texts, each with one forward pass of the fine-tuned model.
+
+        Every field comes from the same predicted labels: the first NAME, DIAG,
+        STAT and PROG span, and every distinct SYM and TREAT span.
+        """
         if self.model is None or self.tokenizer is None:
-            return {"Patient_Name": None, "Symptoms": [], "Diagnosis": None, 
-                    "Treatment": [], "Current_Status": None, "Prognosis": None}
+            return [self._empty_entities() for _ in texts]
         
         try:
-            # Extract patient name using BERT-CONLL03
-            patient_name = self._extract_patient_name(text)
-            
-            # Extract medical entities using BioBERT
-            entities = {
-                "Patient_Name": patient_name,
-                "Symptoms": self._extract_symptoms(text),
-                "Diagnosis": self._extract_diagnosis(text),
-                "Treatment": self._extract_treatment(text),
-                "Current_Status": self._extract_status(text),
-                "Prognosis": self._extract_prognosis(text)
-            }
-            
-            return entities
+            # Length-sorted batches, windowing long transcripts if configured
+            predictions = predict_token_labels(
+                self.tokenizer, self.model, [str(as_transcript(text)) for text in texts],
+                batch_size=batch_size, stride=self.window_stride
+            )
+            return [self._entities_from_predictions(tokens, label_ids) for tokens, label_ids in predictions]
         except Exception as e:
             print(f"Error extracting entities with fine-tuned BioBERT: {str(e)}")
-            return {"Patient_Name": None, "Symptoms": [], "Diagnosis": None, 
-                    "Treatment": [], "Current_Status": None, "Prognosis": None}
+            return [self._empty_entities() for _ in texts]
     
     def extract_name(self, text):
         """Extract patient name from text using the fine-tuned model"""
-        if self.model is None or self.tokenizer is None:
-            return None
-
-        try:
-            # Tokenize the input text
-            inputs = self.tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=512)
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-
-            # Get the predicted labels
-            predictions = torch.argmax(outputs.logits, dim=2)
-            tokens = self.tokenizer.convert_ids_to_tokens(inputs["input_ids"][0])
-
-            # Extract name entities based on the predicted labels
-            name_tokens = []
-            current_name = []
-
-            for token, pred in zip(tokens, predictions[0]):
-                if pred in [self.entity_labels["B-NAME"], self.entity_labels["I-NAME"]]:
-                    if token.startswith("##"):
-                        if current_name:
-                            current_name.append(token[2:])  # Remove '##' from subword tokens
-                    else:
-                        if current_name:
-                            name_tokens.append(" ".join(current_name))
-                            current_name = []
-                        current_name.append(token)
-                else:
-                    if current_name:
-                        name_tokens.append(" ".join(current_name))
-                        current_name = []
-
-            if current_name:
-                name_tokens.append(" ".join(current_name))
-
-            # Clean up the extracted names
-            cleaned_names = [" ".join(name.split()) for name in name_tokens if name]
-
-            # Return the first valid name found
-            return cleaned_names[0] if cleaned_names else None
-
-        except Exception as e:
-            print(f"Error in fine-tuned name extraction: {str(e)}")
-            return None
-    
-    def _extract_patient_name(self, text):
-        """Extract patient name using BERT-CONLL03"""
-        if self.bert_model is None or self.bert_tokenizer is None:
-            return None
-        
-        try:
-            # Use BERT-CONLL03 for name extraction
-            inputs = self.bert_tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
-            with torch.no_grad():
-                outputs = self.bert_model(**inputs)
-            
-            # Process outputs to extract person names
-            predictions = torch.argmax(outputs.logits, dim=2)
-            tokens = self.bert_tokenizer.convert_ids_to_tokens(inputs["input_ids"][0])
-            
-            # Extract person names (assuming label 1 is for person)
-            person_tokens = []
-            current_person = []
-            
-            for token, prediction in zip(tokens, predictions[0]):
-                if prediction == 1:  # Person label
-                    if token.startswith("##"):
-                        if current_person:
-                            current_person.append(token[2:])
-                    else:
-                        if current_person:
-                            person_tokens.append(" ".join(current_person))
-                            current_person = []
-                        current_person.append(token)
-                else:
-                    if current_person:
-                        person_tokens.append(" ".join(current_person))
-                        current_person = []
-            
-            if current_person:
-                person_tokens.append(" ".join(current_person))
-            
-            # Clean up person tokens
-            cleaned_persons = []
-            for person in person_tokens:
-                if person not in ["[CLS]", "[SEP]"] and not person.startswith("##"):
-                    # Handle special characters in names
-                    person = re.sub(r'\s+([\'"\-])\s+', r'\1', person)
-                    cleaned_persons.append(person)
-            
-            # Return the first person found or None
-            return cleaned_persons[0] if cleaned_persons else None
-        
-        except Exception as e:
-            print(f"Error in BioBERT name extraction: {str(e)}")
-            return None
-    
-    def _extract_symptoms(self, text):
-        """Extract symptoms from text"""
-        # Simple rule-based extraction for symptoms
-        symptom_patterns = [
-            r"(pain|ache|discomfort) in (\w+)",
-            r"(headache|migraine|fever|cough|nausea|vomiting|dizziness|fatigue)",
-            r"(shortness of breath|chest pain|back pain|stomach pain)",
-            r"feeling (tired|dizzy|nauseous|weak)",
-            r"(sore|swollen|stiff) (throat|joints|muscles)"
-        ]
-        
-        symptoms = []
-        for pattern in symptom_patterns:
-            matches = re.finditer(pattern, text.lower())
-            for match in matches:
-                symptoms.append(match.group(0))
-        
-        return symptoms
+        return self.extract_names([text])[0]
     
-    def _extract_diagnosis(self, text):
-        """Extract diagnosis from text"""
-        # Simple rule-based extraction for diagnosis
-        diagnosis_patterns = [
-            r"diagnosed with (\w+)",
-            r"diagnosis[:\s]+(\w+)",
-            r"condition[:\s]+(\w+)"
-        ]
-        
-        for pattern in diagnosis_patterns:
-            match = re.search(pattern, text.lower())
-            if match:
-                return match.group(1)
-        
-        return None
+    def extract_names(self, texts, batch_size=8):
+        """Extract patient names from many texts with the fine-tuned model in length-sorted batches"""
+        return [entities["Patient_Name"] for entities in self.extract_entities_many(texts, batch_size)]
     
-    def _extract_treatment(self, text):
-        """Extract treatment from text"""
-        # Simple rule-based extraction for treatment
-        treatment_patterns = [
-            r"(prescribed|recommended) (\w+)",
-            r"treatment[:\s]+(\w+)",
-            r"(medication|medicine)[:\s]+(\w+)"
-        ]
-        
-        treatments = []
-        for pattern in treatment_patterns:
-            matches = re.finditer(pattern, text.lower())
-            for match in matches:
-                treatments.append(match.group(0))
-        
-        return treatments
+    @staticmethod
+    def _empty_entities():
+        return {"Patient_Name": None, "Symptoms": [], "Diagnosis": None, 
+                "Treatment": [], "Current_Status": None, "Prognosis": None}
     
-    def _extract_status(self, text):
-        """Extract current status from text"""
-        # Simple rule-based extraction for status
-        status_patterns = [
-            r"currently (\w+)",
-            r"status[:\s]+(\w+)",
-            r"condition is (\w+)"
-        ]
-        
-        for pattern in status_patterns:
-            match = re.search(pattern, text.lower())
-            if match:
-                return match.group(1)
-        
-        return None
+    def _entities_from_predictions(self, tokens, label_ids):
+        """Fill the entity fields from one text's predicted B-/I- labels"""
+        entities = self._empty_entities()
+        for entity_type, span in self._spans(tokens, label_ids):
+            field, many = ENTITY_FIELDS[entity_type]
+            if many:
+                if span not in entities[field]:
+                    entities[field].append(span)
+            elif entities[field] is None:
+                entities[field] = span
+        return entities
     
-    def _extract_prognosis(self, text):
-        """Extract prognosis from text"""
-        # Simple rule-based extraction for prognosis
-        prognosis_patterns = [
-            r"prognosis[:\s]+(\w+)",
-            r"expected to (\w+)",
-            r"outlook[:\s]+(\w+)"
-        ]
-        
-        for pattern in prognosis_patterns:
-            match = re.search(pattern, text.lower())
-            if match:
-                return match.group(1)
-        
-        return None
+    def _spans(self, tokens, label_ids):
+        """(entity type, text) of every labelled span, with subword tokens joined back into words"""
+        special_tokens = set(self.tokenizer.all_special_tokens)
+        spans = []
+        current_type, current = None, []
+        
+        def close():
+            if current:
+                # Join hyphens and apostrophes back to their words, and periods and commas to the word before
+                text = re.sub(r'\s+([\'"\-])\s+', r'\1', " ".join(current))
+                text = re.sub(r'\s+([.,])', r'\1', text)
+                spans.append((current_type, " ".join(text.split())))
+        
+        for token, label_id in zip(tokens, label_ids):
+            label = self.id_labels.get(label_id, "O")
+            if token in special_tokens:
+                label = "O"
+            if token.startswith("##"):
+                # A word piece belongs to the span its word started
+                if current:
+                    current[-1] += token[2:]
+                continue
+            if label.startswith("I-") and label[2:] == current_type and current:
+                current.append(token)
+                continue
+            close()
+            current_type, current = (label[2:], [token]) if label != "O" else (None, [])
+        close()
+        return spans
     
     def prepare_training_data(self, chunks, outputs):
-        """Prepare training data from chunks and expected outputs"""
+        """Prepare training data from chunks and expected outputs
+
+        Gold entities are found in each chunk's text and mapped onto tokens
+        through the tokenizer's offsets (see ``utils.entity_alignment``).
+        """
         print("Starting to prepare training data...")
         training_data = []
         
         for i, (chunk, output) in enumerate(zip(chunks, outputs)):
             print(f"Processing chunk {i+1}/{len(chunks)}")
-            # Get patient name from output - ensure it's not None
-            patient_name = output.get("Patient_Name", "Unknown")
-            if patient_name is None:
-                patient_name = "Unknown"
-            
-            # Process the chunk text
-            lines = chunk.split('\n')
-            for line in lines:
-                # Skip empty lines
-                if not line.strip():
-                    continue
-                
-                # Tokenize the line
-                tokens = self.tokenizer.tokenize(line)
-                if not tokens:
-                    continue
-                
-                # Create labels for each token
-                labels = ["O"] * len(tokens)
-                
-                # Label patient name if present
-                if patient_name != "Unknown":
-                    # Handle tokenization of patient name properly
-                    name_parts = patient_name.split()
-                    for name_part in name_parts:
-                        # Find name part in tokens
-                        for i, token in enumerate(tokens):
-                            # Check if token matches start of name part
-                            if token.lower() == name_part.lower() or token.lower() == name_part.lower().replace("##", ""):
-                                labels[i] = "B-NAME"
-                                # Check following tokens for rest of name part
-                                for j in range(i+1, len(tokens)):
-                                    if j < len(tokens) and tokens[j].startswith("##"):
-                                        labels[j] = "I-NAME"
-                                    else:
-                                        break
-                
-                # Label symptoms - ensure it's a list
-                symptoms = output.get("Symptoms", [])
-                if symptoms is None:
-                    symptoms = []
-                elif isinstance(symptoms, str):
-                    symptoms = [symptoms]
-                    
-                for symptom in symptoms:
-                    if symptom:  # Check if symptom is not empty
-                        self._label_entity(tokens, labels, symptom, "SYM")
-                
-                # Label diagnosis - ensure it's a string
-                diagnosis = output.get("Diagnosis", "")
-                if diagnosis is not None:
-                    self._label_entity(tokens, labels, diagnosis, "DIAG")
-                
-                # Label treatments - ensure it's a list
-                treatments = output.get("Treatment", [])
-                if treatments is None:
-                    treatments = []
-                elif isinstance(treatments, str):
-                    treatments = [treatments]
-                    
-                for treatment in treatments:
-                    if treatment:  # Check if treatment is not empty
-                        self._label_entity(tokens, labels, treatment, "TREAT")
-                
-                # Label current status - ensure it's a string
-                current_status = output.get("Current_Status", "")
-                if current_status is not None:
-                    self._label_entity(tokens, labels, current_status, "STAT")
-                
-                # Label prognosis - ensure it's a string
-                prognosis = output.get("Prognosis", "")
-                if prognosis is not None:
-                    self._label_entity(tokens, labels, prognosis, "PROG")
-                
-                # Add to training data
-                training_data.append({
-                    "tokens": tokens,
-                    "labels": labels
-                })
+            training_data.extend(align_chunk(self.tokenizer, chunk, gold_entities(output)))
         
         print(f"Training data preparation complete. Generated {len(training_data)} examples.")
         return training_data
     
-    def _label_entity(self, tokens, labels, entity, entity_type):
-        """Label tokens that match an entity"""
-        if not entity:
-            return
-        
-        # Convert to lowercase for case-insensitive matching
-        entity_lower = entity.lower()
-        tokens_lower = [t.lower() for t in tokens]
-        
-        # Try to find the entity in the tokens
-        entity_tokens = self.tokenizer.tokenize(entity)
-        if not entity_tokens:
-            return
-        
-        entity_tokens_lower = [t.lower() for t in entity_tokens]
-        
-        # Look for the entity in the tokens
-        for i in range(len(tokens) - len(entity_tokens) + 1):
-            match = True
-            for j in range(len(entity_tokens)):
-                if i+j >= len(tokens) or tokens_lower[i+j] != entity_tokens_lower[j]:
-                    match = False
-                    break
-            
-            if match:
-                # Label the entity
-                labels[i] = f"B-{entity_type}"
-                for j in range(1, len(entity_tokens)):
-                    if i+j < len(labels):
-                        labels[i+j] = f"I-{entity_type}"
-    
-    def fine_tune(self, training_data, epochs=3, batch_size=8):
-        """Fine-tune the model on training data"""
+    def fine_tune(self, training_data, epochs=3, batch_size=8, num_workers=None):
+        """Fine-tune the model on training data
+
+        ``training_data`` comes from ``prepare_training_data`` or is a
+        TokenizedCorpus built from it. Training continues from the loaded
+        checkpoint, or starts from base BioBERT with a new head, and saves to a
+        new ``checkpoint-*`` directory under ``FINE_TUNED_DIR``, whose path it
+        returns. Batches are grouped by length and padded per batch;
+        ``num_workers`` loader processes prepare them (default: up to four).
+        Tokens/sec and the padding ratio are logged every epoch.
+        """
         print("Starting fine-tuning process...")
         
-        # Convert string labels to IDs
-        for item in training_data:
-            item["label_ids"] = [self.entity_labels.get(label, 0) for label in item["labels"]]
-            # Remove the string labels to avoid confusion
-            del item["labels"]
-        
-        # Create a dataset with padding
-        class MedicalNERDataset(torch.utils.data.Dataset):
-            def __init__(self, data, tokenizer, entity_labels):
-                self.data = data
-                self.tokenizer = tokenizer
-                self.entity_labels = entity_labels
-                # Find max length for padding
-                self.max_length = max([len(item["tokens"]) for item in data])
-                print(f"Max sequence length: {self.max_length}")
-            
-            def __len__(self):
-                return len(self.data)
-            
-            def __getitem__(self, idx):
-                item = self.data[idx]
-                # Convert tokens to IDs
-                input_ids = self.tokenizer.convert_tokens_to_ids(item["tokens"])
-                attention_mask = [1] * len(input_ids)
-                labels = item["label_ids"]
-                
-                # Pad sequences to max_length
-                padding_length = self.max_length - len(input_ids)
-                if padding_length > 0:
-                    input_ids = input_ids + [self.tokenizer.pad_token_id] * padding_length
-                    attention_mask = attention_mask + [0] * padding_length
-                    labels = labels + [self.entity_labels["O"]] * padding_length
-                
-                return {
-                    "input_ids": torch.tensor(input_ids, dtype=torch.long),
-                    "attention_mask": torch.tensor(attention_mask, dtype=torch.long),
-                    "labels": torch.tensor(labels, dtype=torch.long)
-                }
-        
-        # Create the dataset
-        print("Creating dataset...")
-        dataset = MedicalNERDataset(training_data, self.tokenizer, self.entity_labels)
+        if self.backend != "torch" or self.quantize:
+            print("Fine-tuning needs the unquantized PyTorch backend; create the model with backend=\"torch\"")
+            return
         
-      
\ No newline at end of file
+        # Imported here so inference never pays for the Trainer machinery
+        from utils.ner_training import train_token_classifier
+        
+        if self.model is None:
+            # First fine-tuning: BioBERT with a new classification head for our labels
+            source = resolve_model_path(self.model_name)
+            self.model = AutoModelForTokenClassification.from_pretrained(
+                source or self.model_name, num_labels=len(self.entity_labels),
+                id2label=self.id_labels, label2id=self.entity_labels,
+                **({"local_files_only": True} if source else {})
+            )
+        else:
+            # Continue from the checkpoint on a private copy, so the weights shared through the registry stay untouched
+            self.model = copy.deepcopy(self.model)
+        # From here on this instance serves its own model; drop its hold on the shared one
+        self._release()
+        
+        # Convert string labels to IDs; a TokenizedCorpus already holds them
+        if isinstance(training_data, list):
+            for item in training_data:
+                item["label_ids"] = [self.entity_labels.get(label, 0) for label in item["labels"]]
+                # Remove the string labels to avoid confusion
+                del item["labels"]
+        
+        trainer = train_token_classifier(
+            self.model, self.tokenizer, training_data, FINE_TUNED_DIR, epochs=epochs, batch_size=batch_size,
+            num_workers=num_workers, learning_rate=3e-5, weight_decay=0.01, warmup_ratio=0.1, logging_steps=10
+        )
+        
+        # This instance now serves the model it trained, saved to a new checkpoint-* directory
+        self.model.eval()
+        output_dir = trainer.checkpoint_dir
+        self.checkpoint = output_dir
+        self.checkpoint_revision = checkpoint_revision(output_dir)
+        print(f"Model fine-tuned and saved to {output_dir}")
+        return output_dir
@@ -1,24 +1,31 @@
 import torch
-from transformers import AutoTokenizer, AutoModelForTokenClassification
+from transformers import AutoModelForTokenClassification
 import re
 from collections import defaultdict
 from utils.name_detector import PersonNameDetector
+from utils.model_registry import registry
+from utils.pattern_matcher import PatternMatcher
+from utils.dialogue import as_transcript
 
 class BioBERTNER:
-    def __init__(self):
+    def __init__(self, window_stride=None, backend="torch", quantize=None):
         """Initialize BioBERT model for medical NER"""
+        self.window_stride = window_stride
+        self.backend = backend
+        self.quantize = quantize
         # Load pre-trained BioBERT model and tokenizer
         self.model_name = "dmis-lab/biobert-base-cased-v1.1"
         try:
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.model = AutoModelForTokenClassification.from_pretrained(self.model_name)
+            self.tokenizer, self.model = registry.acquire(
+                self.model_name, AutoModelForTokenClassification, dtype=quantize, backend=backend
+            )
             self.is_loaded = True
         except Exception as e:
             print(f"Error loading BioBERT model: {str(e)}")
             self.is_loaded = False
         
         # Initialize the name detector
-        self.name_detector = PersonNameDetector()
+        self.name_detector = PersonNameDetector(window_stride=window_stride, backend=backend, quantize=quantize)
         
         # Define patterns for entities not well-captured by BioBERT
         # self.name_patterns = [
@@ -125,6 +132,8 @@ class BioBERTNER:
                 r"(chronic|manageable|reducible|treatable) (condition|disease|disorder)",
             ],
         }
+        # All entity patterns compiled into one matcher, scanned once per text
+        self.entity_matcher = PatternMatcher(self.entity_patterns)
         
         # List of known medical terms that might be confused with names
         self.medical_terms = [
@@ -155,27 +164,42 @@ class BioBERTNER:
             "Maria Garcia-Rodriguez": "Maria Garcia-Rodriguez"
         }
 
+    def close(self):
+        """Release the shared BioBERT and name detector models acquired at construction"""
+        if self.is_loaded:
+            registry.release(
+                self.model_name, AutoModelForTokenClassification, dtype=self.quantize, backend=self.backend
+            )
+            self.is_loaded = False
+            self.tokenizer = self.model = None
+        self.name_detector.close()
+
     def extract_entities(self, text):
         """Extract medical entities using rule-based patterns with BioBERT knowledge"""
+        return self.extract_entities_many([text])[0]
+    
+    def extract_entities_many(self, texts, batch_size=8):
+        """Extract entities from many texts (strings or Transcripts), batching the name detector's passes"""
+        transcripts = [as_transcript(text) for text in texts]
+        names = self.name_detector.extract_names(transcripts, batch_size)
+        return [self._extract_entities_with_name(transcript, name) for transcript, name in zip(transcripts, names)]
+    
+    def _extract_entities_with_name(self, transcript, name):
+        """Pattern entities of one transcript, given the name detector's patient name"""
+        text, text_lower = transcript.text, transcript.lower
         entities = defaultdict(list)
         
-        # Extract patient name using the transformer-based name detector
-        name = self.name_detector.extract_name(text)
         if name:
             entities["Patient_Name"].append(name)
         else:
             entities["Patient_Name"].append("No Name")
         
-        # Extract other entities using patterns
-        for entity_type, patterns in self.entity_patterns.items():
-            for pattern in patterns:
-                matches = re.finditer(pattern, text, re.IGNORECASE)
-                for match in matches:
-                    entity = match.group(0).strip()
-                    entities[entity_type].append(entity)
+        # Extract other entities using patterns (one scan, same hits and order as re.finditer per pattern)
+        for entity_type, start, end in self.entity_matcher.finditer(text):
+            entities[entity_type].append(text[start:end].strip())
         
         # Special case handling for specific chunks
-        if "sciatica" in text.lower() or "herniated disc" in text.lower():
+        if "sciatica" in text_lower or "herniated disc" in text_lower:
             if "Dr. Patel" in text or "Anil Patel" in text:
                 entities["Patient_Name"] = ["Anil Patel"]
             entities["Diagnosis"] = ["Sciatica or herniated disc"]
@@ -188,7 +212,7 @@ class BioBERTNER:
             if "Tingling" not in entities["Symptoms"]:
                 entities["Symptoms"].append("Tingling")
         
-        if "migraine with aura" in text.lower():
+        if "migraine with aura" in text_lower:
             if "Serious Lee-Wong" in text:
                 entities["Patient_Name"] = ["Serious Lee-Wong"]
             entities["Diagnosis"] = ["Migraine with aura"]
@@ -201,7 +225,7 @@ class BioBERTNER:
             if "Sensitivity to light" not in entities["Symptoms"]:
                 entities["Symptoms"].append("Sensitivity to light")
         
-        if "angina pectoris" in text.lower():
+        if "angina pectoris" in text_lower:
             if "Angina Pectoris" in text:
                 entities["Patient_Name"] = ["Angina Pectoris"]
             entities["Diagnosis"] = ["Coronary artery disease"]
@@ -211,10 +235,12 @@ class BioBERTNER:
                 entities["Symptoms"].append("Shortness of breath")
         
         # Process and clean up the extracted entities
-        return self.process_entities(entities, text)
+        return self.process_entities(entities, transcript)
     
     def process_entities(self, entities, text):
         """Process extracted entities into a structured format"""
+        transcript = as_transcript(text)
+        text, text_lower = transcript.text, transcript.lower
         result = {}
         
         # Process Patient_Name - single string
@@ -236,13 +262,13 @@ class BioBERTNER:
             result["Diagnosis"] = diagnoses[0] if diagnoses else "Unknown diagnosis"
         else:
             # Try to infer diagnosis from text
-            if "whiplash" in text.lower():
+            if "whiplash" in text_lower:
                 result["Diagnosis"] = "Whiplash injury"
-            elif "angina" in text.lower():
+            elif "angina" in text_lower:
                 result["Diagnosis"] = "Angina"
-            elif "sciatica" in text.lower() or "herniated disc" in text.lower():
+            elif "sciatica" in text_lower or "herniated disc" in text_lower:
                 result["Diagnosis"] = "Sciatica or herniated disc"
-            elif "migraine" in text.lower():
+            elif "migraine" in text_lower:
                 result["Diagnosis"] = "Migraine with aura"
             else:
                 result["Diagnosis"] = "Unknown diagnosis"
@@ -260,11 +286,11 @@ class BioBERTNER:
             result["Current_Status"] = statuses[0] if statuses else "Unknown status"
         else:
             # Try to infer current status from text
-            if "past three months" in text.lower():
+            if "past three months" in text_lower:
                 result["Current_Status"] = "Past three months"
-            elif "past week" in text.lower():
+            elif "past week" in text_lower:
                 result["Current_Status"] = "Past week"
-            elif "six weeks" in text.lower():
+            elif "six weeks" in text_lower:
                 result["Current_Status"] = "About six weeks"
             else:
                 result["Current_Status"] = "Unknown status"
@@ -275,11 +301,11 @@ class BioBERTNER:
             result["Prognosis"] = prognoses[0] if prognoses else "Unknown prognosis"
         else:
             # Try to infer prognosis from text
-            if "full recovery" in text.lower():
+            if "full recovery" in text_lower:
                 result["Prognosis"] = "Full recovery expected"
-            elif "2-3 weeks" in text.lower():
+            elif "2-3 weeks" in text_lower:
                 result["Prognosis"] = "Improvement expected within 2-3 weeks"
-            elif "proper management" in text.lower():
+            elif "proper management" in text_lower:
                 result["Prognosis"] = "Manageable with proper treatment"
             else:
                 result["Prognosis"] = "Unknown prognosis"
@@ -301,6 +327,7 @@ class BioBERTNER:
 
     def extract_name(self, text):
         """Extract person name from text using the name detector"""
+        text = str(text)
         # Check for special case names first
         for name, full_name in self.specific_names.items():
             if name in text:
@@ -0,0 +1,104 @@
+"""Find fine-tuned checkpoints and load them with memory-mapped safetensors weights."""
+import glob
+import os
+import shutil
+import time
+from safetensors import safe_open
+from transformers import AutoConfig
+from transformers.modeling_utils import no_init_weights
+
+# Where fine_tune saves the model; NOTETAKER_FINE_TUNED_BIOBERT points elsewhere
+FINE_TUNED_DIR = os.environ.get("NOTETAKER_FINE_TUNED_BIOBERT", "./fine_tuned_biobert")
+# Trainer's checkpoint-N directories, in one run-* directory per training run
+TRAINER_OUTPUT_DIR = "./results"
+
+# A checkpoint loads on its own only with all of these
+CHECKPOINT_FILES = ("config.json", "model.safetensors", "tokenizer_config.json")
+
+
+def latest_checkpoint(roots=(FINE_TUNED_DIR, TRAINER_OUTPUT_DIR)):
+    """Absolute path of the most recently written checkpoint under ``roots``, or None.
+
+    Each root counts itself, its ``checkpoint-*`` subdirectories and those of
+    its ``run-*`` directories, so a training run that was stopped part way
+    still leaves its last epoch.
+    """
+    candidates = []
+    for root in roots:
+        paths = [root] + glob.glob(os.path.join(root, "checkpoint-*"))
+        paths += glob.glob(os.path.join(root, "run-*", "checkpoint-*"))
+        for path in paths:
+            if all(os.path.isfile(os.path.join(path, name)) for name in CHECKPOINT_FILES):
+                candidates.append((_weights_mtime(path), os.path.abspath(path)))
+    return max(candidates)[1] if candidates else None
+
+
+def checkpoint_revision(path):
+    """Tag of the weights in a checkpoint directory, changed by every save; None without one"""
+    if not path:
+        return None
+    stat = os.stat(os.path.join(path, "model.safetensors"))
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def run_id():
+    """Name of one training run: torchrun's run id (shared by its processes), else the start time"""
+    run = os.environ.get("TORCHELASTIC_RUN_ID")
+    # torchrun without --standalone or --rdzv-id names every run "none"
+    return run if run and run != "none" else time.strftime("%Y%m%d-%H%M%S")
+
+
+def publish_checkpoint(save, root=FINE_TUNED_DIR, keep=3):
+    """Write a checkpoint with ``save(directory)`` into a new ``checkpoint-*`` directory under ``root``.
+
+    Files of an existing checkpoint are never rewritten: a process serving
+    one has its weights memory-mapped, and truncating the file under the map
+    crashes it or mixes old and new weights. The checkpoint is written to a
+    hidden directory first and renamed into place, so ``latest_checkpoint``
+    never sees it half written. All but the ``keep`` newest checkpoints under
+    ``root`` are then removed; processes still mapping them keep their pages.
+    Returns the absolute path of the new checkpoint.
+    """
+    os.makedirs(root, exist_ok=True)
+    stamp = f"{time.time_ns():x}"
+    staging = os.path.join(root, f".staging-{stamp}-{os.getpid()}")
+    try:
+        save(staging)
+        path = os.path.abspath(os.path.join(root, f"checkpoint-{stamp}"))
+        os.rename(staging, path)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    published = sorted(glob.glob(os.path.join(root, "checkpoint-*")), key=_weights_mtime, reverse=True)
+    for old in published[keep:]:
+        shutil.rmtree(old, ignore_errors=True)
+    return path
+
+
+def _weights_mtime(path):
+    """When a checkpoint's weights were written; 0 without any"""
+    try:
+        return os.path.getmtime(os.path.join(path, "model.safetensors"))
+    except OSError:
+        return 0
+
+
+def load_mmap_model(path, model_class):
+    """Load ``model_class`` from a checkpoint directory without copying its weights.
+
+    The model is built from its config with no weight initialization, then
+    its parameters are pointed at the tensors safetensors maps from
+    ``model.safetensors``. Startup only reads the pages a forward pass
+    touches, and processes serving the same file share them in the page cache.
+    """
+    config = AutoConfig.from_pretrained(path)
+    with no_init_weights():
+        model = model_class.from_config(config)
+    with safe_open(os.path.join(path, "model.safetensors"), framework="pt", device="cpu") as f:
+        state = {name: f.get_tensor(name) for name in f.keys()}
+    missing, _ = model.load_state_dict(state, strict=False, assign=True)
+    if missing:
+        raise ValueError(f"{path} has no weights for {', '.join(missing[:5])}")
+    model.eval()
+    return model
@@ -0,0 +1,124 @@
+import re
+
+# Speaker labels that mean the same participant, by lowercase label
+SPEAKER_ROLES = {
+    "doctor": "doctor",
+    "physician": "doctor",
+    "dr": "doctor",
+    "dr.": "doctor",
+    "patient": "patient",
+}
+
+# "Speaker: utterance", with the label on the same line as its text; trailing blanks are trimmed after
+_TURN = re.compile(r"^[ \t]*([^:\n]*[^:\n \t])[ \t]*:[ \t]*([^\n]*)", re.MULTILINE)
+# Text between runs of sentence-ending punctuation, as re.split(r"[.!?]+") cuts it
+_SENTENCE = re.compile(r"[^.!?]+")
+
+
+class Turn:
+    """One "Speaker: text" line of a transcript.
+
+    ``speaker`` is the label as written, ``role`` its normalized form ("doctor"
+    for Doctor/Physician/Dr, "patient", otherwise the lowercase label) and
+    ``start``/``end`` the offsets of ``text`` in the transcript.
+    """
+
+    __slots__ = ("speaker", "role", "text", "start", "end", "_lower", "_sentences")
+
+    def __init__(self, speaker, text, start, end):
+        self.speaker = speaker
+        self.role = SPEAKER_ROLES.get(speaker.lower(), speaker.lower())
+        self.text = text
+        self.start = start
+        self.end = end
+        self._lower = None
+        self._sentences = None
+
+    @property
+    def lower(self):
+        if self._lower is None:
+            self._lower = self.text.lower()
+        return self._lower
+
+    @property
+    def sentences(self):
+        """Non-empty, stripped sentences of this turn"""
+        if self._sentences is None:
+            self._sentences = [self.text[start:end] for start, end in _sentence_spans(self.text)]
+        return self._sentences
+
+    def __repr__(self):
+        return f"Turn({self.speaker!r}, {self.text!r})"
+
+
+class Transcript:
+    """A conversation parsed once into speaker turns, shared by every stage.
+
+    Build it with ``Transcript(text)`` or ``as_transcript(value)``, which passes
+    an existing Transcript through. The lowercase view, sentence boundaries and
+    per-role text are computed on first use and kept.
+    """
+
+    __slots__ = ("text", "turns", "_lower", "_sentence_spans", "_role_text")
+
+    def __init__(self, text):
+        self.text = text
+        turns = []
+        for match in _TURN.finditer(text):
+            utterance = match.group(2).rstrip(" \t\r")
+            turns.append(Turn(match.group(1), utterance, match.start(2), match.start(2) + len(utterance)))
+        self.turns = tuple(turns)
+        self._lower = None
+        self._sentence_spans = None
+        self._role_text = {}
+
+    @property
+    def lower(self):
+        if self._lower is None:
+            self._lower = self.text.lower()
+        return self._lower
+
+    @property
+    def sentence_spans(self):
+        """(start, end) offsets of every non-empty, stripped sentence in the text"""
+        if self._sentence_spans is None:
+            self._sentence_spans = _sentence_spans(self.text)
+        return self._sentence_spans
+
+    @property
+    def sentences(self):
+        return [self.text[start:end] for start, end in self.sentence_spans]
+
+    def turns_by(self, role):
+        return [turn for turn in self.turns if turn.role == role]
+
+    def role_text(self, role):
+        """Every non-empty utterance by ``role``, joined with spaces"""
+        if role not in self._role_text:
+            self._role_text[role] = " ".join(turn.text for turn in self.turns if turn.role == role and turn.text)
+        return self._role_text[role]
+
+    def __str__(self):
+        return self.text
+
+    def __len__(self):
+        return len(self.text)
+
+    def __repr__(self):
+        return f"Transcript({len(self.turns)} turns, {len(self.text)} chars)"
+
+
+def as_transcript(value):
+    """Return ``value`` as a Transcript, parsing it if it is a string"""
+    return value if isinstance(value, Transcript) else Transcript(value)
+
+
+def _sentence_spans(text):
+    spans = []
+    for match in _SENTENCE.finditer(text):
+        sentence = match.group()
+        stripped = sentence.strip()
+        if stripped:
+            start = match.start() + len(sentence) - len(sentence.lstrip())
+            spans.append((start, start + len(stripped)))
+    return spans
@@ -0,0 +1,143 @@
+"""BIO labels for NER training, aligned to wordpiece tokens through character offsets.
+
+Every gold entity string of a chunk is located by one trie regex scan of each
+line, and each hit is projected onto tokens with the fast tokenizer's
+``offset_mapping``. Labelling a chunk costs time linear in its length instead of
+a token-by-token comparison per entity, and entities are never re-tokenized.
+"""
+import re
+from utils.pattern_matcher import trie_regex
+
+# Expected-output fields in labelling order; where matches overlap, later fields win
+ENTITY_FIELDS = (
+    ("Symptoms", "SYM"),
+    ("Diagnosis", "DIAG"),
+    ("Treatment", "TREAT"),
+    ("Current_Status", "STAT"),
+    ("Prognosis", "PROG"),
+)
+
+
+def gold_entities(output):
+    """(entity type, text) for every entity of an expected output, in labelling order.
+
+    Each word of ``Patient_Name`` (split at spaces and commas) is a NAME entity, labelled before the rest.
+    """
+    entities = []
+    patient_name = output.get("Patient_Name")
+    if patient_name and patient_name != "Unknown":
+        entities.extend(("NAME", part) for part in re.split(r"[\s,]+", patient_name) if part)
+    for field, entity_type in ENTITY_FIELDS:
+        values = output.get(field)
+        if isinstance(values, str):
+            values = [values]
+        entities.extend((entity_type, value) for value in values or () if value)
+    return entities
+
+
+def align_chunk(tokenizer, chunk, entities):
+    """Tokens and BIO labels of every non-empty line of ``chunk``.
+
+    ``tokenizer`` must be a fast tokenizer. An entity is labelled wherever its
+    text occurs, ignoring case and runs of whitespace, starting at a word and
+    ending at a token boundary; a NAME also takes the rest of the word it
+    starts. Where matches overlap, the entity later in ``entities`` wins.
+    Returns a list of {"tokens", "labels"} items.
+    """
+    if not getattr(tokenizer, "is_fast", False):
+        raise ValueError("Label alignment needs a fast tokenizer (one that returns offset_mapping)")
+    lines = [line for line in chunk.split("\n") if line.strip()]
+    if not lines:
+        return []
+    finder, matches = _compile_entities(entities)
+    encodings = tokenizer(lines, add_special_tokens=False, return_offsets_mapping=True)
+
+    examples = []
+    for index, line in enumerate(lines):
+        tokens = encodings.tokens(index)
+        if not tokens:
+            continue
+        labels = ["O"] * len(tokens)
+        if finder is not None:
+            _label_line(line, encodings["offset_mapping"][index], encodings.word_ids(index), labels, finder, matches)
+        examples.append({"tokens": tokens, "labels": labels})
+    return examples
+
+
+def _normalize(text):
+    return " ".join(text.lower().split())
+
+
+def _compile_entities(entities):
+    """The trie regex over all entity texts and, per text it can report, every entity it implies.
+
+    The regex reports the longest entity at a position; any shorter entity
+    matching there is a prefix of it, so each text maps to (priority, type,
+    normalized length) of itself and all its prefixes that are entities.
+    """
+    by_text = {}
+    for priority, (entity_type, text) in enumerate(entities):
+        text = _normalize(str(text))
+        if text:
+            by_text.setdefault(text, []).append((priority, entity_type))
+    if not by_text:
+        return None, {}
+
+    matches = {}
+    for text in by_text:
+        implied = []
+        for prefix, owners in by_text.items():
+            if text.startswith(prefix):
+                implied.extend((priority, entity_type, len(prefix)) for priority, entity_type in owners)
+        matches[text] = implied
+    # Any run of whitespace matches a space
+    pattern = trie_regex(by_text).replace("\\ ", "\\s+")
+    return re.compile(f"(?=({pattern}))", re.IGNORECASE), matches
+
+
+def _label_line(line, offsets, word_ids, labels, finder, matches):
+    """Label the tokens of one line covered by entity matches, lowest priority first"""
+    # Matches must start on the first token of a word and end on the end of a token
+    word_starts = {
+        start: i for i, (start, end) in enumerate(offsets)
+        if end > start and (i == 0 or word_ids[i] != word_ids[i - 1])
+    }
+    token_ends = {end: i for i, (start, end) in enumerate(offsets) if end > start}
+
+    spans = []
+    for match in finder.finditer(line):
+        first = word_starts.get(match.start())
+        if first is None:
+            continue
+        matched = match.group(1)
+        implied = matches.get(_normalize(matched))
+        if implied is None:
+            continue
+        for priority, entity_type, length in implied:
+            end = _prefix_end(matched, length)
+            last = token_ends.get(match.start() + end)
+            if last is not None and last >= first:
+                spans.append((priority, entity_type, first, last))
+
+    spans.sort()
+    for _, entity_type, first, last in spans:
+        if entity_type == "NAME":
+            # The rest of the word, e.g. the "##e" of "Ann" in "Anne"
+            while last + 1 < len(word_ids) and word_ids[last + 1] is not None and word_ids[last + 1] == word_ids[last]:
+                last += 1
+        labels[first] = f"B-{entity_type}"
+        for i in range(first + 1, last + 1):
+            labels[i] = f"I-{entity_type}"
+
+
+def _prefix_end(matched, length):
+    """End in ``matched`` of its first ``length`` characters once normalized"""
+    consumed = 0
+    for i, char in enumerate(matched):
+        if not char.isspace():
+            consumed += 1
+        elif not matched[i - 1].isspace():
+            consumed += 1
+        if consumed == length:
+            return i + 1
+    return len(matched)
@@ -0,0 +1,187 @@
+import torch
+
+
+def predict_token_labels(tokenizer, model, texts, batch_size=8, max_length=512, stride=None):
+    """Run a token-classification model over many texts in batches.
+
+    Inputs are sorted by token length so each batch is padded only to its own
+    longest member. Returns one (tokens, label_ids) pair per text, in input order.
+
+    With ``stride=None`` each text is truncated to ``max_length`` tokens. With a
+    stride, long texts are split into overlapping windows instead (see
+    ``_merge_token_windows``), so nothing past the first window is dropped.
+    """
+    if not texts:
+        return []
+    if stride is not None:
+        return _predict_token_labels_windowed(tokenizer, model, texts, batch_size, max_length, stride)
+
+    # The fast tokenizers encode the whole list in one call
+    encodings = tokenizer(list(texts), truncation=True, max_length=max_length)
+    features = _features(tokenizer, encodings)
+    window_logits = _run_batches(tokenizer, model, features, batch_size, per_token=True)
+
+    results = []
+    for feature, logits in zip(features, window_logits):
+        tokens = tokenizer.convert_ids_to_tokens(feature["input_ids"])
+        results.append((tokens, logits.argmax(dim=-1).tolist()))
+    return results
+
+
+def predict_sequence_probs(tokenizer, model, texts, batch_size=8, max_length=512, stride=None, max_tokens=None):
+    """Return a (len(texts), num_labels) tensor of class probabilities.
+
+    With a stride, every text is split into overlapping windows, all windows are
+    classified together, and each text's probabilities are the mean over its
+    windows weighted by window length. ``max_tokens`` caps the padded size of a
+    batch, so many short texts share one pass while long ones still split up.
+    """
+    if not texts:
+        return torch.empty(0)
+
+    kwargs = {"truncation": True, "max_length": max_length}
+    if stride is not None:
+        _check_stride(tokenizer, max_length, stride)
+        kwargs.update(stride=stride, return_overflowing_tokens=True)
+    encodings = tokenizer(list(texts), **kwargs)
+    features = _features(tokenizer, encodings)
+    sample_map = encodings["overflow_to_sample_mapping"] if stride is not None else list(range(len(texts)))
+
+    window_logits = torch.stack(
+        _run_batches(tokenizer, model, features, batch_size, per_token=False, max_tokens=max_tokens)
+    )
+    window_probs = torch.nn.functional.softmax(window_logits, dim=-1)
+
+    # Aggregate windows back into one distribution per text
+    weights = torch.tensor([len(feature["input_ids"]) for feature in features], dtype=window_probs.dtype)
+    index = torch.tensor(sample_map, dtype=torch.long)
+    totals = torch.zeros(len(texts), window_probs.shape[1], dtype=window_probs.dtype)
+    totals.index_add_(0, index, window_probs * weights.unsqueeze(1))
+    norms = torch.zeros(len(texts), dtype=window_probs.dtype).index_add_(0, index, weights)
+    return totals / norms.unsqueeze(1)
+
+
+def _predict_token_labels_windowed(tokenizer, model, texts, batch_size, max_length, stride):
+    """Token classification over texts of any length using overlapping windows"""
+    _check_stride(tokenizer, max_length, stride)
+    encodings = tokenizer(
+        list(texts),
+        truncation=True,
+        max_length=max_length,
+        stride=stride,
+        return_overflowing_tokens=True,
+        return_offsets_mapping=True,
+    )
+    features = _features(tokenizer, encodings)
+
+    # Windows from every text go through the model together
+    window_logits = _run_batches(tokenizer, model, features, batch_size, per_token=True)
+    return _merge_token_windows(tokenizer, encodings, window_logits, len(texts))
+
+
+def _merge_token_windows(tokenizer, encodings, window_logits, num_texts):
+    """Stitch per-window token logits back into one token sequence per text.
+
+    Tokens are identified by their character offsets, so a token seen by two
+    overlapping windows is scored once with the mean of both windows' logits.
+    Special tokens are dropped; the merged stream decodes exactly like a single
+    long sequence, so the B-/I- decoders rebuild word-level spans from it.
+    """
+    sample_map = encodings["overflow_to_sample_mapping"]
+
+    # First pass: assign every distinct (start, end) span a position within its text
+    positions = [dict() for _ in range(num_texts)]
+    tokens = [[] for _ in range(num_texts)]
+    window_index = []
+    for window, offsets in enumerate(encodings["offset_mapping"]):
+        sample = sample_map[window]
+        window_tokens = tokenizer.convert_ids_to_tokens(encodings["input_ids"][window])
+        kept, targets = [], []
+        for position, (start, end) in enumerate(offsets):
+            if start == end:
+                continue  # special tokens have empty offsets
+            target = positions[sample].get((start, end))
+            if target is None:
+                target = len(tokens[sample])
+                positions[sample][(start, end)] = target
+                tokens[sample].append(((start, end), window_tokens[position]))
+            kept.append(position)
+            targets.append(target)
+        window_index.append((kept, targets))
+
+    # Second pass: average overlapping logits with one index_add per window
+    num_labels = window_logits[0].shape[-1] if window_logits else 0
+    sums = [torch.zeros(len(sample_tokens), num_labels) for sample_tokens in tokens]
+    counts = [torch.zeros(len(sample_tokens)) for sample_tokens in tokens]
+    for window, (kept, targets) in enumerate(window_index):
+        if not kept:
+            continue
+        sample = sample_map[window]
+        target_index = torch.tensor(targets, dtype=torch.long)
+        sums[sample].index_add_(0, target_index, window_logits[window][kept].float())
+        counts[sample].index_add_(0, target_index, torch.ones(len(kept)))
+
+    results = []
+    for sample in range(num_texts):
+        # Windows are visited in order, but sort by offset to be safe
+        order = sorted(range(len(tokens[sample])), key=lambda i: tokens[sample][i][0])
+        sample_tokens = [tokens[sample][i][1] for i in order]
+        if order:
+            mean_logits = sums[sample][order] / counts[sample][order].unsqueeze(1)
+            labels = mean_logits.argmax(dim=-1).tolist()
+        else:
+            labels = []
+        results.append((sample_tokens, labels))
+    return results
+
+
+def _check_stride(tokenizer, max_length, stride):
+    """Reject strides that would leave no new tokens in each window"""
+    usable = max_length - tokenizer.num_special_tokens_to_add()
+    if stride < 0 or stride >= usable:
+        raise ValueError(f"stride must be between 0 and {usable - 1} for max_length={max_length}, got {stride}")
+
+
+def _features(tokenizer, encodings):
+    """Split a batch encoding into per-sequence model inputs"""
+    keys = [key for key in tokenizer.model_input_names if key in encodings]
+    return [
+        {key: encodings[key][i] for key in keys}
+        for i in range(len(encodings["input_ids"]))
+    ]
+
+
+def _run_batches(tokenizer, model, features, batch_size, per_token, max_tokens=None):
+    """Run the model over features sorted by length with per-batch padding.
+
+    Batches hold at most ``batch_size`` features and, with ``max_tokens``, at most
+    that many tokens once padded to their longest member.
+    Returns one logits tensor per feature, in feature order: (length, num_labels)
+    for token classification, (num_labels,) for sequence classification.
+    """
+    # Sort by length to keep padding waste per batch small
+    order = sorted(range(len(features)), key=lambda i: len(features[i]["input_ids"]))
+    batches = []
+    for i in order:
+        # Sorted ascending, so this feature is the longest of the batch so far
+        padded = (len(batches[-1]) + 1) * len(features[i]["input_ids"]) if batches else 0
+        if not batches or len(batches[-1]) >= batch_size or (max_tokens and padded > max_tokens):
+            batches.append([])
+        batches[-1].append(i)
+
+    results = [None] * len(features)
+    for batch in batches:
+        inputs = tokenizer.pad([features[i] for i in batch], return_tensors="pt")
+
+        with torch.no_grad():
+            logits = model(**inputs).logits
+
+        for row, i in enumerate(batch):
+            if not per_token:
+                results[i] = logits[row]
+                continue
+            length = len(features[i]["input_ids"])
+            offset = inputs["input_ids"].shape[1] - length if tokenizer.padding_side == "left" else 0
+            results[i] = logits[row, offset:offset + length]
+
+    return results
@@ -1,27 +1,18 @@
 import re
-import ssl
 import nltk
 from collections import Counter
+from utils.dialogue import as_transcript
 
 class MedicalKeywordExtractor:
     def __init__(self):
         """Initialize the keyword extractor"""
-        # Fix SSL certificate issue for NLTK downloads
+        # Stopwords are provisioned by `python -m utils.model_cache`; never download here
         try:
-            _create_unverified_https_context = ssl._create_unverified_context
-        except AttributeError:
-            pass
-        else:
-            ssl._create_default_https_context = _create_unverified_https_context
-        
-        # Download NLTK resources if not already downloaded
-        try:
-            nltk.download('stopwords')
             from nltk.corpus import stopwords
             self.stopwords = set(stopwords.words('english'))
         except Exception as e:
-            print(f"Error downloading NLTK resources: {str(e)}")
-            # Fallback stopwords if download fails
+            print(f"NLTK stopwords not available locally: {str(e)}")
+            # Fallback stopwords if the corpus is missing
             self.stopwords = set([
                 'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', 
                 'your', 'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 
@@ -46,33 +37,41 @@ class MedicalKeywordExtractor:
         ])
     
     def extract_keywords(self, text, top_n=10):
-        """Extract keywords from text using a simple approach"""
-        # Convert to lowercase
-        text = text.lower()
+        """Extract keywords from text (a string or Transcript) using a simple approach"""
+        # Count word and bigram frequencies
+        return self.rank_keywords(*self.count_terms(text), top_n)
+    
+    def count_terms(self, text):
+        """(word counts, bigram counts) of a string or Transcript"""
+        # Lowercase view, shared with the other stages when given a Transcript
+        filtered_words = self.filter_words(as_transcript(text).lower)
         
+        # Extract bigrams (pairs of adjacent words)
+        bigrams = []
+        for i in range(len(filtered_words) - 1):
+            bigrams.append(filtered_words[i] + " " + filtered_words[i+1])
+        
+        return Counter(filtered_words), Counter(bigrams)
+    
+    def filter_words(self, text):
+        """Words of three letters or more in lowercase text, minus stopwords"""
         # Simple tokenization using regex
         words = re.findall(r'\b[a-z]{3,}\b', text)
         
         # Remove stopwords
-        filtered_words = [word for word in words if word not in self.stopwords]
-        
-        # Count word frequencies
-        word_counts = Counter(filtered_words)
+        return [word for word in words if word not in self.stopwords]
+    
+    def rank_keywords(self, word_counts, bigram_counts, top_n=10):
+        """Top keywords from word and bigram counts, relevance being each one's share of its counts"""
+        total_words = sum(word_counts.values())
+        total_bigrams = sum(bigram_counts.values())
         
         # Get single word keywords
-        single_keywords = [{"keyword": word, "relevance": count/len(filtered_words)} 
+        single_keywords = [{"keyword": word, "relevance": count/total_words} 
                           for word, count in word_counts.most_common(top_n)]
         
-        # Extract bigrams (pairs of adjacent words)
-        bigrams = []
-        for i in range(len(filtered_words) - 1):
-            bigrams.append(filtered_words[i] + " " + filtered_words[i+1])
-        
-        # Count bigram frequencies
-        bigram_counts = Counter(bigrams)
-        
         # Get bigram keywords
-        bigram_keywords = [{"keyword": bigram, "relevance": count/len(bigrams) if bigrams else 0} 
+        bigram_keywords = [{"keyword": bigram, "relevance": count/total_bigrams if total_bigrams else 0} 
                           for bigram, count in bigram_counts.most_common(top_n//2)]
         
         # Combine and sort by relevance
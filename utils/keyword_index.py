@@ -0,0 +1,166 @@
+"""Rank transcript keywords by TF-IDF against every transcript seen so far.
+
+Document frequencies are kept in a fixed-size hashed table, so the index holds
+the same memory after ten transcripts as after a million, and can be saved to
+an .npz file and picked up again later.
+
+    python -m utils.keyword_index transcripts/ visits.jsonl --index keywords.npz -o keywords.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import numpy as np
+from sklearn.feature_extraction import FeatureHasher
+from utils.keyword import MedicalKeywordExtractor
+
+
+class KeywordIndex:
+    """Corpus-level keyword index over hashed word and bigram document frequencies.
+
+    ``add(transcript)`` counts each distinct word and bigram of one transcript
+    into ``n_features`` hash buckets, in time linear in its length; nothing is
+    refit. ``extract(transcript)`` scores its terms by their share of the
+    transcript (as ``MedicalKeywordExtractor`` does) times a smoothed IDF, so
+    words every visit uses, like "pain", sink below the ones specific to this
+    visit. Terms that collide in a bucket share a document frequency, which
+    only ever overstates it. With an empty index the ranking is the extractor's.
+    """
+
+    def __init__(self, extractor=None, n_features=2**20, path=None):
+        self.extractor = extractor or MedicalKeywordExtractor()
+        self.n_features = n_features
+        self.path = path
+        self.hasher = FeatureHasher(n_features=n_features, input_type="string", alternate_sign=False)
+        self.document_frequencies = np.zeros(n_features, dtype=np.int64)
+        self.num_documents = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return self.num_documents
+
+    def add(self, transcript):
+        """Count one transcript (a string or Transcript) into the document frequencies"""
+        self._add(self.extractor.count_terms(transcript))
+
+    def extract(self, transcript, top_n=10):
+        """Keywords of one transcript, ranked against the documents added so far"""
+        return self._rank(self.extractor.count_terms(transcript), top_n)
+
+    def extract_many(self, transcripts, top_n=10, add=True):
+        """Keywords of many transcripts; with ``add``, all are counted before any is ranked"""
+        counts = [self.extractor.count_terms(transcript) for transcript in transcripts]
+        if add:
+            for terms in counts:
+                self._add(terms)
+        return [self._rank(terms, top_n) for terms in counts]
+
+    def idf(self, terms):
+        """Smoothed IDF of each term, as sklearn's TfidfVectorizer computes it"""
+        if not terms:
+            return np.zeros(0)
+        frequencies = self.document_frequencies[self._columns(terms)]
+        return np.log((1 + self.num_documents) / (1 + frequencies)) + 1
+
+    def save(self, path=None):
+        """Write the index to ``path`` (default: the one it was opened with), atomically"""
+        path = path or self.path
+        if not path:
+            raise ValueError("No path to save the keyword index to")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            # Only the buckets in use are stored
+            columns = np.flatnonzero(self.document_frequencies)
+            temporary = f"{path}.tmp"
+            with open(temporary, "wb") as f:
+                np.savez_compressed(
+                    f, columns=columns, frequencies=self.document_frequencies[columns],
+                    n_features=self.n_features, num_documents=self.num_documents
+                )
+            os.replace(temporary, path)
+
+    def load(self, path):
+        with np.load(path) as data:
+            if int(data["n_features"]) != self.n_features:
+                raise ValueError(
+                    f"{path} was built with n_features={int(data['n_features'])}, not {self.n_features}"
+                )
+            frequencies = np.zeros(self.n_features, dtype=np.int64)
+            frequencies[data["columns"]] = data["frequencies"]
+            with self._lock:
+                self.document_frequencies = frequencies
+                self.num_documents = int(data["num_documents"])
+
+    def _columns(self, terms):
+        """Hash bucket of every term, in order"""
+        # One term per row, so each row's single entry is that term's bucket
+        return self.hasher.transform([term] for term in terms).indices
+
+    def _add(self, terms):
+        word_counts, bigram_counts = terms
+        columns = np.unique(self._columns(list(word_counts) + list(bigram_counts)))
+        with self._lock:
+            self.document_frequencies[columns] += 1
+            self.num_documents += 1
+
+    def _rank(self, terms, top_n):
+        """Top words and bigrams by TF-IDF, in MedicalKeywordExtractor's output format"""
+        word_counts, bigram_counts = terms
+        keywords = (
+            self._top(word_counts, top_n)
+            + self._top(bigram_counts, top_n // 2)
+        )
+        # Stable, so equal scores keep the extractor's words-then-bigrams order
+        keywords.sort(key=lambda keyword: keyword["relevance"], reverse=True)
+        return keywords[:top_n]
+
+    def _top(self, counts, top_n):
+        if not counts or top_n <= 0:
+            return []
+        terms = list(counts)
+        total = sum(counts.values())
+        scores = np.array([counts[term] for term in terms]) / total * self.idf(terms)
+        # Stable, so ties keep first-occurrence order like Counter.most_common
+        order = np.argsort(-scores, kind="stable")[:top_n]
+        return [{"keyword": terms[i], "relevance": float(scores[i])} for i in order]
+
+
+def main(argv=None):
+    # Read inputs like notetaker-batch; imported here so the index itself never pulls in torch
+    from utils.batch import iter_records
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="+", help="transcript files, JSONL files or directories (- for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output path (default: stdout)")
+    parser.add_argument("--index", metavar="PATH", default=None,
+                        help=".npz index to extend and save (default: this run's transcripts only)")
+    parser.add_argument("--top-n", type=int, default=10, help="keywords per transcript (default: 10)")
+    parser.add_argument("--n-features", type=int, default=2**20, help="hash buckets (default: 2**20)")
+    args = parser.parse_args(argv)
+
+    try:
+        index = KeywordIndex(n_features=args.n_features, path=args.index)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    records = list(iter_records(args.inputs))
+    keywords = index.extract_many([transcript for _, transcript in records], args.top_n)
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        for (record_id, _), result in zip(records, keywords):
+            output.write(json.dumps({"id": record_id, "keywords": result}) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if args.index:
+        index.save()
+    print(f"{len(records)} transcripts ranked against {len(index)} in the index", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import threading
+import time
+
+# Lifecycle of a lazily loaded model
+STATES = ("cold", "loading", "ready", "failed")
+
+
+class LazyLoader:
+    """Run a model's loading step exactly once, from whichever thread needs it first.
+
+    ``load()`` calls ``load_fn`` on first use; threads arriving while it runs wait
+    for that one load and share its outcome instead of starting their own. After
+    a failure ``load()`` returns False straight away, unless asked to ``retry``.
+    ``warm_up()`` starts the load on a background thread so the process can be
+    ready before its first request; ``state``, ``load_seconds`` and ``error``
+    tell readiness checks how far it got. ``unload()`` undoes a load.
+    """
+
+    def __init__(self, load_fn, name):
+        self.load_fn = load_fn
+        self.name = name
+        self.state = "cold"
+        self.load_seconds = None
+        self.error = None
+        self._lock = threading.Lock()
+        # Guards the warm-up thread only, so warm_up() never waits for a load in flight
+        self._thread_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def load(self, retry=False):
+        """Load if nobody has yet and return whether the model is ready"""
+        # Fast path once loaded: no lock on every request
+        if self.state == "ready":
+            return True
+        with self._lock:
+            if self.state == "ready":
+                return True
+            if self.state == "failed" and not retry:
+                return False
+            self.state = "loading"
+            start = time.perf_counter()
+            try:
+                self.load_fn()
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                self.state = "failed"
+                print(f"Error loading {self.name}: {self.error}")
+                return False
+            self.load_seconds = time.perf_counter() - start
+            self.error = None
+            self.state = "ready"
+            return True
+
+    def unload(self, unload_fn):
+        """Call ``unload_fn`` if the model is loaded and go back to cold, so the next ``load()`` loads again
+
+        Waits for a load in flight to finish first.
+        """
+        with self._lock:
+            if self.state == "ready":
+                unload_fn()
+            self.state = "cold"
+            self.load_seconds = None
+
+    def warm_up(self):
+        """Start loading on a daemon thread; returns the thread, or None if already loaded"""
+        with self._thread_lock:
+            if self.state == "ready":
+                return None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self.load, kwargs={"retry": True}, name=f"warm-up {self.name}", daemon=True
+                )
+                self._thread.start()
+            return self._thread
+
+    def status(self):
+        return {"state": self.state, "load_seconds": self.load_seconds, "error": self.error}
@@ -0,0 +1,153 @@
+import re
+from collections import Counter
+from utils.dialogue import Transcript, Turn
+
+# Fields NER fills in when a transcript gives it nothing
+ENTITY_DEFAULTS = {
+    "Patient_Name": "No Name",
+    "Symptoms": ["Unknown symptoms"],
+    "Diagnosis": "Unknown diagnosis",
+    "Treatment": ["Unknown treatment"],
+    "Current_Status": "Unknown status",
+    "Prognosis": "Unknown prognosis",
+}
+# Those fallbacks as the NER classes word them; never merged over a real value
+_PLACEHOLDERS = {
+    "No Name", "Unknown", "Unknown symptoms", "Unknown diagnosis", "Unknown treatment",
+    "Unknown status", "Unknown prognosis", "Further testing recommended",
+}
+_LINE_BREAKS = re.compile(r"[\r\n]+")
+
+
+class LiveSession:
+    """A consultation analysed turn by turn while it is still going on.
+
+    ``append_turn(speaker, text)`` folds one new turn into running state:
+
+    - entities: NER runs on the last ``window_turns`` turns only, so model
+      encoding is bounded by that window; list fields are merged in order of
+      first mention and single-value fields keep their latest value.
+    - keywords: word and bigram counts grow by the new turn's words, and rank
+      exactly like ``MedicalKeywordExtractor.extract_keywords`` on the full text.
+    - sentiment: each patient turn adds one point to ``sentiment_timeline``.
+    - SOAP: the turn goes into the generator's section buckets.
+
+    The cost of an update depends on the turn and the window, not on how long
+    the consultation already is. ``entities``, ``keywords()`` and
+    ``soap_note()`` read the current state; ``transcript`` rebuilds the whole
+    conversation for a final batch run.
+    """
+
+    def __init__(self, pipeline=None, window_turns=4):
+        if window_turns < 1:
+            raise ValueError(f"window_turns must be at least 1, got {window_turns}")
+        # A pipeline built here is this session's to close
+        self._owns_pipeline = pipeline is None
+        if pipeline is None:
+            from utils.pipeline import NotetakerPipeline
+            pipeline = NotetakerPipeline()
+        self.pipeline = pipeline
+        self.window_turns = window_turns
+
+        self.turns = []
+        self.lines = []
+        self.length = 0
+        self._entities = {}
+        self.word_counts = Counter()
+        self.bigram_counts = Counter()
+        self._last_word = None
+        self.sentiment_timeline = []
+        self.sections = pipeline.soap_generator.empty_sections()
+
+    def append_turn(self, speaker, text):
+        """Add one "speaker: text" turn and return what it changed"""
+        speaker = speaker.strip()
+        if not speaker or ":" in speaker or "\n" in speaker:
+            raise ValueError(f"Invalid speaker label {speaker!r}")
+        # One turn is one transcript line
+        text = _LINE_BREAKS.sub(" ", text).strip()
+
+        prefix = f"{speaker}: "
+        start = self.length + (1 if self.lines else 0) + len(prefix)
+        turn = Turn(speaker, text, start, start + len(text))
+        line = prefix + text
+        self.turns.append(turn)
+        self.lines.append(line)
+        self.length = turn.end
+
+        entities = self._update_entities()
+        self._update_keywords(line)
+        sentiment = self._update_sentiment(turn, line)
+        sections = self.pipeline.soap_generator.classify_turn(self.sections, turn)
+
+        return {
+            "turn": len(self.turns) - 1,
+            "speaker": speaker,
+            "role": turn.role,
+            "entities": entities,
+            "sentiment": sentiment,
+            "sections": sorted(sections),
+        }
+
+    def _update_entities(self):
+        """Run NER on the newest window and merge what it found"""
+        window = Transcript("\n".join(self.lines[-self.window_turns:]))
+        found = self.pipeline.extract_entities(window)
+        for field, value in found.items():
+            if isinstance(value, list):
+                merged = self._entities.setdefault(field, [])
+                merged.extend(item for item in value if item not in _PLACEHOLDERS and item not in merged)
+            elif value not in _PLACEHOLDERS:
+                # The patient's name is kept once known; other fields follow the conversation
+                if field != "Patient_Name" or field not in self._entities:
+                    self._entities[field] = value
+        return found
+
+    def _update_keywords(self, line):
+        words = self.pipeline.keyword_extractor.filter_words(line.lower())
+        self.word_counts.update(words)
+        # Bigrams run across turns, as they do over the whole text
+        previous = [self._last_word] if self._last_word else []
+        pairs = previous + words
+        self.bigram_counts.update(pairs[i] + " " + pairs[i + 1] for i in range(len(pairs) - 1))
+        if words:
+            self._last_word = words[-1]
+
+    def _update_sentiment(self, turn, line):
+        if turn.role != "patient" or not turn.text:
+            return None
+        result = self.pipeline.sentiment_analyzer.analyze_sentiment(Transcript(line))
+        # Same shape as a point of analyze_sentiment's "Timeline"
+        point = {"turn": len(self.turns) - 1, "Sentiment": result["Sentiment"], "Intent": result["Intent"]}
+        self.sentiment_timeline.append(point)
+        return point
+
+    @property
+    def entities(self):
+        """Entities merged across every window so far, with NER's defaults for the missing fields"""
+        result = {}
+        for field, default in ENTITY_DEFAULTS.items():
+            value = self._entities.get(field) or default
+            result[field] = list(value) if isinstance(value, list) else value
+        return result
+
+    def keywords(self, top_n=10):
+        return self.pipeline.keyword_extractor.rank_keywords(self.word_counts, self.bigram_counts, top_n)
+
+    def soap_note(self):
+        return self.pipeline.soap_generator.build_note(self.sections)
+
+    @property
+    def transcript(self):
+        return Transcript("\n".join(self.lines))
+
+    def close(self):
+        """Release the models of the pipeline this session created, if it did"""
+        if self._owns_pipeline:
+            self.pipeline.close()
+
+    def __len__(self):
+        return len(self.turns)
+
+    def __repr__(self):
+        return f"LiveSession({len(self.turns)} turns)"
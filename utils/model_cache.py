@@ -1,17 +1,156 @@
 import os
+import ssl
+import json
+import threading
+import nltk
 from huggingface_hub import snapshot_download
 
-def download_models():
-    """Pre-download models to cache"""
-    models = [
-        "dmis-lab/biobert-base-cased-v1.1",
-        "dbmdz/bert-large-cased-finetuned-conll03-english",
-        "distilbert-base-uncased-finetuned-sst-2-english"
-    ]
-    
-    for model in models:
+# Hugging Face checkpoints used by the detectors
+MODELS = [
+    "dmis-lab/biobert-base-cased-v1.1",
+    "dbmdz/bert-large-cased-finetuned-conll03-english",
+    "distilbert-base-uncased-finetuned-sst-2-english"
+]
+
+# NLTK resources, mapped to the path nltk.data.find() resolves them by
+NLTK_RESOURCES = {
+    "punkt": "tokenizers/punkt",
+    "stopwords": "corpora/stopwords",
+}
+
+# Written by download_models(), read by verify_resources()
+MANIFEST_PATH = os.environ.get(
+    "NOTETAKER_RESOURCE_MANIFEST",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resource_manifest.json")
+)
+
+
+class MissingResourceError(RuntimeError):
+    """Raised when a model snapshot or NLTK corpus is not available locally"""
+
+
+_lock = threading.Lock()
+_verified_manifest = None
+
+
+def download_models(manifest_path=MANIFEST_PATH):
+    """Provision every model and NLTK corpus, then record them in the local manifest.
+
+    This is the only function that touches the network. Run it once per machine
+    (``python -m utils.model_cache``) before starting the app on offline nodes.
+    """
+    # Fix SSL certificate issue for NLTK downloads
+    try:
+        _create_unverified_https_context = ssl._create_unverified_context
+    except AttributeError:
+        pass
+    else:
+        ssl._create_default_https_context = _create_unverified_https_context
+
+    manifest = {"models": {}, "nltk": {}}
+
+    for model in MODELS:
         try:
-            snapshot_download(model, local_files_only=False)
+            path = snapshot_download(model, local_files_only=False)
+            manifest["models"][model] = {"revision": os.path.basename(path), "path": path}
             print(f"Downloaded {model}")
         except Exception as e:
-            print(f"Error downloading {model}: {e}") 
\ No newline at end of file
+            print(f"Error downloading {model}: {e}")
+
+    for name, resource in NLTK_RESOURCES.items():
+        try:
+            nltk.download(name, quiet=True)
+            manifest["nltk"][name] = _nltk_root(nltk.data.find(resource), resource)
+            print(f"Downloaded NLTK {name}")
+        except Exception as e:
+            print(f"Error downloading NLTK {name}: {e}")
+
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Resource manifest written to {manifest_path}")
+
+    return manifest
+
+
+def verify_resources(manifest_path=MANIFEST_PATH):
+    """Check every required resource against the local manifest, once per process.
+
+    Only the local filesystem is consulted. Raises MissingResourceError naming
+    everything that is missing; after the first success this returns the cached
+    manifest immediately.
+    """
+    global _verified_manifest
+    if _verified_manifest is not None:
+        return _verified_manifest
+
+    with _lock:
+        if _verified_manifest is not None:
+            return _verified_manifest
+
+        if not os.path.exists(manifest_path):
+            raise MissingResourceError(
+                f"Resource manifest {manifest_path} not found. "
+                "Run `python -m utils.model_cache` on a machine with network access first."
+            )
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+        missing = []
+        for model in MODELS:
+            entry = manifest.get("models", {}).get(model)
+            if not entry or not os.path.exists(os.path.join(entry["path"], "config.json")):
+                missing.append(f"model {model}")
+
+        for name, resource in NLTK_RESOURCES.items():
+            root = manifest.get("nltk", {}).get(name)
+            if root and root not in nltk.data.path:
+                nltk.data.path.append(root)
+            try:
+                nltk.data.find(resource)
+            except LookupError:
+                missing.append(f"NLTK {name}")
+
+        if missing:
+            raise MissingResourceError(
+                f"Missing local resources: {', '.join(missing)}. "
+                "Run `python -m utils.model_cache` to provision them."
+            )
+
+        _verified_manifest = manifest
+        return manifest
+
+
+def resolve_model_path(model_id):
+    """Return the verified local snapshot for a model, or None if it has not been verified"""
+    if _verified_manifest is None:
+        return None
+    entry = _verified_manifest["models"].get(model_id)
+    return entry["path"] if entry else None
+
+
+def resource_revisions():
+    """Return {model_id: revision} from the verified manifest, or {} before verification"""
+    if _verified_manifest is None:
+        return {}
+    return {model: entry.get("revision") for model, entry in _verified_manifest["models"].items()}
+
+
+def revision_tag(model_id, source, revision=None):
+    """Name the checkpoint revision a model was loaded from, for keying derived caches"""
+    if source != model_id:
+        # Local snapshot directories are named after the commit hash
+        return os.path.basename(os.path.normpath(source))
+    return revision or "main"
+
+
+def _nltk_root(found_path, resource):
+    """Strip the resource suffix from an nltk.data.find() result to get its data directory"""
+    found_path = str(found_path).rstrip(os.sep)
+    resource = resource.replace("/", os.sep)
+    if found_path.endswith(resource):
+        return found_path[: -len(resource)].rstrip(os.sep)
+    return os.path.dirname(os.path.dirname(found_path))
+
+
+if __name__ == "__main__":
+    download_models()
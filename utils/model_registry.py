@@ -0,0 +1,180 @@
+import os
+import threading
+import torch
+from transformers import AutoTokenizer
+from utils.model_cache import resolve_model_path
+
+# Inference backends a model can be served with
+BACKENDS = ("torch", "onnx")
+
+
+class ModelRegistry:
+    """Process-wide, reference-counted cache of Hugging Face tokenizers and models.
+
+    Every detector acquires its weights from here, so a model requested by several
+    classes (e.g. bert-large-conll03) is materialized once per process.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # (model_id, revision, dtype, model class, backend) -> entry
+        self._models = {}
+        # (model_id, revision) -> entry
+        self._tokenizers = {}
+
+    @staticmethod
+    def _model_key(model_id, model_class, revision=None, dtype=None, backend="torch"):
+        """Build the cache key for a model"""
+        return (model_id, revision, str(dtype) if dtype is not None else None, model_class.__name__, backend)
+
+    def acquire(self, model_id, model_class, revision=None, dtype=None, backend="torch"):
+        """Return a shared (tokenizer, model) pair, loading it on first use"""
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+        key = self._model_key(model_id, model_class, revision, dtype, backend)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is None:
+                tokenizer = self.acquire_tokenizer(model_id, revision)
+                try:
+                    model = self._load_model(model_id, model_class, revision, dtype, backend, tokenizer)
+                except Exception:
+                    self.release_tokenizer(model_id, revision)
+                    raise
+                entry = {
+                    "tokenizer": tokenizer,
+                    "model": model,
+                    "refcount": 0,
+                    "bytes": module_bytes(model),
+                }
+                self._models[key] = entry
+                print(f"Registry loaded {model_id} ({entry['bytes'] / 2**20:.1f} MiB)")
+            entry["refcount"] += 1
+            return entry["tokenizer"], entry["model"]
+
+    def release(self, model_id, model_class, revision=None, dtype=None, backend="torch"):
+        """Drop one reference to a model, freeing it when nobody holds it any more"""
+        key = self._model_key(model_id, model_class, revision, dtype, backend)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is None:
+                return
+            entry["refcount"] -= 1
+            if entry["refcount"] <= 0:
+                del self._models[key]
+                self.release_tokenizer(model_id, revision)
+
+    def acquire_tokenizer(self, model_id, revision=None):
+        """Return a shared tokenizer, loading it on first use"""
+        key = (model_id, revision)
+        with self._lock:
+            entry = self._tokenizers.get(key)
+            if entry is None:
+                source, kwargs = self._source(model_id, revision)
+                entry = {"tokenizer": AutoTokenizer.from_pretrained(source, **kwargs), "refcount": 0}
+                self._tokenizers[key] = entry
+            entry["refcount"] += 1
+            return entry["tokenizer"]
+
+    def release_tokenizer(self, model_id, revision=None):
+        """Drop one reference to a tokenizer"""
+        key = (model_id, revision)
+        with self._lock:
+            entry = self._tokenizers.get(key)
+            if entry is None:
+                return
+            entry["refcount"] -= 1
+            if entry["refcount"] <= 0:
+                del self._tokenizers[key]
+
+    def _load_model(self, model_id, model_class, revision, dtype, backend="torch", tokenizer=None):
+        """Materialize a model in inference mode"""
+        source, kwargs = self._source(model_id, revision)
+        if backend == "onnx":
+            if dtype is not None:
+                raise ValueError("dtype is not supported with the onnx backend")
+            # Imported lazily so onnxruntime stays an optional dependency
+            from utils.onnx_backend import load_onnx_model
+            return load_onnx_model(model_id, model_class, tokenizer, source, **kwargs)
+        if isinstance(dtype, str):
+            from utils.quantization import QUANTIZE_MODES, load_quantized_model
+            if dtype not in QUANTIZE_MODES:
+                raise ValueError(f"Unknown quantization {dtype!r}, expected one of {QUANTIZE_MODES}")
+            return load_quantized_model(model_id, model_class, source, **kwargs)
+        if dtype is None and source == model_id and os.path.isfile(os.path.join(source, "model.safetensors")):
+            # A local checkpoint such as our fine-tuned model: map its weights instead of copying them
+            from utils.checkpoints import load_mmap_model
+            return load_mmap_model(source, model_class)
+        if dtype is not None:
+            kwargs["torch_dtype"] = dtype
+        model = model_class.from_pretrained(source, **kwargs)
+        model.eval()
+        return model
+
+    @staticmethod
+    def _source(model_id, revision):
+        """Pick where to load from: the verified local snapshot if there is one, else the hub id"""
+        path = resolve_model_path(model_id) if not revision else None
+        if path:
+            # Provisioned snapshot; never let from_pretrained reach the network
+            return path, {"local_files_only": True}
+        return model_id, ({"revision": revision} if revision else {})
+
+    def resident_bytes(self):
+        """Return the resident weight bytes of every loaded model, keyed by description"""
+        with self._lock:
+            return {self._describe(key): entry["bytes"] for key, entry in self._models.items()}
+
+    def stats(self):
+        """Return one row per loaded model with its reference count and size"""
+        with self._lock:
+            return [
+                {
+                    "model_id": model_id,
+                    "revision": revision,
+                    "dtype": dtype,
+                    "model_class": class_name,
+                    "backend": backend,
+                    "refcount": entry["refcount"],
+                    "bytes": entry["bytes"],
+                }
+                for (model_id, revision, dtype, class_name, backend), entry in self._models.items()
+            ]
+
+    @staticmethod
+    def _describe(key):
+        model_id, revision, dtype, class_name, backend = key
+        description = model_id
+        if revision:
+            description += f"@{revision}"
+        if dtype:
+            description += f" [{dtype}]"
+        if backend != "torch":
+            description += f" <{backend}>"
+        return f"{description} ({class_name})"
+
+
+def module_bytes(module):
+    """Count the bytes held by a module's parameters and buffers (tied weights once)"""
+    if not hasattr(module, "parameters"):
+        # Non-torch backends report their own size
+        return getattr(module, "nbytes", 0)
+    tensors = list(module.parameters()) + list(module.buffers())
+    # Dynamically quantized Linear layers keep their weights in packed params,
+    # which only show up (unpacked) in the state dict
+    for value in module.state_dict().values():
+        if isinstance(value, tuple):
+            tensors.extend(item for item in value if isinstance(item, torch.Tensor))
+
+    seen = set()
+    total = 0
+    for tensor in tensors:
+        if tensor.data_ptr() in seen:
+            continue
+        seen.add(tensor.data_ptr())
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+# Shared instance used by every detector in the process
+registry = ModelRegistry()
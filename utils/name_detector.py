@@ -1,16 +1,30 @@
 import re
 import string
 import torch
-from transformers import AutoTokenizer, AutoModelForTokenClassification
+from transformers import AutoModelForTokenClassification
+from utils.model_registry import registry
+from utils.inference import predict_token_labels
 
 class PersonNameDetector:
-    def __init__(self):
-        """Initialize the person name detector with a transformer-based NER model"""
+    def __init__(self, window_stride=None, backend="torch", quantize=None):
+        """Initialize the person name detector with a transformer-based NER model
+
+        window_stride: when set, long texts are read in overlapping windows sharing
+        this many tokens instead of being truncated at 512 tokens.
+        backend: "torch" or "onnx".
+        quantize: "int8" for dynamically quantized Linear layers (torch backend).
+        """
+        self.window_stride = window_stride
+        self.backend = backend
+        self.quantize = quantize
+        
         # Load pre-trained NER model and tokenizer
         self.model_name = "dbmdz/bert-large-cased-finetuned-conll03-english"
         try:
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.model = AutoModelForTokenClassification.from_pretrained(self.model_name)
+            # Shared with every other detector using the same checkpoint
+            self.tokenizer, self.model = registry.acquire(
+                self.model_name, AutoModelForTokenClassification, dtype=quantize, backend=backend
+            )
             self.is_loaded = True
             
             # Get the label map from the model config
@@ -68,40 +82,64 @@ class PersonNameDetector:
             "evening", "doctor", "dr", "feeling", "better", "worse", "okay", "fine"
         ]
 
+    def close(self):
+        """Release the shared model acquired at construction; names then come from patterns only"""
+        if self.is_loaded:
+            registry.release(
+                self.model_name, AutoModelForTokenClassification, dtype=self.quantize, backend=self.backend
+            )
+            self.is_loaded = False
+            self.tokenizer = self.model = None
+
     def extract_name(self, text):
         """Extract person name from text using transformer-based NER"""
+        return self.extract_names([text])[0]
+    
+    def extract_names(self, texts, batch_size=8):
+        """Extract person names from many texts (strings or Transcripts), batching the transformer passes"""
+        texts = [str(text) for text in texts]
+        names = [None] * len(texts)
+        
         # Check for special case names first
-        for name, full_name in self.special_names.items():
-            if name in text:
-                return full_name
+        for i, text in enumerate(texts):
+            for name, full_name in self.special_names.items():
+                if name in text:
+                    names[i] = full_name
+                    break
         
         # Try transformer-based approach if model is loaded
-        if self.is_loaded:
+        pending = [i for i, name in enumerate(names) if name is None]
+        if pending and self.is_loaded:
             try:
-                names = self.extract_name_with_transformers(text)
-                if names:
-                    return names[0]  # Return the first valid name found
+                batch_names = self._extract_names_with_transformers_batch([texts[i] for i in pending], batch_size)
+                for i, found in zip(pending, batch_names):
+                    if found:
+                        names[i] = found[0]  # Return the first valid name found
             except Exception as e:
                 print(f"Error in transformer name extraction: {str(e)}")
         
         # Fallback to rule-based approach
-        return self.extract_name_with_patterns(text)
+        for i, name in enumerate(names):
+            if name is None:
+                names[i] = self.extract_name_with_patterns(texts[i])
+        
+        return names
     
     def extract_name_with_transformers(self, text):
         """Extract person names using the transformer model without pipeline API"""
-        # Tokenize the text
-        inputs = self.tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
-        
-        # Get model predictions
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            predictions = torch.argmax(outputs.logits, dim=2)
-        
+        return self._extract_names_with_transformers_batch([text])[0]
+    
+    def _extract_names_with_transformers_batch(self, texts, batch_size=8):
+        """Run the NER model over several texts at once and return the names found in each"""
+        predictions = predict_token_labels(
+            self.tokenizer, self.model, texts, batch_size=batch_size, stride=self.window_stride
+        )
+        return [self._names_from_predictions(tokens, label_ids) for tokens, label_ids in predictions]
+    
+    def _names_from_predictions(self, tokens, label_ids):
+        """Join consecutive person-labelled tokens into validated names"""
         # Convert token predictions to labels
-        token_predictions = [self.id2label[prediction.item()] for prediction in predictions[0]]
-        
-        # Convert tokens to words and align with predictions
-        tokens = self.tokenizer.convert_ids_to_tokens(inputs["input_ids"][0])
+        token_predictions = [self.id2label[prediction] for prediction in label_ids]
         
         # Extract person names
         names = []
@@ -2,6 +2,8 @@
 import re
 from collections import defaultdict
 from utils.name_detector import PersonNameDetector
+from utils.pattern_matcher import PatternMatcher
+from utils.dialogue import as_transcript
 
 '''
 --------------------------------yoyo
@@ -82,6 +84,8 @@ class MedicalNER:
                 r"(migraine|migraines) (headache|pain|ache|discomfort|fever|cough|nausea|vomiting|dizziness|fatigue|weakness)",
             ],
         }
+        # All entity patterns compiled into one matcher, scanned once per text
+        self.entity_matcher = PatternMatcher(self.entity_patterns)
         
         self.name_prefixes = [
             "mr", "mrs", "ms", "miss", "dr", "prof", "professor", 
@@ -131,6 +135,10 @@ class MedicalNER:
         # Initialize the name detector
         self.name_detector = PersonNameDetector()
     
+    def close(self):
+        """Release the name detector's shared model"""
+        self.name_detector.close()
+
     def extract_patient_name(self, text):
         """Extract patient name using transformer-based name detection"""
         return self.name_detector.extract_name(text)
@@ -238,12 +246,14 @@ class MedicalNER:
 
     def extract_entities(self, text):
         """Extract medical entities from text using rule-based patterns"""
+        transcript = as_transcript(text)
+        text, text_lower = transcript.text, transcript.lower
         entities = defaultdict(list)
         
         # First, check for specific names in the text
         specific_names = ["Vishesh", "Surugami", "Maria Garcia-Rodriguez"]
         for name in specific_names:
-            if name.lower() in text.lower() or name in text:
+            if name.lower() in text_lower or name in text:
                 entities["Patient_Name"].append(name)
                 break
         
@@ -291,7 +301,7 @@ class MedicalNER:
                 entities["Patient_Name"].append(candidate_names[0])
         
         # Special case for chest pain scenario with "Is that serious" question
-        if "chest pain" in text.lower() and "past two days" in text.lower():
+        if "chest pain" in text_lower and "past two days" in text_lower:
             # If we haven't found a name yet, set to "No Name"
             if not entities["Patient_Name"]:
                 entities["Patient_Name"].append("No Name")
@@ -299,9 +309,9 @@ class MedicalNER:
             entities["Symptoms"].append("Chest pain")
             entities["Symptoms"].append("Sharp pain")
             entities["Symptoms"].append("Pain radiating to left arm")
-            if "short of breath" in text.lower() or "shortness of breath" in text.lower():
+            if "short of breath" in text_lower or "shortness of breath" in text_lower:
                 entities["Symptoms"].append("Shortness of breath")
-            if "dizzy" in text.lower() or "dizziness" in text.lower():
+            if "dizzy" in text_lower or "dizziness" in text_lower:
                 entities["Symptoms"].append("Dizziness")
             entities["Diagnosis"].append("Angina")
             entities["Treatment"].append("ECG test")
@@ -311,24 +321,22 @@ class MedicalNER:
             entities["Prognosis"].append("Pending test results")
             
             # Skip the rest of the processing
-            return self.process_entities(entities, text)
+            return self.process_entities(entities, transcript)
         
         # If we still don't have a name, set to "No Name"
         if not entities["Patient_Name"]:
             entities["Patient_Name"].append("No Name")
         
-        # Extract other entities using patterns
-        for entity_type, patterns in self.entity_patterns.items():
-            for pattern in patterns:
-                matches = re.finditer(pattern, text, re.IGNORECASE)
-                for match in matches:
-                    entity = match.group(0).strip()
-                    entities[entity_type].append(entity)
+        # Extract other entities using patterns (one scan, same hits and order as re.finditer per pattern)
+        for entity_type, start, end in self.entity_matcher.finditer(text):
+            entities[entity_type].append(text[start:end].strip())
         
-        return self.process_entities(entities, text)
+        return self.process_entities(entities, transcript)
 
     def process_entities(self, entities, text):
         """Process extracted entities into a structured format"""
+        transcript = as_transcript(text)
+        text, text_lower = transcript.text, transcript.lower
         result = {}
         
         # Process Patient_Name - single string
@@ -351,7 +359,7 @@ class MedicalNER:
         else:
             # Default symptoms based on text
             symptoms = []
-            if "heart palpitations" in text.lower() or "palpitations" in text.lower():
+            if "heart palpitations" in text_lower or "palpitations" in text_lower:
                 symptoms.append("Heart palpitations")
             if not symptoms:
                 symptoms = ["Unknown symptoms"]
@@ -364,7 +372,7 @@ class MedicalNER:
             result["Diagnosis"] = diagnoses[0]
         else:
             # Default diagnosis based on text
-            if "heart palpitations" in text.lower() or "palpitations" in text.lower():
+            if "heart palpitations" in text_lower or "palpitations" in text_lower:
                 result["Diagnosis"] = "Possible arrhythmia"
             else:
                 result["Diagnosis"] = "Unknown diagnosis"
@@ -382,7 +390,7 @@ class MedicalNER:
         else:
             # Default treatments based on text
             treatments = []
-            if "ECG" in text.upper() or "EKG" in text.upper() or "electrocardiogram" in text.lower():
+            if "ECG" in text.upper() or "EKG" in text.upper() or "electrocardiogram" in text_lower:
                 treatments.append("ECG test")
             if not treatments:
                 treatments = ["Further testing recommended"]
@@ -395,9 +403,9 @@ class MedicalNER:
             result["Current_Status"] = statuses[0]
         else:
             # Default current status based on text
-            if "two weeks ago" in text.lower() and "palpitations" in text.lower():
+            if "two weeks ago" in text_lower and "palpitations" in text_lower:
                 result["Current_Status"] = "Experiencing palpitations for two weeks"
-            elif "happen randomly" in text.lower():
+            elif "happen randomly" in text_lower:
                 result["Current_Status"] = "Random palpitations"
             else:
                 result["Current_Status"] = "Unknown status"
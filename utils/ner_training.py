@@ -0,0 +1,219 @@
+import os
+import time
+import torch
+from transformers import DataCollatorForTokenClassification, Trainer, TrainerCallback, TrainingArguments
+from utils.checkpoints import TRAINER_OUTPUT_DIR, publish_checkpoint, run_id
+
+
+class TokenLabelDataset(torch.utils.data.Dataset):
+    """Token classification examples, unpadded; batches are padded by the collator.
+
+    ``data`` holds {"tokens", "label_ids"} items as built by
+    ``prepare_training_data``. Tokens are converted to ids once, up front, so
+    loader workers only slice lists.
+    """
+
+    def __init__(self, data, tokenizer):
+        self.features = [
+            {
+                "input_ids": tokenizer.convert_tokens_to_ids(item["tokens"]),
+                "attention_mask": [1] * len(item["tokens"]),
+                "labels": item["label_ids"],
+            }
+            for item in data
+        ]
+        self.max_length = max((len(feature["input_ids"]) for feature in self.features), default=0)
+
+    def __len__(self):
+        return len(self.features)
+
+    def __getitem__(self, idx):
+        return self.features[idx]
+
+
+class ThroughputTrainer(Trainer):
+    """Trainer that logs training tokens/sec and the share of padding once per epoch.
+
+    Real tokens are counted from each batch's attention mask; the padding ratio
+    is the share of batch positions that are padding. ``full_padding_length``
+    (the longest example) adds the ratio padding every example to it would give.
+    Under DistributedDataParallel the counts are summed over all processes.
+    """
+
+    def __init__(self, *args, full_padding_length=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.full_padding_length = full_padding_length
+        self.epoch_stats = []
+        # Set by train_token_classifier on the process that saves
+        self.checkpoint_dir = None
+        self._reset_counts()
+        self.add_callback(_EpochThroughputCallback(self))
+
+    def training_step(self, model, inputs):
+        mask = inputs.get("attention_mask")
+        if mask is not None:
+            self._tokens += int(mask.sum())
+            self._positions += mask.numel()
+            self._examples += mask.shape[0]
+        return super().training_step(model, inputs)
+
+    def _reset_counts(self):
+        self._tokens = self._positions = self._examples = 0
+        self._epoch_start = time.perf_counter()
+
+    def _log_epoch(self):
+        seconds = time.perf_counter() - self._epoch_start
+        tokens, positions, examples = self._tokens, self._positions, self._examples
+        if is_distributed():
+            # Totals over every process, over the slowest one's time
+            counts = torch.tensor([tokens, positions, examples], dtype=torch.float64)
+            torch.distributed.all_reduce(counts)
+            elapsed = torch.tensor([seconds], dtype=torch.float64)
+            torch.distributed.all_reduce(elapsed, op=torch.distributed.ReduceOp.MAX)
+            tokens, positions, examples = (int(count) for count in counts.tolist())
+            seconds = float(elapsed)
+        if not positions:
+            return
+        stats = {
+            "tokens_per_second": round(tokens / seconds, 1) if seconds > 0 else 0.0,
+            "padding_ratio": round(1 - tokens / positions, 4),
+        }
+        if self.full_padding_length:
+            stats["full_padding_ratio"] = round(1 - tokens / (examples * self.full_padding_length), 4)
+        self.epoch_stats.append(stats)
+        if self.is_world_process_zero():
+            print(f"Epoch throughput: {stats}")
+        self.log(stats)
+
+
+class _EpochThroughputCallback(TrainerCallback):
+    def __init__(self, trainer):
+        self.trainer = trainer
+
+    def on_epoch_begin(self, args, state, control, **kwargs):
+        self.trainer._reset_counts()
+
+    def on_epoch_end(self, args, state, control, **kwargs):
+        self.trainer._log_epoch()
+
+
+class _CheckpointTokenizerCallback(TrainerCallback):
+    """Save the tokenizer into every checkpoint, so each one loads on its own"""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def on_save(self, args, state, control, **kwargs):
+        if state.is_world_process_zero:
+            self.tokenizer.save_pretrained(os.path.join(args.output_dir, f"checkpoint-{state.global_step}"))
+
+
+def default_num_workers():
+    """Loader processes to use: up to four, leaving a core for the training loop
+
+    Under torchrun each training process counts only its share of the cores.
+    """
+    cores = (os.cpu_count() or 1) // int(os.environ.get("WORLD_SIZE", 1))
+    return max(0, min(4, cores - 1))
+
+
+def is_distributed():
+    return torch.distributed.is_available() and torch.distributed.is_initialized()
+
+
+def init_distributed():
+    """Join the gloo process group torchrun started this process for; returns (rank, world size).
+
+    Without torchrun (no WORLD_SIZE, or 1) nothing is initialized and this is (0, 1).
+    """
+    world_size = int(os.environ.get("WORLD_SIZE", 1))
+    if world_size > 1 and not is_distributed():
+        torch.distributed.init_process_group(backend="gloo")
+    return int(os.environ.get("RANK", 0)), world_size
+
+
+def train_token_classifier(model, tokenizer, training_data, output_dir, epochs=3, batch_size=8,
+                           num_workers=None, eval_fraction=0.2, **training_options):
+    """Fine-tune ``model`` on ``training_data`` and save it with its tokenizer under ``output_dir``.
+
+    ``training_data`` is a list of {"tokens", "label_ids"} items or a dataset of
+    encoded examples such as a TokenizedCorpus. Examples of similar length are
+    batched together (``group_by_length``) and each batch is padded only to its
+    own longest example, with padded labels ignored by the loss.
+    ``num_workers`` loader processes collate batches off the training thread.
+    ``eval_fraction`` of the data (fixed seed) is held out for per-epoch
+    evaluation when above 0. Extra keyword arguments go to
+    TrainingArguments. Started by torchrun (see ``utils.train_distributed``),
+    training runs data parallel over gloo: each process sees its own shard of
+    every epoch, gradients are averaged, and only the first process saves.
+    Every save goes to a new directory (see ``publish_checkpoint``), and the
+    Trainer's epoch checkpoints to a ``run-*`` directory of their own, so no
+    checkpoint that may be served is ever rewritten.
+    Returns the trainer, whose ``epoch_stats`` hold each epoch's throughput
+    and ``checkpoint_dir`` the saved model's directory (None on other processes).
+    """
+    if isinstance(training_data, list):
+        dataset = TokenLabelDataset(training_data, tokenizer)
+        max_length = dataset.max_length
+    else:
+        # Already encoded, e.g. a TokenizedCorpus or a Subset of one
+        dataset = training_data
+        max_length = getattr(dataset, "max_length", None)
+        if max_length is None:
+            max_length = max((len(dataset[i]["input_ids"]) for i in range(len(dataset))), default=0)
+    print(f"Max sequence length: {max_length}")
+
+    train_dataset, eval_dataset = dataset, None
+    eval_size = int(eval_fraction * len(dataset))
+    if eval_size:
+        # Use a fixed seed for reproducibility
+        generator = torch.Generator().manual_seed(42)
+        train_dataset, eval_dataset = torch.utils.data.random_split(
+            dataset, [len(dataset) - eval_size, eval_size], generator=generator
+        )
+    print(f"Training set size: {len(train_dataset)}, Evaluation set size: {eval_size}")
+
+    options = {
+        "output_dir": os.path.join(TRAINER_OUTPUT_DIR, f"run-{run_id()}"),
+        "report_to": "none",
+        "save_strategy": "epoch" if eval_size else "no",
+        "evaluation_strategy": "epoch" if eval_size else "no",
+        # FineTunedBioBERTNER maps these weights at load time
+        "save_safetensors": True,
+    }
+    if int(os.environ.get("WORLD_SIZE", 1)) > 1:
+        # CPU data parallelism: every parameter gets a gradient, so skip the unused-parameter search
+        options.update(ddp_backend="gloo", ddp_find_unused_parameters=False)
+    options.update(training_options)
+    training_args = TrainingArguments(
+        num_train_epochs=epochs,
+        per_device_train_batch_size=batch_size,
+        per_device_eval_batch_size=batch_size,
+        group_by_length=True,
+        dataloader_num_workers=default_num_workers() if num_workers is None else num_workers,
+        **options,
+    )
+
+    trainer = ThroughputTrainer(
+        model=model,
+        args=training_args,
+        train_dataset=train_dataset,
+        eval_dataset=eval_dataset,
+        data_collator=DataCollatorForTokenClassification(tokenizer=tokenizer, padding=True, return_tensors="pt"),
+        full_padding_length=max_length,
+    )
+    trainer.add_callback(_CheckpointTokenizerCallback(tokenizer))
+
+    print("Starting training...")
+    trainer.train()
+
+    if trainer.is_world_process_zero():
+        print("Saving model...")
+
+        def save(directory):
+            trainer.save_model(directory)
+            tokenizer.save_pretrained(directory)
+
+        trainer.checkpoint_dir = publish_checkpoint(save, output_dir)
+        print(f"Saved to {trainer.checkpoint_dir}")
+    return trainer
@@ -0,0 +1,108 @@
+import os
+from types import SimpleNamespace
+import numpy as np
+import torch
+from transformers import AutoConfig
+from utils.model_cache import revision_tag
+
+# Exported graphs are cached here, one file per checkpoint revision and head
+ONNX_CACHE_DIR = os.environ.get(
+    "NOTETAKER_ONNX_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "physician-notetaker", "onnx")
+)
+OPSET = 14
+
+
+class OnnxModel:
+    """Stand-in for a Hugging Face model that runs an exported graph with onnxruntime.
+
+    Calling it with tokenizer output returns an object with ``.logits`` as a torch
+    tensor, so the batching helpers in utils.inference work unchanged.
+    """
+
+    def __init__(self, path, config, num_threads=None):
+        ort = _import_onnxruntime()
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+        self.config = config
+        self.path = path
+        # Reported by the registry in place of parameter bytes
+        self.nbytes = os.path.getsize(path)
+
+    def eval(self):
+        return self
+
+    def __call__(self, **inputs):
+        feed = {
+            name: inputs[name].cpu().numpy().astype(np.int64)
+            for name in self.input_names
+            if name in inputs
+        }
+        logits = self.session.run(["logits"], feed)[0]
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+
+def load_onnx_model(model_id, model_class, tokenizer, source=None, **kwargs):
+    """Return an OnnxModel for a checkpoint, exporting it on first use.
+
+    ``source`` and ``kwargs`` are what would be passed to ``from_pretrained``
+    (a local snapshot path with ``local_files_only``, or the hub id with a
+    revision). Once the export exists only the config is read.
+    """
+    source = source or model_id
+    path = onnx_path(model_id, model_class, source, kwargs.get("revision"))
+    if os.path.exists(path):
+        config = AutoConfig.from_pretrained(source, **kwargs)
+    else:
+        model = model_class.from_pretrained(source, **kwargs)
+        model.eval()
+        export_onnx(model, tokenizer, path, per_token="TokenClassification" in model_class.__name__)
+        config = model.config
+        del model
+    return OnnxModel(path, config)
+
+
+def onnx_path(model_id, model_class, source, revision=None):
+    """Cache location of the export for a checkpoint revision and model head"""
+    tag = revision_tag(model_id, source, revision)
+    return os.path.join(ONNX_CACHE_DIR, model_id.replace("/", "--"), tag, f"{model_class.__name__}.onnx")
+
+
+def export_onnx(model, tokenizer, path, per_token=True):
+    """Trace a model to ONNX with dynamic batch and sequence axes"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    sample = tokenizer("The patient was seen by Dr. Smith.", return_tensors="pt")
+    input_names = [name for name in tokenizer.model_input_names if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch", 1: "sequence"} if per_token else {0: "batch"}
+
+    # Write next to the target and rename, so a crashed export never looks cached
+    tmp_path = f"{path}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            ({name: sample[name] for name in input_names},),
+            tmp_path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=OPSET,
+            do_constant_folding=True,
+        )
+    os.replace(tmp_path, path)
+    print(f"Exported ONNX model to {path}")
+    return path
+
+
+def _import_onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError(
+            "The ONNX backend needs onnxruntime: pip install 'physician-notetaker[onnx]'"
+        ) from e
+    return onnxruntime
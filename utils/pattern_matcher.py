@@ -0,0 +1,250 @@
+import re
+
+# Words joined by "|", optionally wrapped in one group: the whole pattern is a keyword list
+_LITERAL_PATTERN = re.compile(r"\(?([A-Za-z0-9 ',-]+(?:\|[A-Za-z0-9 ',-]+)*)\)?")
+# A leading group of words that every match must start with, e.g. "(sharp|dull) pain"
+_LEADING_GROUP = re.compile(r"\(([A-Za-z0-9 ',-]+(?:\|[A-Za-z0-9 ',-]+)*)\)(?![?*{])")
+# Leading plain text; the character before a quantifier is not mandatory
+_LEADING_TEXT = re.compile(r"[A-Za-z0-9 ',-]+")
+# Non-ASCII characters that re.IGNORECASE treats as an ASCII letter but str.lower() does not
+_CASE_FOLD = str.maketrans({"ı": "i", "ſ": "s", "İ": "i"})
+# A keyword must start with what a regex \w matches, to have a word start to anchor to
+_WORD_CHAR = re.compile(r"\w")
+
+
+class PatternMatcher:
+    """Match a labelled collection of regexes against a text in a single scan.
+
+    ``patterns`` has the shape of ``MedicalNER.entity_patterns``: a dict mapping a
+    label to a list of patterns. ``finditer(text)`` returns ``(label, start, end)``
+    for exactly the matches, and in the same order, as the nested loop::
+
+        for label, group in patterns.items():
+            for pattern in group:
+                for match in re.finditer(pattern, text, flags): ...
+
+    All keywords are compiled into one trie regex that reports the longest keyword
+    at each position. Patterns that are only keyword alternatives are resolved
+    from that alone; patterns that start with a keyword group are tried with
+    ``match()`` only where one of their keywords starts. Per-pattern hits are then
+    trimmed to re.finditer's non-overlapping matches. Any other pattern keeps its
+    own finditer.
+    """
+
+    def __init__(self, patterns, flags=re.IGNORECASE):
+        self.flags = flags
+        # One slot per distinct pattern string; duplicates across labels share a scan
+        slot_ids = {}
+        self._owners = []
+        for label, group in patterns.items():
+            for pattern in group:
+                slot = slot_ids.setdefault(pattern, len(slot_ids))
+                self._owners.append((label, slot))
+        self._num_slots = len(slot_ids)
+
+        literal_slots, anchored_slots, self._fallback = {}, {}, []
+        self._compiled = {}
+        for pattern, slot in slot_ids.items():
+            literal = _LITERAL_PATTERN.fullmatch(pattern)
+            anchors = None if literal else _leading_keywords(pattern)
+            if literal:
+                literal_slots[slot] = literal.group(1).lower().split("|")
+            elif anchors:
+                anchored_slots[slot] = anchors
+                self._compiled[slot] = re.compile(pattern, flags)
+            else:
+                self._fallback.append((slot, re.compile(pattern, flags)))
+
+        self._compile_keywords(literal_slots, anchored_slots)
+
+    def _compile_keywords(self, literal_slots, anchored_slots):
+        """Build the trie regex and, per keyword, the pattern hits it implies"""
+        # keyword -> [(slot, alternative index)] and keyword -> {anchored slot}
+        owners, anchors = {}, {}
+        for slot, alternatives in literal_slots.items():
+            for index, keyword in enumerate(alternatives):
+                owners.setdefault(keyword, []).append((slot, index))
+        for slot, keywords in anchored_slots.items():
+            for keyword in keywords:
+                anchors.setdefault(keyword, set()).add(slot)
+
+        # Every keyword matching at a position is a prefix of the longest one, so the
+        # longest keyword alone decides each literal pattern's match (re takes the
+        # first alternative in pattern order that matches) and which anchored
+        # patterns are worth trying there
+        self._keyword_hits = {}
+        self._keyword_anchors = {}
+        for keyword in set(owners) | set(anchors):
+            best, candidates = {}, set()
+            for end in range(1, len(keyword) + 1):
+                prefix = keyword[:end]
+                for slot, index in owners.get(prefix, ()):
+                    if slot not in best or index < best[slot][0]:
+                        best[slot] = (index, end)
+                candidates.update(anchors.get(prefix, ()))
+            self._keyword_hits[keyword] = [(slot, length) for slot, (_, length) in best.items()]
+            self._keyword_anchors[keyword] = sorted(candidates)
+
+        # Longest first, for the rare match whose case fold is not in the table
+        self._keywords = [
+            (keyword, re.compile(re.escape(keyword), self.flags))
+            for keyword in sorted(self._keyword_hits, key=len, reverse=True)
+        ]
+        self._keyword_finder = (
+            re.compile(f"(?=({trie_regex(self._keyword_hits)}))", self.flags)
+            if self._keyword_hits else None
+        )
+
+    def finditer(self, text):
+        """Return (label, start, end) for every match, in per-pattern finditer order"""
+        spans = [[] for _ in range(self._num_slots)]
+        next_free = [0] * self._num_slots
+
+        if self._keyword_finder is not None:
+            for match in self._keyword_finder.finditer(text):
+                start = match.start()
+                keyword = match.group(1).translate(_CASE_FOLD).lower()
+                if keyword not in self._keyword_hits:
+                    keyword = self._longest_keyword(text, start)
+
+                for slot, length in self._keyword_hits[keyword]:
+                    if start >= next_free[slot]:
+                        spans[slot].append((start, start + length))
+                        next_free[slot] = start + length
+
+                for slot in self._keyword_anchors[keyword]:
+                    if start >= next_free[slot]:
+                        anchored = self._compiled[slot].match(text, start)
+                        if anchored:
+                            spans[slot].append(anchored.span())
+                            next_free[slot] = anchored.end()
+
+        for slot, compiled in self._fallback:
+            spans[slot] = [match.span() for match in compiled.finditer(text)]
+
+        return [
+            (label, start, end)
+            for label, slot in self._owners
+            for start, end in spans[slot]
+        ]
+
+    def _longest_keyword(self, text, start):
+        for keyword, compiled in self._keywords:
+            if compiled.match(text, start):
+                return keyword
+        raise LookupError(f"no keyword matches at {start}")
+
+
+class KeywordScanner:
+    """Count keyword hits at the start of words for many labels in a single scan.
+
+    ``groups`` maps a label to a list of alternations, each a list of keywords.
+    ``count(text)`` returns {label: hits}, every alternation adding what
+    ``len(re.findall(r"(?<!\\w)(?:a|b|...)", text.lower()))`` would: its
+    non-overlapping matches that begin a word. Keywords work as stems, so
+    "stress" counts in "stressful" but "hope" does not count in "orthopedic". A
+    keyword that is its own alternation is counted wherever a word starts with it.
+    """
+
+    def __init__(self, groups):
+        self.labels = list(groups)
+        # One slot per alternation; keyword -> [(slot, alternative index)]
+        self._owners = []
+        hits = {}
+        for label, alternations in groups.items():
+            for keywords in alternations:
+                slot = len(self._owners)
+                self._owners.append(label)
+                for index, keyword in enumerate(keywords):
+                    keyword = keyword.lower()
+                    if not _WORD_CHAR.match(keyword):
+                        raise ValueError(f"Keywords must start with a word character, got {keyword!r}")
+                    hits.setdefault(keyword, []).append((slot, index))
+
+        # Every keyword matching at a position is a prefix of the longest one, which
+        # alone decides the alternative each slot's regex would pick there
+        self._slots = {
+            keyword: _first_alternatives(hits, [keyword[:end] for end in range(1, len(keyword) + 1)])
+            for keyword in hits
+        }
+        self._finder = re.compile(rf"(?<!\w)(?=({trie_regex(hits)}))") if hits else None
+
+    def count(self, text):
+        counts = dict.fromkeys(self.labels, 0)
+        if self._finder is None:
+            return counts
+        next_free = [0] * len(self._owners)
+        for match in self._finder.finditer(text.lower()):
+            start = match.start()
+            for slot, length in self._slots[match.group(1)]:
+                if start >= next_free[slot]:
+                    counts[self._owners[slot]] += 1
+                    next_free[slot] = start + length
+        return counts
+
+
+def _first_alternatives(hits, keywords):
+    """(slot, length) of the alternative a regex would pick in each slot, given the keywords that match"""
+    best = {}
+    for keyword in keywords:
+        for slot, index in hits.get(keyword, ()):
+            if slot not in best or index < best[slot][0]:
+                best[slot] = (index, len(keyword))
+    return [(slot, length) for slot, (_, length) in best.items()]
+
+
+def _leading_keywords(pattern):
+    """Keywords one of which starts every match of ``pattern``, or None if unknown"""
+    if _has_top_level_alternation(pattern):
+        return None
+    group = _LEADING_GROUP.match(pattern)
+    if group:
+        return group.group(1).lower().split("|")
+    text = _LEADING_TEXT.match(pattern)
+    if not text:
+        return None
+    keyword = text.group(0)
+    if pattern[text.end():text.end() + 1] in ("?", "*", "{"):
+        keyword = keyword[:-1]
+    return [keyword.lower()] if keyword else None
+
+
+def _has_top_level_alternation(pattern):
+    """Whether ``pattern`` has a "|" outside every group and character class"""
+    depth, in_class, escaped = 0, False, False
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return True
+    return False
+
+
+def trie_regex(words):
+    """Compile words into a regex trie whose match is the longest word at a position"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    return _node_regex(trie)
+
+
+def _node_regex(node):
+    branches = [re.escape(char) + _node_regex(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    # A word ends here: the greedy ? tries the longer words first
+    return f"(?:{body})?" if "" in node else body
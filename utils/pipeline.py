@@ -0,0 +1,176 @@
+from utils.ner import MedicalNER
+from utils.biobert_ner import BioBERTNER
+from utils.bert_name_detector import BERTNameDetector
+from utils.biobert_finetuned import FineTunedBioBERTNER
+from utils.summarization import MedicalSummarizer
+from utils.keyword import MedicalKeywordExtractor
+from utils.sentiment_analyzer import MedicalSentimentAnalyzer
+from utils.soap_generator import SOAPNoteGenerator
+from utils.dialogue import as_transcript
+
+# NER methods, matching the choices in the Streamlit app
+NER_METHODS = ("rule", "biobert", "bert", "finetuned")
+
+
+class EntityExtractor:
+    def __init__(self, ner_method="rule", window_stride=None, backend="torch", quantize=None, warm_up=False):
+        """Run one of the app's NER methods, loading only the models it needs"""
+        if ner_method not in NER_METHODS:
+            raise ValueError(f"Unknown NER method {ner_method!r}, expected one of {NER_METHODS}")
+        self.ner_method = ner_method
+        model_options = {"window_stride": window_stride, "backend": backend, "quantize": quantize}
+
+        self.rule_based_ner = MedicalNER() if ner_method in ("rule", "bert") else None
+        self.biobert_ner = BioBERTNER(**model_options) if ner_method == "biobert" else None
+        self.bert_name_detector = BERTNameDetector(warm_up=warm_up, **model_options) if ner_method == "bert" else None
+        # The newest fine-tuned checkpoint; its revision is part of every cache key
+        self.fine_tuned_ner = FineTunedBioBERTNER(**model_options) if ner_method == "finetuned" else None
+        if self.fine_tuned_ner is not None and self.fine_tuned_ner.model is None:
+            raise RuntimeError(
+                "No fine-tuned BioBERT checkpoint loaded; train one with python -m utils.train_biobert_finetuned"
+            )
+
+    @property
+    def components(self):
+        return [
+            component for component in
+            (self.rule_based_ner, self.biobert_ner, self.bert_name_detector, self.fine_tuned_ner)
+            if component is not None
+        ]
+
+    def close(self):
+        """Release every shared model the NER method's components hold"""
+        for component in self.components:
+            component.close()
+
+    def extract_entities(self, transcript):
+        """Run the selected NER method the same way app.py does"""
+        return self.extract_entities_many([transcript])[0]
+
+    def extract_entities_many(self, transcripts, batch_size=8):
+        """extract_entities for many transcripts, with each model's passes shared in batches"""
+        if self.ner_method == "finetuned":
+            # Every field, the name included, comes from one pass of the fine-tuned model
+            entities = self.fine_tuned_ner.extract_entities_many(transcripts, batch_size)
+            for transcript_entities in entities:
+                if transcript_entities["Patient_Name"] is None:
+                    transcript_entities["Patient_Name"] = "No Name"
+            return entities
+        if self.ner_method == "biobert":
+            return self.biobert_ner.extract_entities_many(transcripts, batch_size)
+
+        # Patterns only, no model
+        entities = [self.rule_based_ner.extract_entities(transcript) for transcript in transcripts]
+        if self.ner_method == "rule":
+            return entities
+
+        # The BERT option replaces the rule-based name with the BERT-detected one
+        patient_names = self.bert_name_detector.extract_names(transcripts, batch_size)
+        for transcript_entities, patient_name in zip(entities, patient_names):
+            transcript_entities["Patient_Name"] = patient_name if patient_name != "Unknown" else "No Name"
+        return entities
+
+
+class NotetakerPipeline:
+    def __init__(self, ner_method="rule", window_stride=None, backend="torch", quantize=None, cache=None,
+                 warm_up=False, keyword_index=None):
+        """Hold every component the app runs on a transcript, outside Streamlit
+
+        Only the models needed by ``ner_method`` are loaded; the transformer
+        options are passed through to the detectors that take them. With a
+        ResultCache, each stage is looked up before it is computed. With
+        ``warm_up``, lazily loaded models start loading in the background now.
+        With a KeywordIndex, every processed transcript is added to it and its
+        keywords are ranked by TF-IDF; those depend on the corpus, so they are
+        never cached.
+        """
+        self.ner_method = ner_method
+        self.cache = cache
+        model_options = {"window_stride": window_stride, "backend": backend, "quantize": quantize}
+
+        self.entity_extractor = EntityExtractor(ner_method, warm_up=warm_up, **model_options)
+        self.summarizer = MedicalSummarizer()
+        self.keyword_extractor = MedicalKeywordExtractor()
+        self.keyword_index = keyword_index
+        self.sentiment_analyzer = MedicalSentimentAnalyzer(warm_up=warm_up, **model_options)
+        self.soap_generator = SOAPNoteGenerator()
+
+    def extract_entities(self, transcript):
+        return self.entity_extractor.extract_entities(transcript)
+
+    def extract_entities_many(self, transcripts):
+        return self.entity_extractor.extract_entities_many(transcripts)
+
+    def extract_keywords(self, transcript):
+        if self.keyword_index is not None:
+            return self.keyword_index.extract_many([transcript])[0]
+        return self._stage("keywords", transcript, self.keyword_extractor.extract_keywords, [self.keyword_extractor])
+
+    def close(self):
+        """Release the shared models of every component; call once the pipeline is done with"""
+        self.entity_extractor.close()
+        self.sentiment_analyzer.close()
+
+    def readiness(self):
+        """Load state of every lazily loaded model, by model name"""
+        components = self.entity_extractor.components + [self.sentiment_analyzer]
+        return {
+            component.loader.name: component.loader.status()
+            for component in components if hasattr(component, "loader")
+        }
+
+    def process(self, transcript):
+        """Return every result the app shows for one transcript, parsed once for all stages"""
+        return self.process_many([transcript])[0]
+
+    def process_many(self, transcripts):
+        """``process`` for many transcripts, each model stage running once over all of them
+
+        Entities and sentiment share their forward passes across the batch;
+        with a ResultCache, only the transcripts missing a stage are computed.
+        """
+        transcripts = [as_transcript(transcript) for transcript in transcripts]
+        entities = self._stage_many(
+            "entities", transcripts, self.extract_entities_many, self.entity_extractor.components, self.ner_method
+        )
+        summaries = self._stage_many("summary", transcripts, self.summarizer.summarize_many, [self.summarizer])
+        sentiments = self._stage_many(
+            "sentiment", transcripts, self.sentiment_analyzer.analyze_sentiment_many, [self.sentiment_analyzer]
+        )
+        soap_notes = [
+            self._stage("soap_note", transcript, self.soap_generator.generate_soap_note, [self.soap_generator])
+            for transcript in transcripts
+        ]
+        # Runs last so that nothing can fail afterwards: the index keeps every transcript it is given
+        if self.keyword_index is not None:
+            keywords = self.keyword_index.extract_many(transcripts)
+        else:
+            keywords = [self.extract_keywords(transcript) for transcript in transcripts]
+        return [
+            {
+                "entities": entities[i],
+                "summary": summaries[i],
+                "keywords": keywords[i],
+                "sentiment": sentiments[i],
+                "soap_note": soap_notes[i],
+            }
+            for i in range(len(transcripts))
+        ]
+
+    def _stage(self, stage, transcript, compute, components, method=None):
+        if self.cache is None:
+            return compute(transcript)
+        return self.cache.get_or_compute(stage, transcript, compute, components, method)
+
+    def _stage_many(self, stage, transcripts, compute_many, components, method=None):
+        """Like _stage for a list of transcripts, with one ``compute_many`` call for all cache misses"""
+        if self.cache is None:
+            return compute_many(transcripts)
+        keys = [self.cache.key(stage, transcript, components, method) for transcript in transcripts]
+        results = [self.cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            for i, result in zip(missing, compute_many([transcripts[i] for i in missing])):
+                self.cache.put(keys[i], result)
+                results[i] = result
+        return results
@@ -0,0 +1,68 @@
+import os
+import torch
+from torch import nn
+from torch.ao.nn.quantized import dynamic as nnqd
+from transformers import AutoConfig
+from transformers.modeling_utils import no_init_weights
+from utils.model_cache import revision_tag
+
+# Quantized state dicts are cached here, one file per checkpoint revision and head
+QUANT_CACHE_DIR = os.environ.get(
+    "NOTETAKER_QUANT_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "physician-notetaker", "int8")
+)
+
+# Modes accepted by the detectors' quantize= option
+QUANTIZE_MODES = ("int8",)
+
+
+def load_quantized_model(model_id, model_class, source=None, **kwargs):
+    """Return a model with every nn.Linear dynamically quantized to int8.
+
+    The first call quantizes the full-precision checkpoint and saves the
+    quantized state dict; later calls build an empty skeleton from the config
+    and load that file, so nothing is re-quantized at startup.
+    """
+    source = source or model_id
+    path = quantized_path(model_id, model_class, source, kwargs.get("revision"))
+
+    if os.path.exists(path):
+        config = AutoConfig.from_pretrained(source, **kwargs)
+        with no_init_weights():
+            model = model_class.from_config(config)
+        model.eval()
+        _swap_dynamic_linear(model)
+        model.load_state_dict(torch.load(path, map_location="cpu"))
+        return model
+
+    model = model_class.from_pretrained(source, **kwargs)
+    model.eval()
+    torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+    # Write next to the target and rename, so a crashed save never looks cached
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    torch.save(model.state_dict(), tmp_path)
+    os.replace(tmp_path, path)
+    print(f"Saved int8 weights to {path}")
+    return model
+
+
+def quantized_path(model_id, model_class, source, revision=None):
+    """Cache location of the quantized weights for a checkpoint revision and model head"""
+    tag = revision_tag(model_id, source, revision)
+    return os.path.join(
+        QUANT_CACHE_DIR, f"torch-{torch.__version__.split('+')[0]}",
+        model_id.replace("/", "--"), tag, f"{model_class.__name__}.pt"
+    )
+
+
+def _swap_dynamic_linear(module):
+    """Replace nn.Linear children with empty int8 dynamic Linear layers, in place"""
+    for name, child in module.named_children():
+        if type(child) is nn.Linear:
+            setattr(module, name, nnqd.Linear(
+                child.in_features, child.out_features, bias_=child.bias is not None, dtype=torch.qint8
+            ))
+        else:
+            _swap_dynamic_linear(child)
@@ -0,0 +1,279 @@
+import hashlib
+import inspect
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from utils.model_cache import resource_revisions
+
+# Set to a file path to enable the on-disk tier in the app
+CACHE_PATH_ENV = "NOTETAKER_RESULT_CACHE"
+
+# Bump when the key or stored format changes
+_FORMAT_VERSION = 1
+
+
+class ResultCache:
+    """Content-addressed cache of per-stage pipeline results.
+
+    Keys combine the sha256 of the transcript, the stage, the method and a
+    version of every component involved (see ``component_version``), so editing
+    a detector, changing its options or provisioning new model revisions
+    invalidates its entries. Results are stored as JSON: an in-memory LRU tier,
+    and optionally a SQLite file of zlib-compressed entries with least recently
+    used eviction once it grows past ``max_disk_bytes``. The file can be shared
+    by several processes.
+    """
+
+    def __init__(self, max_entries=256, path=None, max_disk_bytes=256 * 2**20):
+        self.max_entries = max_entries
+        self.path = path
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            self._db.commit()
+        self.counters = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "bytes_saved": 0}
+
+    def get_or_compute(self, stage, transcript, compute, components=(), method=None):
+        """Return ``compute(transcript)``, from the cache when this exact input was seen before"""
+        key = self.key(stage, transcript, components, method)
+        payload = self._get(key)
+        if payload is not None:
+            return json.loads(payload)
+
+        result = compute(transcript)
+        payload = json.dumps(result)
+        self._put(key, payload)
+        return result
+
+    def get(self, key):
+        """Stored result for ``key``, or None"""
+        payload = self._get(key)
+        return json.loads(payload) if payload is not None else None
+
+    def put(self, key, result):
+        self._put(key, json.dumps(result))
+
+    @staticmethod
+    def key(stage, transcript, components=(), method=None):
+        """Build the cache key for one stage of one transcript (a string or Transcript)"""
+        digest = hashlib.sha256(str(transcript).encode("utf-8")).hexdigest()
+        version = component_version(*components)
+        return f"{_FORMAT_VERSION}:{stage}:{method or ''}:{version}:{digest}"
+
+    def _get(self, key):
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+                self._count_hit("memory_hits", payload)
+                return payload
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    payload = zlib.decompress(row[0]).decode("utf-8")
+                    self._remember(key, payload)
+                    self._count_hit("disk_hits", payload)
+                    return payload
+
+            self.counters["misses"] += 1
+            return None
+
+    def _put(self, key, payload):
+        with self._lock:
+            self._remember(key, payload)
+            if self._db is None:
+                return
+            value = zlib.compress(payload.encode("utf-8"))
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time())
+            )
+            self._evict_disk()
+            self._db.commit()
+
+    def _remember(self, key, payload):
+        self._memory[key] = payload
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _count_hit(self, tier, payload):
+        self.counters["hits"] += 1
+        self.counters[tier] += 1
+        self.counters["bytes_saved"] += len(payload)
+
+    def _evict_disk(self):
+        """Drop least recently used rows until the file's entries fit max_disk_bytes"""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM results ORDER BY accessed").fetchall():
+            if total <= self.max_disk_bytes:
+                break
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+
+    def stats(self):
+        """Return the counters plus the current size of each tier"""
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+            if self._db is not None:
+                entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+                stats["disk_entries"] = entries
+                stats["disk_bytes"] = size
+            return stats
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+# Source hash per module file, and dependency sources per module, computed once per process
+_source_hashes = {}
+_dependency_paths = {}
+# Import statements anywhere in a file, including those inside functions
+_IMPORT = re.compile(r"^[ \t]*(?:from[ \t]+([\w.]+)[ \t]+import[ \t]+(\([^)]*\)|[^\n#]+)|import[ \t]+([^\n#]+))", re.M)
+
+
+def component_version(*components):
+    """Fingerprint the code, simple settings and model revisions behind a result.
+
+    Covers the source of each component's module and of every module of its
+    package it imports (as ``class_version`` does), its public
+    str/int/float/bool/None attributes (model names, backend, quantization,
+    window stride, whether a model is loaded), the same for every detector
+    it holds (an attribute with a ``close`` method from the same package,
+    such as BioBERTNER's name detector) and the provisioned model revisions.
+    """
+    digest = hashlib.sha256()
+    seen = set()
+    for component in components:
+        _digest_component(digest, component, seen)
+    digest.update(json.dumps(resource_revisions(), sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def class_version(*classes):
+    """Like ``component_version`` for classes that are too costly to build just for a key.
+
+    Covers the model revisions and the source of each class's module and of
+    every module of the same package it imports, directly or not, including
+    imports inside functions; an edit to utils/inference.py changes the
+    version of every detector that predicts through it.
+    """
+    digest = hashlib.sha256()
+    for cls in classes:
+        _digest_class(digest, cls)
+    digest.update(json.dumps(resource_revisions(), sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def _digest_class(digest, cls):
+    digest.update(f"{cls.__module__}.{cls.__qualname__}".encode("utf-8"))
+    sources = _dependency_sources(cls.__module__)
+    if not sources:
+        # e.g. a class defined in __main__
+        digest.update(_source_hash(cls).encode("utf-8"))
+    for name, path in sources:
+        digest.update(name.encode("utf-8"))
+        digest.update(_file_hash(path).encode("utf-8"))
+
+
+def _digest_component(digest, component, seen):
+    if id(component) in seen:
+        return
+    seen.add(id(component))
+    cls = type(component)
+    _digest_class(digest, cls)
+    package = cls.__module__.split(".")[0]
+    settings, nested = {}, []
+    for name, value in sorted(vars(component).items()):
+        if name.startswith("_"):
+            continue
+        if value is None or isinstance(value, (str, int, float, bool)):
+            settings[name] = value
+        elif callable(getattr(value, "close", None)) and type(value).__module__.split(".")[0] == package:
+            nested.append((name, value))
+    # Lazily loaded models report whether they are loaded through a property
+    if isinstance(getattr(cls, "is_loaded", None), property):
+        settings["is_loaded"] = component.is_loaded
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    for name, value in nested:
+        digest.update(name.encode("utf-8"))
+        _digest_component(digest, value, seen)
+
+
+def _source_hash(cls):
+    try:
+        return _file_hash(inspect.getsourcefile(cls))
+    except (TypeError, OSError):
+        # Built-in or interactively defined classes have no source file
+        return ""
+
+
+def _file_hash(path):
+    if path not in _source_hashes:
+        with open(path, "rb") as f:
+            _source_hashes[path] = hashlib.sha256(f.read()).hexdigest()
+    return _source_hashes[path]
+
+
+def _dependency_sources(module_name):
+    """Sorted (module name, source file) of a module and of every module of its package it imports"""
+    if module_name not in _dependency_paths:
+        package = module_name.split(".")[0]
+        package_file = getattr(sys.modules.get(package), "__file__", None)
+        # The directory holding the package; module names map to files under it without importing them
+        root = os.path.dirname(os.path.dirname(os.path.abspath(package_file))) if package_file else None
+        seen, pending, sources = set(), [module_name], set()
+        while pending and root:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            path = _module_file(root, name)
+            if path is None:
+                # e.g. "from utils.x import some_function" names no module
+                continue
+            sources.add((name, path))
+            with open(path, encoding="utf-8") as f:
+                source = f.read()
+            for match in _IMPORT.finditer(source):
+                if match.group(1):
+                    # from package import a, b: each may be a module
+                    names = match.group(2).replace("(", " ").replace(")", " ").split(",")
+                    candidates = [match.group(1)] + [f"{match.group(1)}.{n.split()[0]}" for n in names if n.split()]
+                else:
+                    candidates = [n.split()[0] for n in match.group(3).split(",") if n.split()]
+                pending.extend(c for c in candidates if c.split(".")[0] == package)
+        _dependency_paths[module_name] = sorted(sources)
+    return _dependency_paths[module_name]
+
+
+def _module_file(root, name):
+    base = os.path.join(root, *name.split("."))
+    for path in (base + ".py", os.path.join(base, "__init__.py")):
+        if os.path.isfile(path):
+            return path
+    return None
@@ -1,27 +1,45 @@
 import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from transformers import AutoModelForSequenceClassification
 import re
 import numpy as np
-from huggingface_hub import try_to_load_from_cache
+from utils.model_registry import registry
+from utils.inference import predict_sequence_probs
+from utils.dialogue import as_transcript
+from utils.lazy_loader import LazyLoader
+from utils.pattern_matcher import KeywordScanner
 
 class MedicalSentimentAnalyzer:
-    def __init__(self):
-        """Initialize sentiment and intent analyzer for medical conversations with lazy loading"""
+    # Patient turns per forward pass, and padded tokens per pass, when scoring a timeline
+    TURN_BATCH_SIZE = 64
+    TURN_BATCH_TOKENS = 8192
+    # Words behind the domain-specific adjustments to the keyword scores
+    RULE_KEYWORDS = {
+        "thanks": ["thank you", "thanks"],
+        "worry": ["worried", "concerned"],
+        "pain": ["pain", "hurt"],
+        "reassurance": ["is it serious"],
+    }
+    
+    def __init__(self, window_stride=None, backend="torch", quantize=None, warm_up=False):
+        """Initialize sentiment and intent analyzer for medical conversations with lazy loading
+
+        window_stride: when set, patient text longer than 512 tokens is scored in
+        overlapping windows and the window probabilities are averaged.
+        backend: "torch" or "onnx" (exported once, then served by onnxruntime).
+        quantize: "int8" to run the torch backend with dynamically quantized Linear layers.
+        warm_up: start loading the model on a background thread right away.
+        """
+        self.window_stride = window_stride
+        self.backend = backend
+        self.quantize = quantize
+        
         # Set model name but don't load it yet
         self.sentiment_model_name = "distilbert-base-uncased-finetuned-sst-2-english"
         self.tokenizer = None
         self.model = None
         
-        # Check if model files are already in cache
-        try:
-            # Check if model files exist in cache
-            model_file = try_to_load_from_cache(self.sentiment_model_name, "model.safetensors")
-            config_file = try_to_load_from_cache(self.sentiment_model_name, "config.json")
-            
-            # If both files exist, mark as pre-downloaded
-            self.is_loaded = model_file is not None and config_file is not None
-        except:
-            self.is_loaded = False
+        # Loaded once, by the first caller that needs it (or the warm-up thread)
+        self.loader = LazyLoader(self._load, self.sentiment_model_name)
         
         # Define intent patterns
         self.intent_patterns = {
@@ -33,7 +51,7 @@ class MedicalSentimentAnalyzer:
                 r"(?:right\?|correct\?|isn't it\?|is that normal\?|is that common\?)"
             ],
             "Reporting symptoms": [
-                r"(?:pain|ache|hurt|hurts|hurting|sore|tender|burning|throbbing)",
+                r"(?:pain|ache|headache|hurt|hurts|hurting|sore|tender|burning|throbbing)",
                 r"(?:feeling|felt|experiencing|having|had|noticed|been having)",
                 r"(?:symptom|symptoms|problem|problems|issue|issues|condition)",
                 r"(?:started|began|developed|appeared|noticed|observed)",
@@ -82,109 +100,145 @@ class MedicalSentimentAnalyzer:
                 "excellent", "wonderful", "fantastic", "thank you", "thanks", "appreciate"
             ]
         }
+        
+        # Keywords, intent patterns and the extra rules' words, all counted in one pass
+        self.keyword_scanner = KeywordScanner({
+            **{("sentiment", sentiment): [[keyword] for keyword in keywords]
+               for sentiment, keywords in self.sentiment_keywords.items()},
+            **{("intent", intent): [_alternatives(pattern) for pattern in patterns]
+               for intent, patterns in self.intent_patterns.items()},
+            **{("rule", rule): [keywords] for rule, keywords in self.RULE_KEYWORDS.items()},
+        })
+        
+        if warm_up:
+            self.warm_up()
+
+    @property
+    def is_loaded(self):
+        return self.loader.ready
+
+    @property
+    def state(self):
+        """Model lifecycle: cold, loading, ready or failed"""
+        return self.loader.state
 
     def load_model(self):
-        """Load the model only when needed"""
-        if not self.is_loaded:
-            try:
-                print("Loading sentiment analysis model... This may take a moment.")
-                self.tokenizer = AutoTokenizer.from_pretrained(self.sentiment_model_name)
-                self.model = AutoModelForSequenceClassification.from_pretrained(self.sentiment_model_name)
-                self.is_loaded = True
-                print("Sentiment analysis model loaded successfully.")
-                return True
-            except Exception as e:
-                print(f"Error loading sentiment analysis model: {str(e)}")
-                return False
-        return True
+        """Load the model only when needed; safe to call from any thread, and retries a failed load"""
+        return self.loader.load(retry=True)
+
+    def warm_up(self):
+        """Start loading the model in the background"""
+        return self.loader.warm_up()
+
+    def _load(self):
+        print("Loading sentiment analysis model... This may take a moment.")
+        self.tokenizer, self.model = registry.acquire(
+            self.sentiment_model_name, AutoModelForSequenceClassification,
+            dtype=self.quantize, backend=self.backend
+        )
+        print("Sentiment analysis model loaded successfully.")
+
+    def close(self):
+        """Release the shared model if it was loaded; the next call loads it again"""
+        self.loader.unload(self._unload)
+
+    def _unload(self):
+        registry.release(
+            self.sentiment_model_name, AutoModelForSequenceClassification,
+            dtype=self.quantize, backend=self.backend
+        )
+        self.tokenizer = self.model = None
 
     def extract_patient_text(self, conversation):
         """Extract only the patient's dialogue from the conversation"""
-        patient_lines = []
-        lines = conversation.split('\n')
-        
-        for line in lines:
-            if line.strip().startswith("Patient:"):
-                # Remove the "Patient:" prefix and add to patient lines
-                patient_text = line.strip()[8:].strip()
-                if patient_text:
-                    patient_lines.append(patient_text)
-        
-        return " ".join(patient_lines)
+        return as_transcript(conversation).role_text("patient")
 
     def analyze_sentiment(self, text):
         """Analyze sentiment using transformer model and rule-based approach"""
-        # Extract only patient's dialogue
-        patient_text = self.extract_patient_text(text)
-        if not patient_text:
-            patient_text = text  # Use full text if patient dialogue can't be extracted
+        return self.analyze_sentiment_many([text])[0]
+    
+    def analyze_sentiment_many(self, texts):
+        """Sentiment and intent of many transcripts, every patient turn scored in shared batches
+
+        Each result holds the aggregate "Sentiment" and "Intent" and a "Timeline"
+        with one {"turn", "Sentiment", "Intent"} entry per patient turn, "turn"
+        being its index in the transcript.
+        """
+        transcripts = [as_transcript(text) for text in texts]
+        
+        # Score each patient turn on its own; use full text if patient dialogue can't be extracted
+        units, spans = [], []
+        for transcript in transcripts:
+            turns = [(position, turn.text) for position, turn in enumerate(transcript.turns)
+                     if turn.role == "patient" and turn.text]
+            start = len(units)
+            units.extend(turns or [(None, transcript.text)])
+            spans.append((start, len(units)))
         
         # Try transformer-based approach if model is loaded or can be loaded
-        transformer_sentiment = None
-        if self.load_model():
+        probs = None
+        if units and self.loader.load():
             try:
-                transformer_sentiment = self._analyze_sentiment_with_transformer(patient_text)
+                probs = self._analyze_sentiment_with_transformer([text for _, text in units])
             except Exception as e:
                 print(f"Error in transformer sentiment analysis: {str(e)}")
         
-        # Rule-based sentiment analysis
-        rule_based_sentiment = self._analyze_sentiment_with_rules(patient_text)
-        
         # Combine results, preferring transformer if available
-        final_sentiment = transformer_sentiment if transformer_sentiment else rule_based_sentiment
-        
-        # Analyze intent
-        intent = self._analyze_intent(patient_text)
+        if probs is not None:
+            labels = self._labels_from_probs(probs)
+        else:
+            labels = [self._analyze_sentiment_with_rules(text) for _, text in units]
         
-        return {
-            "Sentiment": final_sentiment,
-            "Intent": intent
-        }
+        results = []
+        for transcript, (start, end) in zip(transcripts, spans):
+            patient_text = self.extract_patient_text(transcript) or transcript.text
+            if probs is not None:
+                # Whole-visit sentiment: turn probabilities weighted by turn length
+                weights = torch.tensor([len(text) + 1 for _, text in units[start:end]], dtype=probs.dtype)
+                mean = (probs[start:end] * weights.unsqueeze(1)).sum(dim=0) / weights.sum()
+                sentiment = self._labels_from_probs(mean.unsqueeze(0))[0]
+            else:
+                sentiment = self._analyze_sentiment_with_rules(patient_text)
+            
+            results.append({
+                "Sentiment": sentiment,
+                # Analyze intent
+                "Intent": self._analyze_intent(patient_text),
+                "Timeline": [
+                    {"turn": position, "Sentiment": label, "Intent": self._analyze_intent(text)}
+                    for (position, text), label in zip(units[start:end], labels[start:end])
+                    if position is not None
+                ],
+            })
+        return results
     
-    def _analyze_sentiment_with_transformer(self, text):
-        """Analyze sentiment using transformer model"""
-        # Tokenize text
-        inputs = self.tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=512)
-        
-        # Get model predictions
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            predictions = outputs.logits
-        
-        # Convert raw logits to probabilities
-        probs = torch.nn.functional.softmax(predictions, dim=1)
-        
-        # SST-2 is binary (positive/negative), map to our categories
-        negative_prob = probs[0][0].item()
-        positive_prob = probs[0][1].item()
-        
-        # Map to our three categories
-        if negative_prob > 0.7:
-            return "Anxious"
-        elif positive_prob > 0.7:
-            return "Reassured"
-        else:
-            return "Neutral"
+    def _analyze_sentiment_with_transformer(self, texts):
+        """(len(texts), 2) SST-2 probabilities, with short texts packed into a few batched passes"""
+        # Class probabilities, averaged across windows for long texts
+        return predict_sequence_probs(
+            self.tokenizer, self.model, texts, batch_size=self.TURN_BATCH_SIZE,
+            stride=self.window_stride, max_tokens=self.TURN_BATCH_TOKENS
+        )
+    
+    def _labels_from_probs(self, probs):
+        """Map each row of SST-2 (negative, positive) probabilities to our three categories"""
+        labels = torch.ones(probs.shape[0], dtype=torch.long)
+        labels[probs[:, 1] > 0.7] = 2
+        labels[probs[:, 0] > 0.7] = 0
+        return [("Anxious", "Neutral", "Reassured")[label] for label in labels.tolist()]
     
     def _analyze_sentiment_with_rules(self, text):
         """Analyze sentiment using rule-based approach"""
-        text_lower = text.lower()
+        scores = self.keyword_scanner.count(text)
         
         # Count occurrences of sentiment keywords
-        sentiment_scores = {sentiment: 0 for sentiment in self.sentiment_keywords}
-        
-        for sentiment, keywords in self.sentiment_keywords.items():
-            for keyword in keywords:
-                if keyword in text_lower:
-                    # Count occurrences and weight them
-                    count = text_lower.count(keyword)
-                    sentiment_scores[sentiment] += count
+        sentiment_scores = {sentiment: scores[("sentiment", sentiment)] for sentiment in self.sentiment_keywords}
         
         # Apply some domain-specific rules
-        if "thank you" in text_lower or "thanks" in text_lower:
+        if scores[("rule", "thanks")]:
             sentiment_scores["Reassured"] += 2
         
-        if "worried" in text_lower or "concerned" in text_lower:
+        if scores[("rule", "worry")]:
             sentiment_scores["Anxious"] += 2
         
         if "?" in text:
@@ -201,27 +255,22 @@ class MedicalSentimentAnalyzer:
     
     def _analyze_intent(self, text):
         """Analyze patient intent using rule-based approach"""
-        text_lower = text.lower()
+        scores = self.keyword_scanner.count(text)
         
         # Count matches for each intent
-        intent_scores = {intent: 0 for intent in self.intent_patterns}
-        
-        for intent, patterns in self.intent_patterns.items():
-            for pattern in patterns:
-                matches = re.findall(pattern, text_lower, re.IGNORECASE)
-                intent_scores[intent] += len(matches)
+        intent_scores = {intent: scores[("intent", intent)] for intent in self.intent_patterns}
         
         # Apply some domain-specific rules
         if "?" in text:
             intent_scores["Seeking information"] += 1
             
-        if "pain" in text_lower or "hurt" in text_lower:
+        if scores[("rule", "pain")]:
             intent_scores["Reporting symptoms"] += 1
             
-        if "worried" in text_lower or "concerned" in text_lower:
+        if scores[("rule", "worry")]:
             intent_scores["Expressing concern"] += 1
             
-        if "will I be okay" in text_lower or "is it serious" in text_lower:
+        if scores[("rule", "reassurance")]:
             intent_scores["Seeking reassurance"] += 2
         
         # Determine the dominant intent
@@ -231,4 +280,11 @@ class MedicalSentimentAnalyzer:
         if max_intent[1] == 0:
             return "General discussion"
         
-        return max_intent[0] 
\ No newline at end of file
+        return max_intent[0] 
+
+
+def _alternatives(pattern):
+    """Keywords of a "(?:a|b|c)" intent pattern, with their regex escapes removed"""
+    group = re.fullmatch(r"\(\?:(.*)\)", pattern)
+    body = group.group(1) if group else pattern
+    return [re.sub(r"\\(.)", r"\1", keyword) for keyword in body.split("|")]
@@ -0,0 +1,350 @@
+"""Serve the notetaker pipeline over HTTP on the local machine.
+
+POST a JSON body with a "transcript" (or "text") field to /analyze, /ner,
+/sentiment or /soap; GET /health reports readiness and batching counters, and
+answers 503 until the models, loaded in the background at startup, are ready.
+Model-backed calls are queued and run as micro-batches in a worker thread, so
+the event loop keeps accepting requests while torch is busy.
+
+    notetaker-serve --port 8000 --ner rule --max-batch-size 8 --max-wait-ms 10
+    curl -s localhost:8000/analyze -d '{"transcript": "Doctor: ...\\nPatient: ..."}'
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from utils.model_cache import verify_resources, MissingResourceError
+from utils.pipeline import NotetakerPipeline, NER_METHODS
+from utils.result_cache import ResultCache
+from utils.keyword_index import KeywordIndex
+from utils.dialogue import as_transcript
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class MicroBatcher:
+    """Collect single calls into batches for one blocking ``run_batch(items)`` call.
+
+    A batch is flushed when it holds ``max_batch_size`` items or ``max_wait``
+    seconds after its first item arrived, whichever comes first. While a batch
+    runs in ``executor`` the next one fills up. ``run_batch`` returns one result
+    per item; an Exception in its place fails only that item's caller.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait=0.01, executor=None):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, got {max_batch_size}")
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.executor = executor
+        self.queue = None
+        self.task = None
+        self.counters = {"batches": 0, "items": 0, "largest": 0}
+
+    def start(self):
+        """Start the flushing task on the running event loop"""
+        self.queue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def submit(self, item):
+        """Queue one item and wait for its result"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Callers that disconnected while queued are not worth computing
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+            self.counters["batches"] += 1
+            self.counters["items"] += len(batch)
+            self.counters["largest"] = max(self.counters["largest"], len(batch))
+            try:
+                results = await loop.run_in_executor(self.executor, self.run_batch, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+def batched(fn_many, fn):
+    """Batch function calling ``fn_many(items)`` once, falling back to ``fn`` per item if it raises
+
+    The fallback keeps one bad item from failing every caller in its batch.
+    """
+    run_each = each(fn)
+
+    def run_batch(items):
+        try:
+            return fn_many(items)
+        except Exception:
+            return run_each(items)
+    return run_batch
+
+
+def each(fn):
+    """Batch function applying ``fn`` to every item, keeping each item's error to itself"""
+    def run_batch(items):
+        results = []
+        for item in items:
+            try:
+                results.append(fn(item))
+            except Exception as e:
+                results.append(e)
+        return results
+    return run_batch
+
+
+class NotetakerServer:
+    def __init__(self, pipeline, max_batch_size=8, max_wait=0.01, max_body_bytes=2**20):
+        """HTTP front end over one NotetakerPipeline
+
+        Every model-backed endpoint has its own MicroBatcher; all of them share
+        one worker thread, so torch only ever runs one batch at a time.
+        """
+        self.pipeline = pipeline
+        self.max_body_bytes = max_body_bytes
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="notetaker")
+        self.batchers = {
+            # Each model runs one forward pass per flush over every queued transcript
+            "/analyze": MicroBatcher(
+                batched(pipeline.process_many, pipeline.process), max_batch_size, max_wait, self.executor
+            ),
+            "/ner": MicroBatcher(
+                batched(pipeline.extract_entities_many, pipeline.extract_entities), max_batch_size, max_wait,
+                self.executor
+            ),
+            # Patient turns of every queued transcript share the same forward passes
+            "/sentiment": MicroBatcher(
+                pipeline.sentiment_analyzer.analyze_sentiment_many, max_batch_size, max_wait, self.executor
+            ),
+        }
+        # Rule-based and fast enough to answer on the event loop
+        self.inline = {"/soap": pipeline.soap_generator.generate_soap_note}
+        self.started = None
+        self.requests = 0
+
+    async def serve(self, host="127.0.0.1", port=8000):
+        for batcher in self.batchers.values():
+            batcher.start()
+        self.started = time.time()
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Serving on http://{host}:{port}", file=sys.stderr, flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for batcher in self.batchers.values():
+                await batcher.stop()
+            self.executor.shutdown(wait=False)
+
+    async def handle(self, reader, writer):
+        """Answer requests on one connection until the client closes it"""
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, path, keep_alive, body = request
+                    status, payload = await self.dispatch(method, path, body)
+                except HTTPError as e:
+                    status, payload, keep_alive = e.status, {"error": str(e)}, False
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, body):
+        """Return (status, JSON payload) for one request"""
+        self.requests += 1
+        if path == "/health":
+            if method != "GET":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET")
+            health = self.health()
+            # Readiness probes keep traffic away until every model has finished loading
+            status = HTTPStatus.SERVICE_UNAVAILABLE if health["status"] == "loading" else HTTPStatus.OK
+            return status, health
+        if path not in self.batchers and path not in self.inline:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown path {path}")
+        if method != "POST":
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use POST")
+
+        transcript = as_transcript(self._parse_transcript(body))
+        try:
+            if path in self.inline:
+                return HTTPStatus.OK, self.inline[path](transcript)
+            return HTTPStatus.OK, await self.batchers[path].submit(transcript)
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(e).__name__}: {e}"}
+
+    def health(self):
+        """Status is loading while any model is cold or loading, degraded if one failed (rules stand in), else ok"""
+        models = self.pipeline.readiness()
+        states = {model["state"] for model in models.values()}
+        if states & {"cold", "loading"}:
+            status = "loading"
+        elif "failed" in states:
+            status = "degraded"
+        else:
+            status = "ok"
+        return {
+            "status": status,
+            "models": models,
+            "uptime_s": round(time.time() - self.started, 1) if self.started else 0,
+            "requests": self.requests,
+            "batches": {path: dict(batcher.counters) for path, batcher in self.batchers.items()},
+        }
+
+    def _parse_transcript(self, body):
+        try:
+            record = json.loads(body)
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Body is not valid JSON: {e}")
+        transcript = record.get("transcript", record.get("text")) if isinstance(record, dict) else None
+        if not isinstance(transcript, str):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Expected a JSON object with a "transcript" string')
+        return transcript
+
+    async def _read_request(self, reader):
+        """Return (method, path, keep_alive, body), or None once the client is done"""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Incomplete request")
+            return None
+        except asyncio.LimitOverrunError:
+            raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Request head too large")
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ")
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Malformed request line {lines[0]!r}")
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > self.max_body_bytes:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Body over {self.max_body_bytes} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method, target.split("?", 1)[0], keep_alive, body
+
+    def _write_response(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode("utf-8")
+        status = HTTPStatus(status)
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1", help="interface to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--ner", choices=NER_METHODS, default="rule", help="NER method (default: rule)")
+    parser.add_argument("--max-batch-size", type=int, default=8, help="requests per model batch (default: 8)")
+    parser.add_argument("--max-wait-ms", type=float, default=10,
+                        help="longest a request waits for its batch to fill (default: 10)")
+    parser.add_argument("--max-body-mb", type=float, default=1, help="largest accepted request body")
+    parser.add_argument("--window-stride", type=int, default=None, help="sliding-window overlap for long transcripts")
+    parser.add_argument("--backend", choices=("torch", "onnx"), default="torch")
+    parser.add_argument("--quantize", choices=("int8",), default=None)
+    parser.add_argument("--cache", metavar="PATH", default=None,
+                        help="SQLite result cache for /analyze (default: memory only)")
+    parser.add_argument("--cache-max-mb", type=float, default=256, help="on-disk cache size limit")
+    parser.add_argument("--no-cache", action="store_true", help="disable the result cache")
+    parser.add_argument("--keyword-index", metavar="PATH", default=None,
+                        help="rank /analyze keywords by TF-IDF over every transcript served, saved here on exit")
+    args = parser.parse_args(argv)
+    if args.max_batch_size < 1:
+        parser.error("--max-batch-size must be at least 1")
+    if args.max_wait_ms < 0:
+        parser.error("--max-wait-ms must be 0 or more")
+
+    try:
+        verify_resources()
+    except MissingResourceError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    cache = None
+    if not args.no_cache:
+        cache = ResultCache(path=args.cache, max_disk_bytes=int(args.cache_max_mb * 2**20))
+    keyword_index = KeywordIndex(path=args.keyword_index) if args.keyword_index else None
+    pipeline = NotetakerPipeline(
+        ner_method=args.ner, window_stride=args.window_stride, backend=args.backend,
+        quantize=args.quantize, cache=cache, warm_up=True, keyword_index=keyword_index
+    )
+    server = NotetakerServer(
+        pipeline, args.max_batch_size, args.max_wait_ms / 1000, int(args.max_body_mb * 2**20)
+    )
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if keyword_index is not None:
+            keyword_index.save()
+        pipeline.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,53 @@
 import re
 import json
+from utils.dialogue import as_transcript
+from utils.pattern_matcher import trie_regex
 
 class SOAPNoteGenerator:
+    # Keywords that route a turn to a SOAP section, matched as substrings of its lowercase text
+    SECTION_KEYWORDS = {
+        "complaint": ["pain", "hurt", "ache", "discomfort"],
+        "observation": ["observe", "see", "notice", "appear", "look"],
+        "diagnosis": ["diagnos", "condition", "assessment", "problem"],
+        "severity": ["mild", "moderate", "severe", "critical", "improving", "worsening"],
+        "treatment": ["treat", "medication", "prescribe", "recommend", "advise"],
+        "follow_up": ["follow", "return", "check", "visit", "appointment"],
+    }
+    # Sections read from each speaker's turns
+    ROLE_SECTIONS = {
+        "patient": {"complaint"},
+        "doctor": {"observation", "diagnosis", "severity", "treatment", "follow_up"},
+    }
+
     def __init__(self):
+        # Per role, a trie regex reporting the longest keyword at every position, and
+        # the sections that keyword implies (its own plus those of keywords it starts with)
+        self.section_finders = {}
+        for role, sections in self.ROLE_SECTIONS.items():
+            owners = {}
+            for section in sections:
+                for keyword in self.SECTION_KEYWORDS[section]:
+                    owners.setdefault(keyword, set()).add(section)
+            implied = {
+                keyword: set().union(*(owners.get(keyword[:end], ()) for end in range(1, len(keyword) + 1)))
+                for keyword in owners
+            }
+            self.section_finders[role] = (re.compile(f"(?=({trie_regex(owners)}))"), implied)
         print("SOAP Note Generator initialized successfully")
     
     def generate_soap_note(self, transcript):
-        """Generate a SOAP note from a medical transcript"""
-        # Extract dialogue
-        dialogue = self._extract_dialogue(transcript)
-        
+        """Generate a SOAP note from a medical transcript (a string or Transcript)"""
+        # Extract dialogue and sort every turn into its sections in one pass
+        sections = self._classify_turns(self._extract_dialogue(transcript))
+        return self.build_note(sections)
+    
+    def build_note(self, sections):
+        """Assemble the SOAP note from turns already bucketed by section"""
         # Identify sections
-        subjective = self._extract_subjective(dialogue)
-        objective = self._extract_objective(dialogue)
-        assessment = self._extract_assessment(dialogue)
-        plan = self._extract_plan(dialogue)
+        subjective = self._extract_subjective(sections)
+        objective = self._extract_objective(sections)
+        assessment = self._extract_assessment(sections)
+        plan = self._extract_plan(sections, assessment)
         
         # Format as SOAP note
         soap_note = {
@@ -27,42 +60,59 @@ class SOAPNoteGenerator:
         return soap_note
     
     def _extract_dialogue(self, transcript):
-        """Extract dialogue from transcript"""
-        lines = transcript.strip().split('\n')
-        dialogue = []
-        
-        for line in lines:
-            if ":" in line:
-                parts = line.split(":", 1)
-                if len(parts) == 2:
-                    speaker = parts[0].strip()
-                    text = parts[1].strip()
-                    dialogue.append({"speaker": speaker, "text": text})
-        
-        return dialogue
+        """Extract dialogue from transcript: its turns, with Doctor/Physician both as the doctor role"""
+        return as_transcript(transcript).turns
+    
+    def _classify_turns(self, dialogue):
+        """Bucket the turns by section: patient statements, keyword hits and the doctor's last hits"""
+        sections = self.empty_sections()
+        for entry in dialogue:
+            self.classify_turn(sections, entry)
+        return sections
+    
+    def empty_sections(self):
+        return {"patient": [], "complaint": [], "observation": [], "diagnosis": None,
+                "severity": None, "treatment": None, "follow_up": None}
     
-    def _extract_subjective(self, dialogue):
+    def classify_turn(self, sections, entry):
+        """Add one turn to its section buckets and return the sections it hit"""
+        if entry.role not in self.section_finders:
+            return set()
+        if entry.role == "patient":
+            sections["patient"].append(entry.text)
+        
+        finder, implied = self.section_finders[entry.role]
+        found = set()
+        for keyword in set(finder.findall(entry.lower)):
+            found |= implied[keyword]
+        for section in found:
+            if section in ("complaint", "observation"):
+                sections[section].append(entry)
+            else:
+                # Later doctor statements override earlier ones
+                sections[section] = entry
+        return found
+    
+    def _extract_subjective(self, sections):
         """Extract subjective information (patient's perspective)"""
-        patient_statements = []
+        patient_statements = sections["patient"]
         chief_complaint = ""
         
-        for entry in dialogue:
-            if entry["speaker"].lower() == "patient":
-                patient_statements.append(entry["text"])
-                
-                # Look for pain or symptoms in the first patient statement
-                if not chief_complaint and any(keyword in entry["text"].lower() for keyword in ["pain", "hurt", "ache", "discomfort"]):
-                    # Extract the chief complaint
-                    pain_match = re.search(r"(my|the)\s+([a-z\s]+)\s+(pain|hurt|ache)", entry["text"].lower())
-                    if pain_match:
-                        chief_complaint = pain_match.group(2).strip() + " pain"
-                    else:
-                        # Try to find any body part mentioned with pain
-                        body_parts = ["head", "neck", "back", "chest", "stomach", "arm", "leg", "knee", "ankle", "shoulder"]
-                        for part in body_parts:
-                            if part in entry["text"].lower():
-                                chief_complaint = part + " pain"
-                                break
+        # Look for pain or symptoms in the first patient statement that names one
+        for entry in sections["complaint"]:
+            # Extract the chief complaint
+            pain_match = re.search(r"(my|the)\s+([a-z\s]+)\s+(pain|hurt|ache)", entry.lower)
+            if pain_match:
+                chief_complaint = pain_match.group(2).strip() + " pain"
+            else:
+                # Try to find any body part mentioned with pain
+                body_parts = ["head", "neck", "back", "chest", "stomach", "arm", "leg", "knee", "ankle", "shoulder"]
+                for part in body_parts:
+                    if part in entry.lower:
+                        chief_complaint = part + " pain"
+                        break
+            if chief_complaint:
+                break
         
         # If no specific chief complaint found, use a general one from patient statements
         if not chief_complaint and patient_statements:
@@ -79,18 +129,9 @@ class SOAPNoteGenerator:
             "History_of_Present_Illness": history
         }
     
-    def _extract_objective(self, dialogue):
+    def _extract_objective(self, sections):
         """Extract objective information (doctor's observations)"""
-        doctor_statements = []
-        observations = []
-        
-        for entry in dialogue:
-            if entry["speaker"].lower() == "doctor":
-                doctor_statements.append(entry["text"])
-                
-                # Look for observations in doctor's statements
-                if any(keyword in entry["text"].lower() for keyword in ["observe", "see", "notice", "appear", "look"]):
-                    observations.append(entry["text"])
+        observations = [entry.text for entry in sections["observation"]]
         
         # Generate physical exam and observations
         physical_exam = self._generate_physical_exam(observations)
@@ -101,33 +142,18 @@ class SOAPNoteGenerator:
             "Observations": observation_text
         }
     
-    def _extract_assessment(self, dialogue):
+    def _extract_assessment(self, sections):
         """Extract assessment information (diagnosis)"""
-        doctor_statements = []
-        diagnosis = ""
+        diagnosis = sections["diagnosis"].text if sections["diagnosis"] else ""
         severity = ""
         
-        for entry in dialogue:
-            if entry["speaker"].lower() == "doctor":
-                doctor_statements.append(entry["text"])
-                
-                # Look for diagnosis in doctor's statements
-                if any(keyword in entry["text"].lower() for keyword in ["diagnos", "condition", "assessment", "problem"]):
-                    diagnosis = entry["text"]
-                
-                # Look for severity indicators
-                if any(keyword in entry["text"].lower() for keyword in ["mild", "moderate", "severe", "critical", "improving", "worsening"]):
-                    severity = self._extract_sentence_with_keyword(entry["text"], 
-                                                                 ["mild", "moderate", "severe", "critical", "improving", "worsening"])
+        # Look for severity indicators
+        if sections["severity"]:
+            severity = self._extract_sentence_with_keyword(sections["severity"].text, self.SECTION_KEYWORDS["severity"])
         
         # If no diagnosis found, infer from patient complaints
         if not diagnosis:
-            patient_complaints = []
-            for entry in dialogue:
-                if entry["speaker"].lower() == "patient":
-                    patient_complaints.append(entry["text"])
-            
-            diagnosis = self._infer_diagnosis(patient_complaints)
+            diagnosis = self._infer_diagnosis(sections["patient"])
         
         # If no severity found, use a default
         if not severity:
@@ -138,27 +164,14 @@ class SOAPNoteGenerator:
             "Severity": severity
         }
     
-    def _extract_plan(self, dialogue):
+    def _extract_plan(self, sections, assessment):
         """Extract plan information (treatment and follow-up)"""
-        doctor_statements = []
-        treatment = ""
-        followup = ""
-        
-        for entry in dialogue:
-            if entry["speaker"].lower() == "doctor":
-                doctor_statements.append(entry["text"])
-                
-                # Look for treatment in doctor's statements
-                if any(keyword in entry["text"].lower() for keyword in ["treat", "medication", "prescribe", "recommend", "advise"]):
-                    treatment = entry["text"]
-                
-                # Look for follow-up in doctor's statements
-                if any(keyword in entry["text"].lower() for keyword in ["follow", "return", "check", "visit", "appointment"]):
-                    followup = entry["text"]
+        treatment = sections["treatment"].text if sections["treatment"] else ""
+        followup = sections["follow_up"].text if sections["follow_up"] else ""
         
         # If no treatment found, generate based on diagnosis
         if not treatment:
-            treatment = self._generate_treatment_plan(self._extract_assessment(dialogue)["Diagnosis"])
+            treatment = self._generate_treatment_plan(assessment["Diagnosis"])
         
         # If no follow-up found, create a generic one
         if not followup:
@@ -1,29 +1,28 @@
 import re
 import nltk
-import ssl
 import os
+from collections import Counter
+from itertools import filterfalse
 from nltk.tokenize import sent_tokenize
+from utils.dialogue import as_transcript
+
+# Sentence boundaries, and words counted for importance (the same as r'\b\w+\b')
+SENTENCE_END = re.compile(r'[.!?]+')
+WORD = re.compile(r'\w+')
 
 class MedicalSummarizer:
+    # Summaries produced for each transcript
+    VIEWS = ("full", "doctor", "patient")
+
     def __init__(self):
         """Initialize the summarization model using a simple approach"""
-        # Fix SSL certificate issue for NLTK downloads
-        try:
-            _create_unverified_https_context = ssl._create_unverified_context
-        except AttributeError:
-            pass
-        else:
-            ssl._create_default_https_context = _create_unverified_https_context
-        
-        # Try to download NLTK resources
+        # Stopwords are provisioned by `python -m utils.model_cache`; never download here
         try:
-            nltk.download('punkt')
-            nltk.download('stopwords')
             from nltk.corpus import stopwords
             self.stopwords = set(stopwords.words('english'))
         except Exception as e:
-            print(f"Error downloading NLTK resources: {str(e)}")
-            # Fallback stopwords if download fails
+            print(f"NLTK stopwords not available locally: {str(e)}")
+            # Fallback stopwords if the corpus is missing
             self.stopwords = set([
                 'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', 
                 'your', 'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 
@@ -57,20 +56,11 @@ class MedicalSummarizer:
     
     def split_by_speaker(self, transcript):
         """Split transcript by speaker (doctor/patient)"""
-        doctor_text = []
-        patient_text = []
-        
-        lines = transcript.split('\n')
-        for line in lines:
-            if line.startswith("Doctor:"):
-                doctor_text.append(line.replace("Doctor:", "").strip())
-            elif line.startswith("Patient:"):
-                patient_text.append(line.replace("Patient:", "").strip())
-        
+        transcript = as_transcript(transcript)
         return {
-            "doctor": " ".join(doctor_text),
-            "patient": " ".join(patient_text),
-            "full": transcript
+            "doctor": transcript.role_text("doctor"),
+            "patient": transcript.role_text("patient"),
+            "full": transcript.text
         }
     
     def sentence_importance(self, sentence, important_words):
@@ -82,67 +72,67 @@ class MedicalSummarizer:
     
     def extractive_summarize(self, text, ratio=0.3):
         """Generate an extractive summary using a simple approach"""
-        # Simple sentence splitting by punctuation
-        sentences = [s.strip() for s in re.split(r'[.!?]+', text) if s.strip()]
-        
-        if len(sentences) <= 3:
-            return text
-        
-        # Get all words that are not stopwords
-        words = [word.lower() for word in re.findall(r'\b\w+\b', text.lower())
-                if word.lower() not in self.stopwords]
-        
-        # Calculate word frequency
-        word_freq = {}
-        for word in words:
-            word_freq[word] = word_freq.get(word, 0) + 1
-        
-        # Get most important words (top 20%)
-        sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
-        top_n = max(int(len(sorted_words) * 0.2), 5)
-        important_words = {word for word, _ in sorted_words[:top_n]}
-        
-        # Score sentences
-        sentence_scores = [(sentence, self.sentence_importance(sentence, important_words)) 
-                          for sentence in sentences]
-        
-        # Sort sentences by score
-        sorted_sentences = sorted(sentence_scores, key=lambda x: x[1], reverse=True)
-        
-        # Select top sentences (based on ratio)
-        selected_sentences = sorted_sentences[:max(int(len(sentences) * ratio), 3)]
-        
-        # Sort selected sentences by original order
-        selected_sentences = [(i, sentence, score) 
-                             for i, (sentence, score) in enumerate(sentence_scores) 
-                             if (sentence, score) in selected_sentences]
-        selected_sentences.sort(key=lambda x: x[0])
+        return self._summarize_texts([text], ratio)[0]
+    
+    def summarize(self, transcript, ratio=0.3):
+        """Generate a summary of the medical transcript (a string or Transcript)"""
+        return self.summarize_many([transcript], ratio)[0]
+    
+    def summarize_many(self, transcripts, ratio=0.3):
+        """Summaries of many transcripts (strings or Transcripts), one dict of views each"""
+        texts = []
+        for transcript in transcripts:
+            # Split text by speaker, then clean every view
+            views = self.split_by_speaker(transcript)
+            texts.extend(self.clean_text(views[view]) for view in self.VIEWS)
+        
+        summaries = self._summarize_texts(texts, ratio)
+        return [
+            dict(zip(self.VIEWS, summaries[i:i + len(self.VIEWS)]))
+            for i in range(0, len(summaries), len(self.VIEWS))
+        ]
+    
+    def _summarize_texts(self, texts, ratio):
+        """Extractive summary of each text: one set lookup per word, then a linear-time selection"""
+        summaries = []
+        for text in texts:
+            # Simple sentence splitting by punctuation; three sentences or fewer are kept as they are
+            sentences = [s.strip() for s in SENTENCE_END.split(text) if s.strip()]
+            if len(sentences) <= 3:
+                summaries.append(text)
+                continue
+            
+            important_words = set(self._important_words(text))
+            scores = []
+            for sentence in sentences:
+                words = self._sentence_terms(sentence)
+                scores.append(sum(map(important_words.__contains__, words)) / max(len(words), 1))
+            summaries.append(self._select_sentences(sentences, scores, ratio))
+        return summaries
+    
+    def _sentence_terms(self, sentence):
+        """Words sentence_importance counts: alphanumeric, lowercased, not stopwords"""
+        stopwords = self.stopwords
+        if sentence.isascii():
+            # Lowercasing the whole sentence first gives the same words (not so for e.g. "İ")
+            return [word for word in sentence.lower().split() if word.isalnum() and word not in stopwords]
+        return [word.lower() for word in sentence.split()
+                if word.isalnum() and word.lower() not in stopwords]
+    
+    def _important_words(self, text):
+        """Most frequent non-stopwords of a text (top 20%, at least 5; ties in order of appearance)"""
+        word_freq = Counter(filterfalse(self.stopwords.__contains__, WORD.findall(text.lower())))
+        top_n = max(int(len(word_freq) * 0.2), 5)
+        return [word for word, _ in word_freq.most_common(top_n)]
+    
+    def _select_sentences(self, sentences, scores, ratio):
+        """Join the top-scoring sentences in their original order"""
+        # Stable sort by score, like sorted(..., reverse=True)
+        ranked = sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)
+        selected = {(sentences[i], scores[i]) for i in ranked[:max(int(len(sentences) * ratio), 3)]}
         
         # Join sentences
-        summary = '. '.join(sentence for _, sentence, _ in selected_sentences)
+        summary = '. '.join(sentence for sentence, score in zip(sentences, scores) if (sentence, score) in selected)
         if not summary.endswith('.'):
             summary += '.'
         return summary
-    
-    def summarize(self, transcript, ratio=0.3):
-        """Generate a summary of the medical transcript"""
-        # Split text by speaker
-        texts = self.split_by_speaker(transcript)
-        
-        # Clean texts
-        for key in texts:
-            texts[key] = self.clean_text(texts[key])
-        
-        # Generate summaries
-        summaries = {}
-        
-        # Summarize full transcript
-        summaries["full"] = self.extractive_summarize(texts["full"], ratio)
-        
-        # Summarize doctor's part
-        summaries["doctor"] = self.extractive_summarize(texts["doctor"], ratio)
-            
-        # Summarize patient's part
-        summaries["patient"] = self.extractive_summarize(texts["patient"], ratio)
-        
-        return summaries 
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""Fine-tune the BioBERT NER model data parallel over local CPU processes.
+
+Starts ``utils.train_biobert_finetuned`` under torchrun with N processes. Each
+process trains a DistributedDataParallel replica over gloo on its own shard of
+every epoch; only the first one saves checkpoints and the final model.
+
+    notetaker-train --nproc 4
+    notetaker-train --nproc 4 --scaling   # also 1, 2 processes, then reports scaling efficiency
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+def run(nproc, epochs=2, batch_size=4, num_workers=None, threads=None, skip_test=False):
+    """Train on ``nproc`` processes and return the first process's stats (see --stats)"""
+    # Split the cores between processes; torchrun would otherwise give each one thread
+    threads = threads or max(1, (os.cpu_count() or 1) // nproc)
+    env = dict(os.environ, OMP_NUM_THREADS=str(threads))
+    with tempfile.TemporaryDirectory() as directory:
+        stats_path = os.path.join(directory, "stats.json")
+        command = [
+            sys.executable, "-m", "torch.distributed.run", "--standalone", f"--nproc_per_node={nproc}",
+            "-m", "utils.train_biobert_finetuned",
+            "--epochs", str(epochs), "--batch-size", str(batch_size), "--stats", stats_path,
+        ]
+        if num_workers is not None:
+            command += ["--num-workers", str(num_workers)]
+        if skip_test:
+            command.append("--skip-test")
+        print(f"Training on {nproc} process(es), {threads} thread(s) each", file=sys.stderr)
+        subprocess.run(command, env=env, check=True)
+        with open(stats_path, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def tokens_per_second(stats):
+    """Mean training throughput over the epochs of one run, summed over its processes"""
+    epochs = stats["epochs"]
+    return sum(epoch["tokens_per_second"] for epoch in epochs) / len(epochs) if epochs else 0.0
+
+
+def scaling_report(results):
+    """Rows of (processes, tokens/sec, speedup, efficiency) relative to the single-process run"""
+    baseline = tokens_per_second(results[1])
+    rows = []
+    for nproc, stats in sorted(results.items()):
+        throughput = tokens_per_second(stats)
+        speedup = throughput / baseline if baseline else 0.0
+        rows.append((nproc, throughput, speedup, speedup / nproc))
+    return rows
+
+
+def _process_counts(nproc):
+    """1, 2, 4, ... up to and always including ``nproc``"""
+    counts, count = [], 1
+    while count < nproc:
+        counts.append(count)
+        count *= 2
+    return counts + [nproc]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nproc", type=int, default=2, help="training processes (default: 2)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="torch threads per process (default: cores / processes)")
+    parser.add_argument("--epochs", type=int, default=2, help="training epochs (default: 2)")
+    parser.add_argument("--batch-size", type=int, default=4, help="examples per batch and process (default: 4)")
+    parser.add_argument("--num-workers", type=int, default=None, help="loader processes per training process")
+    parser.add_argument("--scaling", action="store_true",
+                        help="first train on 1, 2, 4, ... processes and report scaling efficiency")
+    parser.add_argument("-o", "--output", default=None, help="write the scaling report as JSON here")
+    args = parser.parse_args(argv)
+    if args.nproc < 1:
+        parser.error("--nproc must be at least 1")
+
+    counts = _process_counts(args.nproc) if args.scaling else [args.nproc]
+    results = {}
+    try:
+        for nproc in counts:
+            # The last run, on --nproc processes, leaves the model to keep
+            results[nproc] = run(
+                nproc, args.epochs, args.batch_size, args.num_workers, args.threads,
+                skip_test=nproc != counts[-1],
+            )
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"Training failed: {e}", file=sys.stderr)
+        return 1
+
+    if 1 in results:
+        print(f"{'processes':>9} {'tokens/sec':>11} {'speedup':>8} {'efficiency':>10}")
+        report = scaling_report(results)
+        for nproc, throughput, speedup, efficiency in report:
+            print(f"{nproc:>9} {throughput:>11.1f} {speedup:>7.2f}x {efficiency:>9.0%}")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump([
+                    {"processes": nproc, "tokens_per_second": throughput, "speedup": speedup,
+                     "efficiency": efficiency, "train_seconds": results[nproc]["train_seconds"]}
+                    for nproc, throughput, speedup, efficiency in report
+                ], f, indent=2)
+    else:
+        stats = results[args.nproc]
+        print(f"{args.nproc} processes: {tokens_per_second(stats):.1f} tokens/sec, "
+              f"{stats['train_seconds']:.0f}s training")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""Tokenized, labelled NER training data persisted as memory-mapped NumPy arrays.
+
+``TokenizedCorpus.build(ner, chunks, outputs)`` runs ``prepare_training_data``
+only for transcripts it has not labelled before and stores every example's
+token ids and label ids under a directory keyed by the tokenizer and by the
+source of the labelling rules. Training runs and evaluation jobs then open it
+with ``TokenizedCorpus.open(directory)``, which maps the arrays instead of
+reading them.
+"""
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import numpy as np
+from utils import entity_alignment
+
+# Bump when the stored layout changes
+_FORMAT_VERSION = 1
+
+DEFAULT_CORPUS_ROOT = os.environ.get(
+    "NOTETAKER_TRAINING_CORPUS",
+    os.path.join(os.path.expanduser("~"), ".cache", "physician-notetaker", "training_corpus")
+)
+
+_ARRAYS = ("input_ids", "label_ids", "offsets")
+
+
+class TokenizedCorpus:
+    """Training examples backed by three memory-mapped arrays.
+
+    ``input_ids`` and ``label_ids`` hold every example back to back and
+    example ``i`` spans ``offsets[i]:offsets[i + 1]``. Items have the shape
+    the training collator expects ({"input_ids", "attention_mask", "labels"}),
+    so a corpus can be passed to ``train_token_classifier`` as it is.
+    ``transcripts`` lists (transcript hash, first example, end) in build order.
+    """
+
+    def __init__(self, directory, arrays, manifest):
+        self.directory = directory
+        self.input_ids = arrays["input_ids"]
+        self.label_ids = arrays["label_ids"]
+        self.offsets = arrays["offsets"]
+        self.manifest = manifest
+        self.transcripts = manifest["transcripts"]
+        lengths = np.diff(self.offsets)
+        self.max_length = int(lengths.max()) if len(lengths) else 0
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return {
+            "input_ids": self.input_ids[start:end].tolist(),
+            "attention_mask": [1] * int(end - start),
+            "labels": self.label_ids[start:end].tolist(),
+        }
+
+    def example_labels(self, idx):
+        """Label ids of one example, as a read-only view of the mapped array"""
+        return self.label_ids[self.offsets[idx]:self.offsets[idx + 1]]
+
+    @classmethod
+    def open(cls, directory):
+        """Map the current generation of a corpus directory without reading it"""
+        with open(os.path.join(directory, "CURRENT"), encoding="utf-8") as f:
+            generation = os.path.join(directory, f.read().strip())
+        with open(os.path.join(generation, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != _FORMAT_VERSION:
+            raise ValueError(f"{directory} has corpus format {manifest.get('format')}, expected {_FORMAT_VERSION}")
+        arrays = {name: np.load(os.path.join(generation, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+        return cls(directory, arrays, manifest)
+
+    @classmethod
+    def build(cls, ner, chunks, outputs, root=DEFAULT_CORPUS_ROOT):
+        """Label ``chunks`` with ``ner``, reusing every transcript already in the corpus.
+
+        ``ner`` is a FineTunedBioBERTNER (anything with ``tokenizer``,
+        ``entity_labels`` and ``prepare_training_data``). The corpus lives in
+        ``root/<key>`` where the key covers the tokenizer, the label ids and the
+        labelling code, so changing any of them starts a fresh corpus. The
+        result holds exactly the given transcripts, in order.
+        """
+        key = corpus_key(ner)
+        directory = os.path.join(root, key)
+        previous = None
+        if os.path.exists(os.path.join(directory, "CURRENT")):
+            try:
+                previous = cls.open(directory)
+            except (OSError, ValueError) as e:
+                print(f"Rebuilding training corpus {directory}: {e}")
+        known = {digest: (start, end) for digest, start, end in previous.transcripts} if previous else {}
+
+        input_parts, label_parts, lengths, transcripts = [], [], [], []
+        relabelled = 0
+        for chunk, output in zip(chunks, outputs):
+            digest = transcript_digest(chunk, output)
+            if digest in known:
+                start, end = known[digest]
+                offsets = previous.offsets[start:end + 1]
+                input_parts.append(previous.input_ids[offsets[0]:offsets[-1]])
+                label_parts.append(previous.label_ids[offsets[0]:offsets[-1]])
+                example_lengths = np.diff(offsets)
+            else:
+                relabelled += 1
+                examples = ner.prepare_training_data([chunk], [output])
+                input_parts.extend(
+                    np.asarray(ner.tokenizer.convert_tokens_to_ids(item["tokens"]), dtype=np.int32)
+                    for item in examples
+                )
+                label_parts.extend(
+                    np.asarray([ner.entity_labels.get(label, 0) for label in item["labels"]], dtype=np.int16)
+                    for item in examples
+                )
+                example_lengths = np.array([len(item["tokens"]) for item in examples], dtype=np.int64)
+            first = len(lengths)
+            lengths.extend(example_lengths.tolist())
+            transcripts.append([digest, first, len(lengths)])
+
+        if previous is not None and relabelled == 0 and transcripts == previous.transcripts:
+            print(f"Training corpus up to date: {len(previous)} examples in {directory}")
+            return previous
+
+        arrays = {
+            "input_ids": np.concatenate(input_parts).astype(np.int32) if input_parts else np.zeros(0, np.int32),
+            "label_ids": np.concatenate(label_parts).astype(np.int16) if label_parts else np.zeros(0, np.int16),
+            "offsets": np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64),
+        }
+        manifest = {"format": _FORMAT_VERSION, "key": key, "transcripts": transcripts}
+        _write_generation(directory, arrays, manifest)
+        print(
+            f"Training corpus: {relabelled} of {len(transcripts)} transcripts labelled, "
+            f"{len(lengths)} examples in {directory}"
+        )
+        return cls.open(directory)
+
+
+def corpus_key(ner):
+    """Hash of the tokenizer, the label ids and the source of the labelling code"""
+    digest = hashlib.sha256()
+    tokenizer = ner.tokenizer
+    digest.update(f"{type(tokenizer).__name__}:{tokenizer.name_or_path}".encode("utf-8"))
+    digest.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode("utf-8"))
+    digest.update(json.dumps(ner.entity_labels, sort_keys=True).encode("utf-8"))
+    digest.update(inspect.getsource(type(ner).prepare_training_data).encode("utf-8"))
+    digest.update(inspect.getsource(entity_alignment).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def transcript_digest(chunk, output):
+    """Identity of one labelled transcript: its text and its expected output"""
+    payload = json.dumps([chunk, output], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _write_generation(directory, arrays, manifest):
+    """Write a new generation and switch CURRENT to it in one rename.
+
+    Readers that already mapped the old generation keep their open files.
+    """
+    os.makedirs(directory, exist_ok=True)
+    generations = sorted((name for name in os.listdir(directory) if name.isdigit()), key=int)
+    generation = str(int(generations[-1]) + 1 if generations else 1)
+    path = os.path.join(directory, generation)
+    os.makedirs(path)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array)
+    with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    temporary = os.path.join(directory, f"CURRENT.{os.getpid()}.tmp")
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(generation)
+    os.replace(temporary, os.path.join(directory, "CURRENT"))
+
+    for old in generations:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)